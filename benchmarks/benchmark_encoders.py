@@ -0,0 +1,61 @@
+"""
+Benchmark of the thumbnail encoders, reporting the encode time and size of a thumbnail for
+each format and setting
+
+    python benchmarks/benchmark_encoders.py --repeats 50
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+# Import the file manager from the checkout when it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_manager.dataset.thumbnail_encoder import ThumbnailEncoder  # noqa: E402
+
+ENCODERS = {
+    "png level 1": ThumbnailEncoder("png", compress_level=1),
+    "png level 6": ThumbnailEncoder("png", compress_level=6),
+    "png level 9": ThumbnailEncoder("png", compress_level=9),
+    "jpeg q75": ThumbnailEncoder("jpeg", quality=75),
+    "jpeg q90": ThumbnailEncoder("jpeg", quality=90),
+    "webp q85": ThumbnailEncoder("webp", quality=85),
+    "webp lossless": ThumbnailEncoder("webp", lossless=True),
+}
+
+
+def make_thumbnail(size):
+    rng = np.random.default_rng(0)
+    # Smooth image with noise, close to a normalized detector image
+    y, x = np.mgrid[0 : size[1], 0 : size[0]]
+    image = np.sin(x / 9.0) * np.cos(y / 5.0) + 0.2 * rng.random((size[1], size[0]))
+    image = (image - image.min()) / (image.max() - image.min())
+    return Image.fromarray((image * 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    image = make_thumbnail(ThumbnailEncoder().size)
+    print(f"{image.size[0]}x{image.size[1]} thumbnail")
+    for name, encoder in ENCODERS.items():
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            encoded = encoder.encode(image)
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{name:>14} {min(timings) * 1000:7.2f} ms  {len(encoded) / 1024:7.1f} KiB"
+            f"  data URL {len(encoder.to_data_url(image)) / 1024:7.1f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
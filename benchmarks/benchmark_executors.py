@@ -0,0 +1,92 @@
+"""
+Benchmark of FileDataset reads with the thread, process and inline executors, scaling the
+number of workers from 1 to the number of cores
+
+    python benchmarks/benchmark_executors.py --num-images 64 --image-size 1024
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+# Import the file manager from the checkout when it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_manager.dataset.executors import (  # noqa: E402
+    InlineExecutor,
+    ProcessExecutor,
+    ThreadExecutor,
+)
+from file_manager.dataset.file_dataset import FileDataset  # noqa: E402
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE  # noqa: E402
+
+
+def make_images(directory, num_images, image_size):
+    rng = np.random.default_rng(0)
+    os.makedirs(os.path.join(directory, "images"))
+    for index in range(num_images):
+        image = (rng.random((image_size, image_size)) * 60000).astype(np.uint16)
+        Image.fromarray(image).save(os.path.join(directory, "images", f"{index}.tif"))
+
+
+def time_read(dataset, root_uri, executor, export, repeats):
+    timings = []
+    for _ in range(repeats):
+        THUMBNAIL_CACHE.clear()
+        start = time.perf_counter()
+        dataset.read_data(
+            root_uri,
+            list(range(len(dataset.filenames))),
+            export=export,
+            executor=executor,
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-images", type=int, default=64)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--export", default="base64")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root_uri:
+        make_images(root_uri, args.num_images, args.image_size)
+        filenames = sorted(os.listdir(os.path.join(root_uri, "images")))
+        dataset = FileDataset("images", len(filenames), filenames)
+
+        baseline = time_read(
+            dataset, root_uri, InlineExecutor(), args.export, args.repeats
+        )
+        print(f"inline: {baseline:.3f}s")
+
+        num_workers = 1
+        while True:
+            for name, executor in (
+                ("thread", ThreadExecutor(num_workers, request_limit=num_workers)),
+                ("process", ProcessExecutor(num_workers)),
+            ):
+                if name == "process":
+                    executor.warm_up()
+                elapsed = time_read(
+                    dataset, root_uri, executor, args.export, args.repeats
+                )
+                executor.shutdown()
+                print(
+                    f"{name:>8} x{num_workers:<3} {elapsed:.3f}s "
+                    f"speedup {baseline / elapsed:.2f}"
+                )
+            if num_workers == os.cpu_count():
+                break
+            num_workers = min(2 * num_workers, os.cpu_count())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark of FileDataset.filepaths_from_directory against the previous multi-glob
+implementation on a synthetic directory tree
+
+    python benchmarks/benchmark_filepaths.py --num-dirs 50 --num-files 2000
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from functools import reduce
+
+# Import the file manager from the checkout when it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_manager.dataset.directory_index import DirectoryIndex  # noqa: E402
+from file_manager.dataset.file_dataset import FileDataset  # noqa: E402
+
+GLOB_FORMATS = [
+    "**/*.[pP][nN][gG]",
+    "**/*.[jJ][pP][gG]",
+    "**/*.[jJ][pP][eE][gG]",
+    "**/*.[tT][iI][fF]",
+    "**/*.[tT][iI][fF][fF]",
+]
+GLOB_NOT_ALLOWED_FORMATS = [
+    "**/__pycache__/**",
+    "**/.*",
+    "cache/",
+    "cache/**/",
+    "cache/**",
+    "tiled_local_copy/",
+    "**/tiled_local_copy/**",
+    "**/tiled_local_copy/**/",
+    "mlexchange_store/**/",
+    "mlexchange_store/**",
+    "labelmaker_outputs/**/",
+    "labelmaker_outputs/**",
+]
+
+
+def glob_filepaths(directory, formats, selected_sub_uris):
+    """
+    Previous implementation, one glob per format and per not allowed pattern
+    """
+    filenames_per_uri = []
+    for dataset in selected_sub_uris:
+        dataset_path = os.path.join(directory, dataset)
+        all_paths = reduce(
+            lambda list1, list2: list1 + list2,
+            (
+                [
+                    os.path.relpath(path, start=dataset_path)
+                    for path in glob.glob(str(dataset_path) + "/" + t)
+                ]
+                for t in formats
+            ),
+        )
+        not_allowed_paths = reduce(
+            lambda list1, list2: list1 + list2,
+            (
+                [
+                    os.path.relpath(path, start=dataset_path)
+                    for path in glob.glob(str(dataset_path) + "/" + t)
+                ]
+                for t in GLOB_NOT_ALLOWED_FORMATS
+            ),
+        )
+        filenames_per_uri.append(sorted(set(all_paths) - set(not_allowed_paths)))
+    return filenames_per_uri
+
+
+def make_tree(root, num_dirs, num_files):
+    extensions = [".tif", ".TIFF", ".png", ".jpg", ".txt"]
+    for dir_index in range(num_dirs):
+        for sub_dir in ["frames", "cache", ".hidden"]:
+            path = os.path.join(root, f"scan_{dir_index}", sub_dir)
+            os.makedirs(path)
+            count = num_files if sub_dir == "frames" else num_files // 10
+            for file_index in range(count):
+                extension = extensions[file_index % len(extensions)]
+                open(os.path.join(path, f"{file_index}{extension}"), "w").close()
+    # Settle the modification times so the directory index does not treat them as racy
+    settled = time.time() - 60
+    for path, _, _ in os.walk(root):
+        os.utime(path, (settled, settled))
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-dirs", type=int, default=50)
+    parser.add_argument("--num-files", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, args.num_dirs, args.num_files)
+        sub_uris = sorted(os.listdir(root))
+        directory_index = DirectoryIndex(root, os.path.join(root, ".index.db"))
+
+        cases = {
+            "glob (previous)": lambda: glob_filepaths(root, GLOB_FORMATS, sub_uris),
+            "scandir walk, sequential": lambda: FileDataset.filepaths_from_directory(
+                root, selected_sub_uris=sub_uris, max_workers=1
+            )[2],
+            "scandir walk, parallel": lambda: FileDataset.filepaths_from_directory(
+                root, selected_sub_uris=sub_uris
+            )[2],
+            "directory index": lambda: FileDataset.filepaths_from_directory(
+                root, selected_sub_uris=sub_uris, directory_index=directory_index
+            )[2],
+        }
+        print(f"{args.num_dirs} directories x {args.num_files} files")
+        reference = None
+        for name, function in cases.items():
+            elapsed, result = timed(function, args.repeat)
+            num_paths = sum(len(paths) for paths in result)
+            if reference is None:
+                reference = result
+            print(
+                f"{name:<28} {elapsed * 1000:10.1f} ms  {num_paths} paths  "
+                f"matches previous: {result == reference}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of the per-image cost of FileDataset thumbnails, comparing the full-resolution
+decode and normalization with the reduced-resolution decode, for JPEG, PNG and TIFF files
+
+    python benchmarks/benchmark_thumbnails.py --width 5472 --height 3648
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tifffile
+from PIL import Image
+
+# Import the file manager from the checkout when it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_manager.dataset.file_dataset import FileDataset  # noqa: E402
+
+
+def make_images(directory, width, height):
+    rng = np.random.default_rng(0)
+    # Smooth image, so that the compressed formats have a realistic size
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.sin(x / 97.0) * np.cos(y / 53.0) + 0.1 * rng.random((height, width))
+    image = (image - image.min()) / (image.max() - image.min())
+    image_8 = (image * 255).astype(np.uint8)
+    image_16 = (image * 60000).astype(np.uint16)
+    paths = {
+        "jpeg": os.path.join(directory, "image.jpg"),
+        "png": os.path.join(directory, "image.png"),
+        "tiff": os.path.join(directory, "image.tif"),
+        "tiff-zlib": os.path.join(directory, "image_zlib.tif"),
+        "tiff-pyramid": os.path.join(directory, "image_pyramid.tif"),
+    }
+    Image.fromarray(image_8).save(paths["jpeg"], quality=90)
+    Image.fromarray(image_8).save(paths["png"])
+    tifffile.imwrite(paths["tiff"], image_16)
+    tifffile.imwrite(paths["tiff-zlib"], image_16, compression="zlib")
+    with tifffile.TiffWriter(paths["tiff-pyramid"]) as tif:
+        tif.write(image_16, subifds=3, tile=(256, 256), compression="zlib")
+        for level in range(1, 4):
+            tif.write(
+                image_16[:: 2**level, :: 2**level],
+                subfiletype=1,
+                tile=(256, 256),
+                compression="zlib",
+            )
+    return paths
+
+
+def full_decode(file_path):
+    image = np.array(FileDataset._open_image(file_path), dtype=np.float32)
+    image = FileDataset._normalize_batch(image[np.newaxis], False, [0, 100])[0]
+    return FileDataset._export_image(image, True, "base64")
+
+
+def reduced_decode(file_path):
+    return FileDataset._read_data_point(os.path.dirname(file_path), file_path)
+
+
+def time_call(fn, file_path, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(file_path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=5472)
+    parser.add_argument("--height", type=int, default=3648)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_images(directory, args.width, args.height)
+        print(f"{args.width}x{args.height} ({args.width * args.height / 1e6:.1f} MP)")
+        for name, file_path in paths.items():
+            full = time_call(full_decode, file_path, args.repeats)
+            reduced = time_call(reduced_decode, file_path, args.repeats)
+            print(
+                f"{name:>13} full {full * 1000:8.1f} ms  reduced {reduced * 1000:8.1f} ms"
+                f"  speedup {full / reduced:5.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
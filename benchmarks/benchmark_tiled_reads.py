@@ -0,0 +1,107 @@
+"""
+Benchmark of TiledDataset reads against an in-process Tiled server, comparing the previous
+fancy-index fetch with the coalesced contiguous-slice fetch. Each HTTP request is delayed
+by a simulated network latency
+
+    python benchmarks/benchmark_tiled_reads.py --num-frames 512 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault("TILED_SINGLE_USER_API_KEY", "secret")
+
+from tiled.adapters.array import ArrayAdapter  # noqa: E402
+from tiled.adapters.mapping import MapAdapter  # noqa: E402
+from tiled.client import Context, from_context  # noqa: E402
+from tiled.server.app import build_app  # noqa: E402
+
+# Import the file manager from the checkout when it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_manager.dataset.tiled_dataset import TiledDataset  # noqa: E402
+
+
+class TransferCounter:
+    def __init__(self, latency):
+        """
+        Count requests and bytes transferred by the tiled client, delaying each request
+        """
+        self.latency = latency
+        self.requests = 0
+        self.bytes = 0
+
+    def on_response(self, response):
+        time.sleep(self.latency)
+        response.read()
+        self.requests += 1
+        self.bytes += len(response.content)
+
+    def reset(self):
+        self.requests = 0
+        self.bytes = 0
+
+
+def fancy_index_read(tiled_client, uri, indexes):
+    """
+    Previous implementation, a single fancy-index fetch of the list of indexes
+    """
+    return tiled_client[uri][indexes]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-frames", type=int, default=512)
+    parser.add_argument("--frame-size", type=int, default=256)
+    parser.add_argument("--chunk-frames", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    size = args.frame_size
+    data = np.random.default_rng(0).random((args.num_frames, size, size))
+    tree = MapAdapter(
+        {
+            "stack": ArrayAdapter.from_array(
+                data.astype(np.float32), chunks=(args.chunk_frames, size, size)
+            )
+        }
+    )
+    counter = TransferCounter(args.latency)
+    context = Context.from_app(build_app(tree))
+    context.http_client.event_hooks["response"].append(counter.on_response)
+    tiled_client = from_context(context)
+    dataset = TiledDataset("stack", args.num_frames)
+    dataset._read_block(tiled_client, [0])
+
+    pages = {
+        "page of 18 contiguous frames": list(range(100, 118)),
+        "two pages of 18 frames": list(range(100, 118)) + list(range(300, 318)),
+        "18 scattered frames": list(range(0, args.num_frames, args.num_frames // 18))[
+            :18
+        ],
+    }
+    print(
+        f"{args.num_frames} frames of {size}x{size}, {args.latency * 1000:.0f} ms latency"
+    )
+    for name, indexes in pages.items():
+        for label, read in [
+            ("fancy index", lambda: fancy_index_read(tiled_client, "stack", indexes)),
+            ("coalesced", lambda: dataset._read_block(tiled_client, indexes)),
+        ]:
+            counter.reset()
+            start = time.perf_counter()
+            block = np.asarray(read())
+            elapsed = time.perf_counter() - start
+            assert np.array_equal(block, data[indexes].astype(np.float32))
+            print(
+                f"{name:<30} {label:<12} {elapsed * 1000:8.1f} ms  "
+                f"{counter.requests:4d} requests  {counter.bytes / 1024**2:8.2f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,16 @@ DEFAULT_TILED_URI = os.getenv("DEFAULT_TILED_URI", "")
 DEFAULT_TILED_SUB_URI = os.getenv("DEFAULT_TILED_SUB_URI", "")
 
 
-def create_file_explorer(max_file_size, upload_folder_root=None):
+def create_file_explorer(
+    max_file_size, upload_folder_root=None, watch=False, watch_interval=5000
+):
     """
     Creates the dash components for the file explorer
     Args:
         max_file_size:      Maximum file size to be uploaded
         default_tiled_uri:  Default Tiled URI to be displayed in file manager
+        watch:              Enable the polling of the directory watcher, defaults to False
+        watch_interval:     Time in ms between two checks of the directory watcher
     Returns:
         file_explorer:      HTML.DIV with all the corresponding components of the file explorer
     """
@@ -488,6 +492,20 @@ def create_file_explorer(max_file_size, upload_folder_root=None):
                         id={"base_id": "file-manager", "name": "total-num-data-points"},
                         data=0,
                     ),
+                    dcc.Store(
+                        id={"base_id": "file-manager", "name": "user-id"},
+                        data=None,
+                    ),
+                    # WATCH MODE
+                    dcc.Interval(
+                        id={"base_id": "file-manager", "name": "watch-interval"},
+                        interval=watch_interval,
+                        disabled=not watch,
+                    ),
+                    dcc.Store(
+                        id={"base_id": "file-manager", "name": "watch-generation"},
+                        data=0,
+                    ),
                 ]
             ),
         ]
@@ -2,19 +2,30 @@ import bisect
 import hashlib
 import logging
 import os
+import re
+import time
 import traceback
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from datetime import datetime
 from functools import partial
 from itertools import chain
+from urllib.parse import parse_qsl
 
 import numpy as np
 import requests
 import tifffile
 
+from file_manager.dataset.executors import get_executor
 from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.thumbnail_cache import CACHED_EXPORTS
+from file_manager.dataset.thumbnail_encoder import ThumbnailEncoder
+from file_manager.dataset.thumbnail_store import (
+    THUMBNAIL_STORE,
+    THUMBNAIL_STORE_BATCH_SIZE,
+)
 from file_manager.dataset.tiled_dataset import TiledDataset
+from file_manager.prefetcher import PREFETCH_BATCH_SIZE, PREFETCHER
+from file_manager.project_registry import PROJECT_REGISTRY
 
 
 class DataProject:
@@ -26,6 +37,8 @@ class DataProject:
         datasets=[],
         project_id=None,
         logger=None,
+        executor=None,
+        encoder=None,
     ):
         """
         Definition of a DataProject
@@ -35,6 +48,12 @@ class DataProject:
             api_key:            API key
             datasets:           List of datasets
             project_id:         Project ID
+            logger:             Logger
+            executor:           Executor backend ("thread", "process" or "inline") or
+                                instance used to decode and encode the images, defaults
+                                to EXECUTOR_BACKEND
+            encoder:            ThumbnailEncoder of the thumbnails, defaults to
+                                DEFAULT_THUMBNAIL_ENCODER
         """
         self.root_uri = root_uri
         self.api_key = api_key
@@ -42,31 +61,101 @@ class DataProject:
         self.project_id = project_id
         self.data_type = data_type
         self.logger = logger or logging.getLogger(__name__)
+        self.executor = executor
+        self.encoder = encoder
         pass
 
-    def to_dict(self):
+    @property
+    def datasets(self):
+        return self._datasets
+
+    @datasets.setter
+    def datasets(self, datasets):
+        self._datasets = datasets
+        self._cumulative_counts = None
+        self._uri_map = None
+
+    @property
+    def cumulative_counts(self):
+        """
+        Cumulative data counts of the datasets as a NumPy offset array, computed once and
+        reused until the list of datasets is replaced
+        Returns:
+            Array of cumulative data counts
+        """
+        if self._cumulative_counts is None:
+            self._cumulative_counts = np.array(
+                [dataset.cumulative_data_count for dataset in self.datasets],
+                dtype=np.int64,
+            )
+        return self._cumulative_counts
+
+    def _group_indices(self, indices):
+        """
+        Map global indices to datasets and local indices
+        Args:
+            indices:        List of global indices
+        Returns:
+            sorted_indices: Positions that sort the input indices
+            dataset_indices: Dictionary of dataset index to list of local indices, in sorted order
+        """
+        sorted_indices = np.argsort(indices)
+        sorted_list = np.asarray(indices, dtype=np.int64)[sorted_indices]
+
+        cumulative_counts = self.cumulative_counts
+        offsets = np.concatenate(([0], cumulative_counts))
+        dataset_ids = np.searchsorted(cumulative_counts, sorted_list, side="right")
+        image_indices = sorted_list - offsets[dataset_ids]
+
+        # Sorted input yields contiguous runs of the same dataset
+        unique_ids, starts = np.unique(dataset_ids, return_index=True)
+        dataset_indices = {
+            int(dataset_id): group.tolist()
+            for dataset_id, group in zip(
+                unique_ids, np.split(image_indices, starts[1:])
+            )
+        }
+        return sorted_indices, dataset_indices
+
+    def to_dict(self, filenames_mode=None):
         """
         Convert to dictionary
+        Args:
+            filenames_mode:     Serialization of the filenames of file datasets, defaults
+                                to FILENAMES_MODE
         Returns:
             Dictionary
         """
-        return {
+        data_project_dict = {
             "root_uri": self.root_uri,
-            "datasets": [dataset.to_dict() for dataset in self.datasets],
+            "datasets": [
+                (
+                    dataset.to_dict(filenames_mode)
+                    if self.data_type == "file"
+                    else dataset.to_dict()
+                )
+                for dataset in self.datasets
+            ],
             "project_id": self.project_id,
             "data_type": self.data_type,
         }
+        if self.encoder is not None:
+            data_project_dict["encoder"] = self.encoder.to_dict()
+        return data_project_dict
 
     @classmethod
     def from_dict(cls, data_project_dict, api_key=None):
         """
-        Create a new instance from dictionary
+        Create a new instance from dictionary, or get the registered project of a
+        PROJECT_REGISTRY reference
         Args:
-            data_project_dict:           Dictionary
+            data_project_dict:           Dictionary or registry reference
             api_key:                     API key
         Returns:
-            New instance
+            New instance, or the registered instance shared across callers
         """
+        if PROJECT_REGISTRY.is_reference(data_project_dict):
+            return PROJECT_REGISTRY.get(data_project_dict, cls.from_dict, api_key)
         return cls(
             data_project_dict["root_uri"],
             data_project_dict["data_type"],
@@ -80,6 +169,11 @@ class DataProject:
                 for dataset in data_project_dict["datasets"]
             ],
             project_id=data_project_dict["project_id"],
+            encoder=(
+                ThumbnailEncoder.from_dict(data_project_dict["encoder"])
+                if "encoder" in data_project_dict
+                else None
+            ),
         )
 
     def read_datasets(
@@ -90,6 +184,7 @@ class DataProject:
         log=False,
         just_uri=False,
         percentiles=[0, 100],
+        downsample=False,
     ):
         """
         Get datasets at specific indices
@@ -100,6 +195,8 @@ class DataProject:
             log:            Take logarithm of the data, defaults to False
             just_uri:       Return only the URIs, defaults to False
             percentiles:    Percentiles to calculate
+            downsample:     Fetch tiled previews strided down to the thumbnail size,
+                            defaults to False
         Returns:
             List of datasets
         """
@@ -110,18 +207,7 @@ class DataProject:
         else:
             tiled_client = None
 
-        sorted_indices = np.argsort(indices)
-        sorted_list = np.array(indices)[sorted_indices]
-
-        cumulative_counts = [dataset.cumulative_data_count for dataset in self.datasets]
-        dataset_indices = defaultdict(list)
-
-        for index in sorted_list:
-            new_i = bisect.bisect_right(
-                [cumulative_count for cumulative_count in cumulative_counts], index
-            )
-            image_index = index - (cumulative_counts[new_i - 1] if new_i > 0 else 0)
-            dataset_indices[new_i].append(image_index)
+        sorted_indices, dataset_indices = self._group_indices(indices)
 
         tasks = [
             (
@@ -133,39 +219,281 @@ class DataProject:
                 self.api_key,
                 tiled_client,
                 percentiles,
+                downsample,
             )
             for dataset_index, image_indices in dataset_indices.items()
         ]
 
-        with ThreadPoolExecutor() as executor:
-            try:
-                if just_uri:
-                    uris = list(
-                        executor.map(self.read_dataset, tasks, [just_uri] * len(tasks))
-                    )
-                else:
-                    results = list(
-                        executor.map(self.read_dataset, tasks, [just_uri] * len(tasks))
-                    )
-                    images, uris = map(list, zip(*results))
-                    images = list(chain.from_iterable(images))
-                uris = list(chain.from_iterable(uris))
-            except Exception:
-                self.logger.error(f"Generated an exception: {traceback.format_exc()}")
+        executor = get_executor("thread")
+        try:
+            if just_uri:
+                uris = list(
+                    executor.map(self.read_dataset, tasks, [just_uri] * len(tasks))
+                )
+            else:
+                results = list(
+                    executor.map(self.read_dataset, tasks, [just_uri] * len(tasks))
+                )
+                images, uris = map(list, zip(*results))
+                images = list(chain.from_iterable(images))
+            uris = list(chain.from_iterable(uris))
+        except Exception:
+            self.logger.error(f"Generated an exception: {traceback.format_exc()}")
+
+        # Position of each requested index within the sorted results
+        caller_order = np.empty(len(sorted_indices), dtype=np.int64)
+        caller_order[sorted_indices] = np.arange(len(sorted_indices))
+        caller_order = caller_order.tolist()
 
+        rearranged_uris = [uris[position] for position in caller_order]
         if just_uri:
-            rearranged_uris = [None] * len(sorted_indices)
-            for original_index, position in enumerate(sorted_indices):
-                rearranged_uris[position] = uris[original_index]
             return rearranged_uris
 
-        rearranged_uris = [None] * len(sorted_indices)
-        rearranged_imgs = [None] * len(sorted_indices)
-        for original_index, position in enumerate(sorted_indices):
-            rearranged_uris[position] = uris[original_index]
-            rearranged_imgs[position] = images[original_index]
+        rearranged_imgs = [images[position] for position in caller_order]
         return rearranged_imgs, rearranged_uris
 
+    def is_cached(
+        self,
+        indices,
+        export="base64",
+        resize=True,
+        log=False,
+        percentiles=[0, 100],
+        downsample=False,
+    ):
+        """
+        Check which data points are in the thumbnail cache for the given read parameters,
+        without reading them
+        Args:
+            indices:        List of indices
+            export:         Export format of the data
+            resize:         Resize image to 200x200, defaults to True
+            log:            Take logarithm of the data, defaults to False
+            percentiles:    Percentiles to calculate
+            downsample:     Fetch tiled previews strided down to the thumbnail size,
+                            defaults to False
+        Returns:
+            List of flags, in the order of indices
+        """
+        if self.data_type == "tiled":
+            tiled_client = TiledDataset.get_tiled_client(self.root_uri, self.api_key)
+        else:
+            tiled_client = None
+        sorted_indices, dataset_indices = self._group_indices(indices)
+        cached = []
+        for dataset_index, image_indices in dataset_indices.items():
+            cached += self.datasets[dataset_index].is_cached(
+                self.root_uri,
+                image_indices,
+                export=export,
+                resize=resize,
+                log=log,
+                percentiles=percentiles,
+                downsample=downsample,
+                encoder=self.encoder,
+                tiled_client=tiled_client,
+                api_key=self.api_key,
+            )
+        rearranged_cached = [False] * len(cached)
+        for position, sorted_position in enumerate(sorted_indices.tolist()):
+            rearranged_cached[sorted_position] = cached[position]
+        return rearranged_cached
+
+    def source_versions(self, indices):
+        """
+        Get the versions of the sources of data points, which change when their data is
+        modified: modification time and size of local files, ETag of tiled nodes
+        Args:
+            indices:        List of indices
+        Returns:
+            List of versions, in the order of indices
+        """
+        if self.data_type == "tiled":
+            tiled_client = TiledDataset.get_tiled_client(self.root_uri, self.api_key)
+        sorted_indices, dataset_indices = self._group_indices(indices)
+        versions = []
+        for dataset_index, image_indices in dataset_indices.items():
+            dataset = self.datasets[dataset_index]
+            if self.data_type == "tiled":
+                versions += dataset.source_versions(image_indices, tiled_client)
+            else:
+                versions += dataset.source_versions(self.root_uri, image_indices)
+        rearranged_versions = [None] * len(versions)
+        for position, sorted_position in enumerate(sorted_indices.tolist()):
+            rearranged_versions[sorted_position] = versions[position]
+        return rearranged_versions
+
+    def iter_datasets(
+        self,
+        indices,
+        batch_size=100,
+        export="base64",
+        resize=True,
+        log=False,
+        percentiles=[0, 100],
+        downsample=False,
+        prefetch=1,
+    ):
+        """
+        Iterate over the datasets at specific indices in ordered batches, while the next
+        batches are read in the background
+        Args:
+            indices:        List of indices to retrieve
+            batch_size:     Number of data points per batch, defaults to 100
+            export:         Export format of the data
+            resize:         Resize image to 200x200, defaults to True
+            log:            Take logarithm of the data, defaults to False
+            percentiles:    Percentiles to calculate
+            downsample:     Fetch tiled previews strided down to the thumbnail size,
+                            defaults to False
+            prefetch:       Number of batches read ahead of the current one, defaults to 1
+        Yields:
+            List of datasets and list of URIs of each batch, in the order of indices
+        """
+        read_batch = partial(
+            self.read_datasets,
+            export=export,
+            resize=resize,
+            log=log,
+            percentiles=percentiles,
+            downsample=downsample,
+        )
+        batches = (
+            indices[start : start + batch_size]
+            for start in range(0, len(indices), batch_size)
+        )
+
+        def next_batch():
+            # Read the batch here if no thread of the shared pool has picked it up yet
+            future, batch = pending.popleft()
+            if future.cancel():
+                return read_batch(batch)
+            return future.result()
+
+        # At most prefetch + 1 batches are held in memory at any time
+        executor = get_executor("thread")
+        pending = deque()
+        try:
+            for batch in batches:
+                pending.append((executor.submit(read_batch, batch), batch))
+                if len(pending) > prefetch:
+                    yield next_batch()
+            while pending:
+                yield next_batch()
+        finally:
+            for future, _ in pending:
+                future.cancel()
+            for future, _ in pending:
+                if not future.cancelled():
+                    future.exception()
+
+    def prefetch(
+        self,
+        indices,
+        key,
+        export="base64",
+        resize=True,
+        log=False,
+        percentiles=[0, 100],
+        downsample=False,
+        batch_size=PREFETCH_BATCH_SIZE,
+    ):
+        """
+        Read datasets in the background to warm the thumbnail cache, e.g. the pages next
+        to the one being displayed. A new prefetch with the same key cancels the pending
+        reads of the previous one. Data projects are shared by the sessions that view
+        them, so the key identifies the session. Cached data points are skipped, and the
+        prefetches in flight stop after fetching PREFETCH_MEMORY_BUDGET bytes
+        Args:
+            indices:        List of indices to prefetch, in order of priority
+            key:            Key of the prefetch, e.g. the ID of the browser session
+            export:         Export format of the data, as in the later read
+            resize:         Resize image to 200x200, defaults to True
+            log:            Take logarithm of the data, defaults to False
+            percentiles:    Percentiles to calculate
+            downsample:     Fetch tiled previews strided down to the thumbnail size,
+                            defaults to False
+            batch_size:     Number of data points per background read, defaults to
+                            PREFETCH_BATCH_SIZE
+        Returns:
+            List of futures, with the number of bytes fetched by each batch
+        """
+        if export not in CACHED_EXPORTS:
+            raise ValueError(f"Export {export} is not cached and cannot be prefetched")
+        read_batch = partial(
+            self.read_datasets,
+            export=export,
+            resize=resize,
+            log=log,
+            percentiles=percentiles,
+            downsample=downsample,
+        )
+
+        def prefetch_batch(batch):
+            # Only the images that are not cached are read, and charged to the budget
+            try:
+                cached = self.is_cached(
+                    batch,
+                    export=export,
+                    resize=resize,
+                    log=log,
+                    percentiles=percentiles,
+                    downsample=downsample,
+                )
+                batch = [index for index, hit in zip(batch, cached) if not hit]
+                return read_batch(batch)[0] if batch else []
+            except Exception:
+                self.logger.error(f"Prefetch failed: {traceback.format_exc()}")
+                return []
+
+        return PREFETCHER.submit(
+            key,
+            prefetch_batch,
+            [
+                indices[start : start + batch_size]
+                for start in range(0, len(indices), batch_size)
+            ],
+        )
+
+    def build_thumbnails(self, batch_size=THUMBNAIL_STORE_BATCH_SIZE, downsample=True):
+        """
+        Precompute the thumbnails of the data project at each level of THUMBNAIL_STORE,
+        with the default normalization. Thumbnails that are already stored for the
+        current version of their source are skipped, so a build can be run again after
+        a refresh
+        Args:
+            batch_size:     Number of frames read per batch
+            downsample:     Fetch tiled previews strided down to the thumbnail size,
+                            defaults to True
+        Returns:
+            Number of stored thumbnails
+        """
+        if not THUMBNAIL_STORE.enabled:
+            return 0
+        start = time.time()
+        if self.data_type == "tiled":
+            tiled_client = TiledDataset.get_tiled_client(self.root_uri, self.api_key)
+        else:
+            tiled_client = None
+        encoders = THUMBNAIL_STORE.level_encoders(self.encoder)
+        num_stored = 0
+        offset = 0
+        for dataset in self.datasets:
+            count = dataset.cumulative_data_count - offset
+            offset = dataset.cumulative_data_count
+            for batch_start in range(0, count, batch_size):
+                num_stored += dataset.build_thumbnails(
+                    self.root_uri,
+                    list(range(batch_start, min(batch_start + batch_size, count))),
+                    encoders,
+                    tiled_client=tiled_client,
+                    api_key=self.api_key,
+                    downsample=downsample,
+                    executor=self.executor,
+                )
+        self.logger.info(f"Stored {num_stored} thumbnails after {time.time() - start}")
+        return num_stored
+
     def read_dataset(self, args, just_uri=False):
         (
             dataset_index,
@@ -176,6 +504,7 @@ class DataProject:
             api_key,
             tiled_client,
             percentiles,
+            downsample,
         ) = args
         return self.datasets[dataset_index].read_data(
             self.root_uri,
@@ -187,26 +516,111 @@ class DataProject:
             tiled_client=tiled_client,
             just_uri=just_uri,
             percentiles=percentiles,
+            downsample=downsample,
+            executor=self.executor,
+            encoder=self.encoder,
         )
 
+    @staticmethod
+    def _normalize_path(path):
+        return re.sub("/+", "/", path).strip("/")
+
+    @property
+    def uri_map(self):
+        """
+        Map of the normalized URIs of the datasets to their position, built once and
+        reused until the list of datasets is replaced
+        Returns:
+            Dictionary of dataset URI to dataset index
+        """
+        if self._uri_map is None:
+            uri_map = {}
+            for dataset_index, dataset in enumerate(self.datasets):
+                uri_map.setdefault(self._normalize_path(dataset.uri), dataset_index)
+            self._uri_map = uri_map
+        return self._uri_map
+
+    def _candidate_datasets(self, path):
+        """
+        Find the datasets that may hold a URI path, from the most specific to the least
+        Args:
+            path:           Normalized path of the URI
+        Returns:
+            Generator of dataset index and path of the image within the dataset
+        """
+        boundaries = [position for position, char in enumerate(path) if char == "/"]
+        uri_map = self.uri_map
+        if self.data_type == "tiled":
+            # Tiled URIs end with the node path, after the server and endpoint parts
+            for boundary in [-1] + boundaries:
+                if path[boundary + 1 :] in uri_map:
+                    yield uri_map[path[boundary + 1 :]], ""
+        else:
+            for boundary in reversed(boundaries):
+                if path[:boundary] in uri_map:
+                    yield uri_map[path[:boundary]], path[boundary + 1 :]
+            if "" in uri_map:
+                yield uri_map[""], path
+
+    def get_indices(self, uris):
+        """
+        Get the global indices of a list of URIs, as returned by read_datasets
+        Args:
+            uris:           List of file paths or tiled URIs, with their "?page=" or
+                            "?slice=" query
+        Returns:
+            List of global indices, None for the URIs that are not in the project
+        """
+        offsets = np.concatenate(([0], self.cumulative_counts[:-1])).tolist()
+        root_path = self._normalize_path(self.root_uri)
+        indices = []
+        for uri in uris:
+            path, _, query = uri.partition("?")
+            query = dict(parse_qsl(query))
+            path = self._normalize_path(path)
+            if self.data_type != "tiled" and path.startswith(root_path + "/"):
+                path = path[len(root_path) + 1 :]
+            index = None
+            for dataset_index, filename in self._candidate_datasets(path):
+                dataset = self.datasets[dataset_index]
+                try:
+                    if self.data_type == "tiled":
+                        local_index = int(query.get("slice", 0))
+                    else:
+                        local_index = dataset.get_frame_index(
+                            filename, int(query.get("page", 0))
+                        )
+                except ValueError:
+                    continue
+                dataset_size = dataset.cumulative_data_count - offsets[dataset_index]
+                if 0 <= local_index < dataset_size:
+                    index = offsets[dataset_index] + local_index
+                    break
+            indices.append(index)
+        return indices
+
     def get_index(self, uri):
-        cum_points = 0
-        for dataset in self.datasets:
-            if dataset.uri.replace("//", "/") in uri:
-                return cum_points + dataset.get_uri_index(uri.split(self.root_uri)[-1])
-            cum_points = dataset.cumulative_data_count
-        return None
+        """
+        Get the global index of a URI
+        Args:
+            uri:            File path or tiled URI
+        Returns:
+            Global index, None if the URI is not in the project
+        """
+        return self.get_indices([uri])[0]
 
     def browse_data(
         self,
         sub_uri_template,
         selected_sub_uris=[""],
+        directory_index=None,
     ):
         """
         Browse data according to browse format and data type
         Args:
             sub_uri_template:       Sub URI template
             selected_sub_uris:      List of selected sub URIs
+            directory_index:        DirectoryIndex used to browse files, defaults to None
         Returns:
             data:               Retrieve Dataset according to data_type and browse format
         """
@@ -227,21 +641,74 @@ class DataProject:
                 sub_uri_template = ["**/*.jpg", "**/*.jpeg"]
             elif sub_uri_template == "**/*.tif":
                 sub_uri_template = ["**/*.tif", "**/*.tiff"]
-            uris, cumulative_data_counts, filenames_per_uri = (
-                FileDataset.filepaths_from_directory(
-                    self.root_uri,
-                    sub_uri_template,
-                    selected_sub_uris=selected_sub_uris,
-                )
+            (
+                uris,
+                cumulative_data_counts,
+                filenames_per_uri,
+                frame_counts_per_uri,
+                mtimes_per_uri,
+            ) = FileDataset.filepaths_from_directory(
+                self.root_uri,
+                sub_uri_template,
+                selected_sub_uris=selected_sub_uris,
+                directory_index=directory_index,
+                count_frames=True,
+                directory_mtimes=True,
+            )
+            formats = (
+                [sub_uri_template]
+                if type(sub_uri_template) is str
+                else list(sub_uri_template)
             )
             data = [
-                FileDataset(uri, cum_data_count, filenames=filenames)
-                for uri, cum_data_count, filenames in zip(
-                    uris, cumulative_data_counts, filenames_per_uri
+                FileDataset(
+                    uri,
+                    cum_data_count,
+                    filenames=filenames,
+                    frame_counts=frame_counts,
+                    formats=formats,
+                    directory_mtimes=mtimes,
+                )
+                for uri, cum_data_count, filenames, frame_counts, mtimes in zip(
+                    uris,
+                    cumulative_data_counts,
+                    filenames_per_uri,
+                    frame_counts_per_uri,
+                    mtimes_per_uri,
                 )
             ]
         return data
 
+    def refresh(self, directory_index=None):
+        """
+        Update the datasets in place with the files or frames that were added or removed
+        since they were browsed
+        Args:
+            directory_index:    DirectoryIndex used to answer the listings, defaults to None
+        Returns:
+            List of DatasetDiff, one per dataset
+        """
+        if self.data_type == "tiled":
+            tiled_client = TiledDataset.get_tiled_client(self.root_uri, self.api_key)
+        diffs = []
+        offset = 0
+        previous_offset = 0
+        for dataset in self.datasets:
+            previous_count = dataset.cumulative_data_count
+            if self.data_type == "tiled":
+                diff = dataset.refresh(tiled_client, offset, previous_offset)
+            else:
+                diff = dataset.refresh(self.root_uri, offset, directory_index)
+            diffs.append(diff)
+            offset = dataset.cumulative_data_count
+            previous_offset = previous_count
+        # The URIs of the datasets are unchanged, only their cumulative counts move
+        if self._cumulative_counts is not None:
+            num_frames = np.array([diff.num_frames for diff in diffs], dtype=np.int64)
+            previous_num_frames = np.diff(self._cumulative_counts, prepend=0)
+            self._cumulative_counts += np.cumsum(num_frames - previous_num_frames)
+        return diffs
+
     @staticmethod
     def get_event_id(splash_uri):
         """
@@ -293,14 +760,13 @@ class DataProject:
             subset = self._list_indices[start_index:end_index]
             if len(subset) != 0:
                 tiled_uris = tiled_uris[start_index:end_index]
-                with ThreadPoolExecutor() as executor:
-                    check_func = partial(
-                        self._check_file_and_remove_index,
-                        subset=subset,
-                        tiled_uris=tiled_uris,
-                        root_dir=root_dir,
-                    )
-                    executor.map(check_func, tiled_uris)
+                check_func = partial(
+                    self._check_file_and_remove_index,
+                    subset=subset,
+                    tiled_uris=tiled_uris,
+                    root_dir=root_dir,
+                )
+                list(get_executor("thread").map(check_func, tiled_uris))
             prev_data_count = cum_data_count
 
         return self._list_indices
@@ -332,10 +798,11 @@ class DataProject:
         )
 
         if len(filtered_indices) > 0:
-            data_contents, data_uris = self.read_datasets(
+            batches = self.iter_datasets(
                 filtered_indices, export="raw", resize=False, log=False
             )
-            with ThreadPoolExecutor() as executor:
+            executor = get_executor("thread")
+            for data_contents, data_uris in batches:
                 list(
                     executor.map(
                         partial(self._save_data_content, root_dir=root_dir),
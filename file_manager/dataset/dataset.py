@@ -1,9 +1,28 @@
-import base64
-import io
+from collections import namedtuple
+from functools import partial
 
 import numpy as np
 from PIL import Image
 
+from file_manager.dataset.executors import get_executor
+from file_manager.dataset.thumbnail_cache import (
+    CACHED_EXPORTS,
+    THUMBNAIL_CACHE,
+    ThumbnailCache,
+)
+from file_manager.dataset.thumbnail_encoder import (  # noqa: F401
+    DEFAULT_THUMBNAIL_ENCODER,
+    THUMBNAIL_SIZE,
+)
+from file_manager.dataset.thumbnail_store import THUMBNAIL_STORE, ThumbnailStore
+
+# Size in bytes of the chunks of images that are normalized together
+BATCH_CHUNK_BYTES = 2**20
+
+# Changes of a data set found on refresh: added and removed filenames (file data sets) or
+# frame indices (tiled data sets), and the new number of frames of the data set
+DatasetDiff = namedtuple("DatasetDiff", ["uri", "added", "removed", "num_frames"])
+
 
 class Dataset:
     def __init__(self, uri, cumulative_data_count):
@@ -17,6 +36,199 @@ class Dataset:
         self.cumulative_data_count = cumulative_data_count
         pass
 
+    @staticmethod
+    def _read_cached(
+        sources,
+        log,
+        resize,
+        export,
+        percentiles,
+        downsample=False,
+        encoder=None,
+        versions=None,
+    ):
+        """
+        Look up processed images in the thumbnail cache
+        Args:
+            sources:        List of (source URI, index) pairs
+            log:            Log transform flag
+            resize:         Resize flag
+            export:         Export format
+            percentiles:    Percentiles used for normalization
+            downsample:     Downsampling applied to the source, defaults to False
+            encoder:        ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+            versions:       List of source versions, defaults to None
+        Returns:
+            results:        List of cached images, None where the image is not cached
+            cache_keys:     List of cache keys, None if the export format is not cached
+        """
+        if export not in CACHED_EXPORTS:
+            return [None] * len(sources), None
+        cache_keys = Dataset._cache_keys(
+            sources, log, resize, export, percentiles, downsample, encoder, versions
+        )
+        return THUMBNAIL_CACHE.get_many(cache_keys), cache_keys
+
+    @staticmethod
+    def _is_cached(
+        sources,
+        log,
+        resize,
+        export,
+        percentiles,
+        downsample=False,
+        encoder=None,
+        versions=None,
+    ):
+        """
+        Check which processed images are in the thumbnail cache, without reading them
+        Args:
+            Same as _read_cached
+        Returns:
+            List of flags, True where the image is cached
+        """
+        if export not in CACHED_EXPORTS:
+            return [False] * len(sources)
+        return [
+            THUMBNAIL_CACHE.contains(cache_key)
+            for cache_key in Dataset._cache_keys(
+                sources, log, resize, export, percentiles, downsample, encoder, versions
+            )
+        ]
+
+    @staticmethod
+    def _cache_keys(
+        sources, log, resize, export, percentiles, downsample, encoder, versions
+    ):
+        if versions is None:
+            versions = [None] * len(sources)
+        return [
+            ThumbnailCache.make_key(
+                uri,
+                index,
+                log,
+                percentiles,
+                resize,
+                export,
+                downsample,
+                encoder,
+                version,
+            )
+            for (uri, index), version in zip(sources, versions)
+        ]
+
+    @staticmethod
+    def _write_cached(cache_keys, results, positions):
+        if cache_keys is None:
+            return
+        for position in positions:
+            THUMBNAIL_CACHE.put(cache_keys[position], results[position])
+
+    @staticmethod
+    def _read_stored(sources, versions, export, downsample=False, encoder=None):
+        """
+        Look up precomputed thumbnails in the thumbnail store
+        Args:
+            sources:        List of (source URI, index) pairs
+            versions:       List of source versions, None where the version is unknown
+            export:         Export format, base64 or bytes
+            downsample:     Downsampling applied to the source, defaults to False
+            encoder:        ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+        Returns:
+            List of stored images, None where the image is not stored
+        """
+        encoder = encoder or DEFAULT_THUMBNAIL_ENCODER
+        stored = THUMBNAIL_STORE.get_many(
+            [
+                (
+                    ThumbnailStore.make_key(uri, index, version, downsample, encoder)
+                    if version is not None
+                    else None
+                )
+                for (uri, index), version in zip(sources, versions)
+            ]
+        )
+        if export == "base64":
+            stored = [
+                encoder.data_url(data) if data is not None else None for data in stored
+            ]
+        return stored
+
+    @staticmethod
+    def _missing_stored(sources, versions, downsample=False, encoder=None):
+        """
+        Find the thumbnails that are not in the thumbnail store yet
+        Args:
+            sources:        List of (source URI, index) pairs
+            versions:       List of source versions, None where the version is unknown
+            downsample:     Downsampling applied to the source, defaults to False
+            encoder:        ThumbnailEncoder of the level
+        Returns:
+            Positions of the missing thumbnails and their keys
+        """
+        keys = [
+            (
+                ThumbnailStore.make_key(uri, index, version, downsample, encoder)
+                if version is not None
+                else None
+            )
+            for (uri, index), version in zip(sources, versions)
+        ]
+        missing = THUMBNAIL_STORE.missing(keys)
+        return missing, [keys[position] for position in missing]
+
+    @staticmethod
+    def _missing_levels(sources, versions, encoders, downsample=False):
+        """
+        Find the thumbnails that are not in the thumbnail store yet, at each level
+        Args:
+            sources:        List of (source URI, index) pairs
+            versions:       List of source versions, None where the version is unknown
+            encoders:       List of ThumbnailEncoder, one per level
+            downsample:     Downsampling applied to the source, defaults to False
+        Returns:
+            positions:      Positions of the thumbnails missing at any level
+            levels:         List of (positions, keys) of the missing thumbnails, per level
+        """
+        levels = [
+            Dataset._missing_stored(sources, versions, downsample, encoder)
+            for encoder in encoders
+        ]
+        positions = sorted(set().union(*(missing for missing, _ in levels)))
+        return positions, levels
+
+    @staticmethod
+    def _encode_level(encoder, image):
+        return encoder.encode(encoder.resize(image))
+
+    @staticmethod
+    def _store_levels(images, positions, levels, encoders, executor=None):
+        """
+        Encode and store the missing thumbnails of each level, resized from the
+        normalized thumbnails of the largest level
+        Args:
+            images:         List of PIL images at the largest level
+            positions:      Positions of the images
+            levels:         List of (positions, keys) of the missing thumbnails, per level
+            encoders:       List of ThumbnailEncoder, one per level
+            executor:       Executor backend or instance used to encode the images,
+                            defaults to the shared EXECUTOR_BACKEND executor
+        Returns:
+            Number of stored thumbnails
+        """
+        images = dict(zip(positions, images))
+        num_stored = 0
+        for encoder, (missing, keys) in zip(encoders, levels):
+            if len(missing) == 0:
+                continue
+            thumbnails = get_executor(executor).map(
+                partial(Dataset._encode_level, encoder),
+                [images[position] for position in missing],
+            )
+            THUMBNAIL_STORE.put_many(keys, list(thumbnails))
+            num_stored += len(keys)
+        return num_stored
+
     @staticmethod
     def _apply_log_transform(image, threshold=0.000000000001):
         # Mask negative and NaN values
@@ -48,7 +260,7 @@ class Dataset:
         return x
 
     @classmethod
-    def _process_image(cls, image, log, resize, export, percentiles):
+    def _normalize_image(cls, image, log, percentiles):
         if log:
             image = cls._apply_log_transform(image)
 
@@ -59,17 +271,134 @@ class Dataset:
             image = (
                 (image - np.min(image)) / (np.max(image) - np.min(image)) * 255
             ).astype(np.uint8)
+        return image
+
+    @staticmethod
+    def _export_image(image, resize, export, encoder=None):
+        encoder = encoder or DEFAULT_THUMBNAIL_ENCODER
         image = Image.fromarray(image)
 
         if resize:
-            image = image.resize((200, 200))
+            image = encoder.resize(image)
 
         if export == "pillow":
             return image
+        if export == "bytes":
+            return encoder.encode(image)
+        return encoder.to_data_url(image)
+
+    @classmethod
+    def _process_image(cls, image, log, resize, export, percentiles, encoder=None):
+        image = cls._normalize_image(image, log, percentiles)
+        return cls._export_image(image, resize, export, encoder)
+
+    @classmethod
+    def _normalize_batch(cls, images, log, percentiles):
+        """
+        Normalize a block of same-shape images to 0-255 in a few vectorized passes. The
+        block is processed in place when it is a writeable float32 array, otherwise in a
+        float32 copy, and in chunks that fit in the CPU cache.
+        Images with NaN values, or with negative values when taking the logarithm, are
+        masked in the per-image path and are normalized one at a time.
+        For float32 blocks the output matches _process_image bit for bit, for other
+        data types it may differ by 1 grey level due to the float32 arithmetic
+        Args:
+            images:         Block of images, with the image index as the first dimension
+            log:            Log transform flag
+            percentiles:    Percentiles used for normalization
+        Returns:
+            List of uint8 images
+        """
+        if not log and percentiles == [0, 100] and images.dtype == np.uint8:
+            return list(images)
+
+        step = max(1, BATCH_CHUNK_BYTES // max(1, images[0].size * 4))
+        normalized = []
+        for start in range(0, len(images), step):
+            normalized += cls._normalize_chunk(
+                images[start : start + step], log, percentiles
+            )
+        return normalized
+
+    @classmethod
+    def _normalize_chunk(cls, images, log, percentiles, threshold=0.000000000001):
+        # The minimum propagates NaN values, so a single pass finds the masked images
+        axes = tuple(range(1, images.ndim))
+        low = images.min(axis=axes, keepdims=True)
+        masked = np.isnan(low).reshape(-1)
+        if log:
+            # Constant images are fully masked by the division in the log transform
+            high = images.max(axis=axes, keepdims=True)
+            masked |= ((low < 0) | (high == low)).reshape(-1)
+        if masked.all():
+            return [cls._normalize_image(image, log, percentiles) for image in images]
+        if masked.any():
+            fallback = {
+                position: cls._normalize_image(images[position], log, percentiles)
+                for position in np.flatnonzero(masked)
+            }
+            x = images[~masked].astype(np.float32)
+            low = low[~masked]
+            high = high[~masked] if log else None
         else:
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            contents = buffered.getvalue()
+            fallback = {}
+            x = images.astype(np.float32, copy=not images.flags.writeable)
 
-        contents_base64 = base64.b64encode(contents).decode("utf-8")
-        return f"data:image/png;base64,{contents_base64}"
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if log:
+                x -= low.astype(np.float32)
+                x /= (high - low).astype(np.float32)
+                x += threshold
+                np.log(x, out=x)
+                low = x.min(axis=axes, keepdims=True)
+
+            if percentiles != [0, 100]:
+                low, high = np.percentile(
+                    x.reshape(len(x), -1), percentiles, axis=1
+                ).reshape(2, -1, *(1,) * len(axes))
+                span = high - low
+                x -= low.astype(np.float32)
+                x /= span.astype(np.float32)
+                np.clip(x, 0, 1, out=x)
+                x *= 255
+                normalized = x.astype(np.uint8)
+                normalized[span.reshape(-1) <= 0] = 0
+            else:
+                x -= low.astype(np.float32)
+                x /= x.max(axis=axes, keepdims=True)
+                x *= 255
+                normalized = x.astype(np.uint8)
+
+        normalized = iter(normalized)
+        return [
+            fallback[position] if is_masked else next(normalized)
+            for position, is_masked in enumerate(masked)
+        ]
+
+    @classmethod
+    def _process_batch(
+        cls, images, log, resize, export, percentiles, executor=None, encoder=None
+    ):
+        """
+        Process a block of same-shape images
+        Args:
+            images:         Block of images, with the image index as the first dimension
+            log:            Log transform flag
+            resize:         Resize flag
+            export:         Export format
+            percentiles:    Percentiles used for normalization
+            executor:       Executor backend or instance used to encode the images
+            encoder:        ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+        Returns:
+            List of processed images
+        """
+        normalized = cls._normalize_batch(images, log, percentiles)
+        return list(
+            get_executor(executor).map(
+                cls._export_image,
+                normalized,
+                [resize] * len(normalized),
+                [export] * len(normalized),
+                [encoder] * len(normalized),
+            )
+        )
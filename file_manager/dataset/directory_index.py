@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import threading
+import time
+
+from file_manager.dataset.executors import get_executor
+
+# Directories modified this recently (in ns) are rescanned on the next lookup, since further
+# changes within the same mtime tick would not be detected
+RACY_MTIME_NS = 2 * 10**9
+# Number of paths looked up per query, below the SQLite limit of variables per statement
+FRAMES_QUERY_SIZE = 500
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS roots (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS directories (
+        root_id INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        mtime INTEGER NOT NULL,
+        PRIMARY KEY (root_id, path)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        root_id INTEGER NOT NULL,
+        parent TEXT NOT NULL,
+        name TEXT NOT NULL,
+        is_dir INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        PRIMARY KEY (root_id, parent, name)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS frames (
+        root_id INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (root_id, path)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS generations (
+        root_id INTEGER PRIMARY KEY,
+        generation INTEGER NOT NULL
+    )
+    """,
+]
+
+
+class DirectoryIndex:
+    def __init__(self, root, db_path):
+        """
+        Persistent SQLite index of the directory listings under a root directory. Each
+        listing is refreshed only when the modification time of its directory changes.
+        The generation of the index is incremented whenever a listing changes, and is
+        shared by all the processes that use the database
+        Args:
+            root:           Root directory of the index
+            db_path:        Path to the SQLite database
+        """
+        self.root = os.path.abspath(root)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._root_id = None
+
+    def __getstate__(self):
+        # Connections are per thread and process, and cannot be pickled
+        return {"root": self.root, "db_path": self.db_path}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"], state["db_path"])
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.execute(
+                    "INSERT OR IGNORE INTO roots (path) VALUES (?)", (self.root,)
+                )
+            self._root_id = connection.execute(
+                "SELECT id FROM roots WHERE path = ?", (self.root,)
+            ).fetchone()[0]
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _scan(path):
+        entries = []
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                    size, mtime = stat.st_size, stat.st_mtime_ns
+                except OSError:
+                    # Broken symbolic links
+                    is_dir, size, mtime = False, 0, 0
+                entries.append((entry.name, int(is_dir), size, mtime))
+        return entries
+
+    def listdir(self, rel_dir=""):
+        """
+        List a directory, answering from the index when the directory has not changed
+        Args:
+            rel_dir:        Directory relative to the root of the index
+        Returns:
+            List of (name, is_dir, size, mtime) tuples
+        """
+        rel_dir = os.path.normpath(rel_dir) if rel_dir else ""
+        rel_dir = "" if rel_dir == "." else rel_dir
+        connection = self._connection()
+        try:
+            mtime = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+        except OSError:
+            with connection:
+                if self._remove(connection, rel_dir):
+                    self._bump_generation(connection)
+            return []
+
+        row = connection.execute(
+            "SELECT mtime FROM directories WHERE root_id = ? AND path = ?",
+            (self._root_id, rel_dir),
+        ).fetchone()
+        if row is not None and row[0] == mtime:
+            return connection.execute(
+                "SELECT name, is_dir, size, mtime FROM entries "
+                "WHERE root_id = ? AND parent = ?",
+                (self._root_id, rel_dir),
+            ).fetchall()
+
+        try:
+            entries = self._scan(os.path.join(self.root, rel_dir))
+        except OSError:
+            return []
+        if time.time_ns() - mtime < RACY_MTIME_NS:
+            mtime = -1
+        self._update(connection, rel_dir, mtime, entries)
+        return entries
+
+    def generation(self):
+        """
+        Get the generation of the index
+        Returns:
+            Number of changes of the listings recorded in the database
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT generation FROM generations WHERE root_id = ?",
+                (self._root_id,),
+            )
+            .fetchone()
+        )
+        return 0 if row is None else row[0]
+
+    def frame_counts(self, rel_paths, count_frames, stats=None):
+        """
+        Get the number of frames of files, counting them only when a file is new or has
+        changed since it was last counted
+        Args:
+            rel_paths:      List of file paths relative to the root of the index
+            count_frames:   Function that counts the frames of a file from its path
+            stats:          List of (size, mtime) of the files, e.g. from their listing,
+                            None where the file is stat'ed, defaults to None
+        Returns:
+            List of frame counts
+        """
+        connection = self._connection()
+        counts = [None] * len(rel_paths)
+        stats = list(stats) if stats is not None else [None] * len(rel_paths)
+        for position, rel_path in enumerate(rel_paths):
+            if stats[position] is None:
+                try:
+                    stat = os.stat(os.path.join(self.root, rel_path))
+                except OSError:
+                    counts[position] = 1
+                    continue
+                stats[position] = (stat.st_size, stat.st_mtime_ns)
+
+        # Counted files are looked up in batches, below the SQLite variable limit
+        positions = {}
+        for position, rel_path in enumerate(rel_paths):
+            positions.setdefault(rel_path, []).append(position)
+        unique_paths = list(positions)
+        for start in range(0, len(unique_paths), FRAMES_QUERY_SIZE):
+            chunk = unique_paths[start : start + FRAMES_QUERY_SIZE]
+            rows = connection.execute(
+                "SELECT path, size, mtime, count FROM frames WHERE root_id = ? AND "
+                f"path IN ({', '.join('?' * len(chunk))})",
+                (self._root_id, *chunk),
+            )
+            for path, size, mtime, count in rows:
+                for position in positions[path]:
+                    if stats[position] == (size, mtime):
+                        counts[position] = count
+
+        missing = [position for position, count in enumerate(counts) if count is None]
+        missing_counts = get_executor("thread").map(
+            count_frames,
+            [os.path.join(self.root, rel_paths[position]) for position in missing],
+        )
+        rows = []
+        now = time.time_ns()
+        for position, count in zip(missing, missing_counts):
+            counts[position] = count
+            size, mtime = stats[position]
+            if now - mtime < RACY_MTIME_NS:
+                mtime = -1
+            rows.append((self._root_id, rel_paths[position], size, mtime, count))
+        if rows:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?)", rows
+                )
+        return counts
+
+    def _bump_generation(self, connection):
+        connection.execute(
+            "INSERT INTO generations VALUES (?, 1) ON CONFLICT (root_id) "
+            "DO UPDATE SET generation = generation + 1",
+            (self._root_id,),
+        )
+
+    def _update(self, connection, rel_dir, mtime, entries):
+        previous = set(
+            connection.execute(
+                "SELECT name, is_dir, size, mtime FROM entries "
+                "WHERE root_id = ? AND parent = ?",
+                (self._root_id, rel_dir),
+            )
+        )
+        previous_dirs = {entry[0] for entry in previous if entry[1]}
+        current_dirs = {entry[0] for entry in entries if entry[1]}
+        with connection:
+            # Rescans of unchanged directories, e.g. with a racy mtime, or by another
+            # process, leave the generation untouched
+            if previous != set(entries):
+                self._bump_generation(connection)
+            for name in previous_dirs - current_dirs:
+                self._remove(connection, os.path.join(rel_dir, name))
+            connection.execute(
+                "DELETE FROM entries WHERE root_id = ? AND parent = ?",
+                (self._root_id, rel_dir),
+            )
+            connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                [(self._root_id, rel_dir, *entry) for entry in entries],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                (self._root_id, rel_dir, mtime),
+            )
+
+    def _remove(self, connection, rel_dir):
+        # Drop a directory and all its subdirectories from the index, "0" follows "/".
+        # Returns the number of removed rows
+        removed = 0
+        for table, column in (("directories", "path"), ("entries", "parent")):
+            if rel_dir:
+                cursor = connection.execute(
+                    f"DELETE FROM {table} WHERE root_id = ? AND "
+                    f"({column} = ? OR ({column} >= ? AND {column} < ?))",
+                    (self._root_id, rel_dir, rel_dir + "/", rel_dir + "0"),
+                )
+            else:
+                cursor = connection.execute(
+                    f"DELETE FROM {table} WHERE root_id = ?", (self._root_id,)
+                )
+            removed += cursor.rowcount
+        return removed
@@ -0,0 +1,176 @@
+import os
+import threading
+
+from file_manager.dataset.file_dataset import NOT_ALLOWED_DIRECTORIES
+
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+# Time in ms during which a burst of file system events is coalesced into a single update
+WATCH_DEBOUNCE_MS = int(os.getenv("WATCH_DEBOUNCE_MS") or 2000)
+# Time in seconds between two scans of the directory modification times, when file system
+# events are not available
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL") or 5)
+
+
+def _is_ignored(rel_path):
+    return any(
+        part.startswith(".") or part in NOT_ALLOWED_DIRECTORIES
+        for part in rel_path.split(os.sep)
+    )
+
+
+class DirectoryWatcher:
+    def __init__(
+        self,
+        root,
+        directory_index,
+        debounce_ms=WATCH_DEBOUNCE_MS,
+        poll_interval=WATCH_POLL_INTERVAL,
+        force_polling=False,
+    ):
+        """
+        Background watcher of the directories under a root directory. File system events
+        (through the optional watchfiles package) or, as a fallback, directory
+        modification times are coalesced into batches of changed directories, which are
+        listed again in the directory index so that the next browse answers from it. The
+        generation of the watcher is the generation of the directory index, which is
+        shared by all the worker processes of the app
+        Args:
+            root:               Root directory
+            directory_index:    DirectoryIndex of the root directory, kept up to date
+            debounce_ms:        Time in ms during which a burst of events is coalesced
+            poll_interval:      Time in seconds between two scans of the modification
+                                times when polling, which coalesce the changes made in
+                                between
+            force_polling:      Poll the modification times even if watchfiles is
+                                installed, defaults to False
+        """
+        self.root = os.path.abspath(root)
+        self.directory_index = directory_index
+        self.debounce_ms = debounce_ms
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling or watchfiles is None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def generation(self):
+        return self.directory_index.generation()
+
+    def add_listener(self, listener):
+        """
+        Register a function that is called with the set of changed directories, relative
+        to the root, after each batch of changes
+        Args:
+            listener:       Function to call
+        """
+        self._listeners.append(listener)
+
+    def start(self):
+        """
+        Start watching in a daemon thread
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            target = self._poll if self.force_polling else self._watch
+            self._thread = threading.Thread(
+                target=target, name="file-manager-watcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching and wait for the watcher thread to exit
+        """
+        self._stop_event.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def changed_since(self, generation):
+        """
+        Check if changes were detected after a given generation
+        Args:
+            generation:     Generation previously returned by the watcher
+        Returns:
+            True if the directories changed since then
+        """
+        return self.generation != generation
+
+    def _notify(self, changed_dirs):
+        changed_dirs = {rel_dir for rel_dir in changed_dirs if not _is_ignored(rel_dir)}
+        if not changed_dirs:
+            return
+        for rel_dir in sorted(changed_dirs):
+            self.directory_index.listdir(rel_dir)
+        for listener in self._listeners:
+            listener(changed_dirs)
+
+    def _watch_filter(self, change, path):
+        rel_path = os.path.relpath(path, self.root)
+        return not rel_path.startswith("..") and not _is_ignored(rel_path)
+
+    def _parent_dir(self, path):
+        rel_dir = os.path.relpath(os.path.dirname(path), self.root)
+        return "" if rel_dir == "." else rel_dir
+
+    def _watch(self):
+        # watchfiles groups the events of a burst, for at most the debounce time
+        for changes in watchfiles.watch(
+            self.root,
+            watch_filter=self._watch_filter,
+            debounce=self.debounce_ms,
+            stop_event=self._stop_event,
+            raise_interrupt=False,
+        ):
+            self._notify({self._parent_dir(path) for _, path in changes})
+
+    def _scan_mtimes(self):
+        mtimes = {}
+        level = [""]
+        while level:
+            next_level = []
+            for rel_dir in level:
+                try:
+                    mtimes[rel_dir] = os.stat(
+                        os.path.join(self.root, rel_dir)
+                    ).st_mtime_ns
+                    with os.scandir(os.path.join(self.root, rel_dir)) as iterator:
+                        for entry in iterator:
+                            if (
+                                entry.is_dir()
+                                and not entry.name.startswith(".")
+                                and entry.name not in NOT_ALLOWED_DIRECTORIES
+                            ):
+                                next_level.append(os.path.join(rel_dir, entry.name))
+                except OSError:
+                    continue
+            level = next_level
+        return mtimes
+
+    def _poll(self):
+        # The changes made between two scans are coalesced into a single batch
+        mtimes = self._scan_mtimes()
+        while not self._stop_event.wait(self.poll_interval):
+            current = self._scan_mtimes()
+            changed_dirs = {
+                rel_dir
+                for rel_dir in current.keys() | mtimes.keys()
+                if current.get(rel_dir) != mtimes.get(rel_dir)
+            }
+            mtimes = current
+            # Removed directories are dropped from the index through their parent
+            self._notify(
+                {
+                    rel_dir if rel_dir in current else os.path.dirname(rel_dir)
+                    for rel_dir in changed_dirs
+                }
+            )
@@ -0,0 +1,343 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Default executor backend ("thread", "process" or "inline")
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND") or "thread"
+# Number of threads of the shared thread pool and of processes of the shared process pool
+EXECUTOR_MAX_WORKERS = int(
+    os.getenv("EXECUTOR_MAX_WORKERS") or min(32, (os.cpu_count() or 1) + 4)
+)
+PROCESS_MAX_WORKERS = int(os.getenv("PROCESS_MAX_WORKERS") or os.cpu_count() or 1)
+# Maximum number of workers, including the calling thread, used by a single map call
+EXECUTOR_REQUEST_LIMIT = int(os.getenv("EXECUTOR_REQUEST_LIMIT") or 8)
+# Arrays of at least this many bytes are returned by worker processes through shared memory
+SHARED_MEMORY_MIN_BYTES = int(os.getenv("SHARED_MEMORY_MIN_BYTES") or 2**20)
+
+SharedArray = namedtuple("SharedArray", ["name", "shape", "dtype"])
+
+
+def _to_shared(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    shared = SharedArray(shm.name, array.shape, array.dtype.str)
+    shm.close()
+    return shared
+
+
+def _from_shared(shared):
+    shm = shared_memory.SharedMemory(name=shared.name)
+    try:
+        return np.ndarray(shared.shape, dtype=shared.dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _release_shared(shared):
+    shm = shared_memory.SharedMemory(name=shared.name)
+    shm.close()
+    shm.unlink()
+
+
+def _release_futures(futures):
+    # Cancel the queued tasks, and free the shared memory of the ones that ran
+    for future in futures:
+        future.cancel()
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            continue
+        if isinstance(future.result(), SharedArray):
+            _release_shared(future.result())
+
+
+def _call_shared(fn, *args):
+    # Runs in the worker process, large arrays skip the pickling of the result
+    result = fn(*args)
+    if isinstance(result, np.ndarray) and result.nbytes >= SHARED_MEMORY_MIN_BYTES:
+        return _to_shared(result)
+    return result
+
+
+def _worker_pid(_):
+    return os.getpid()
+
+
+def _initialize_worker():
+    # Import the readers once per worker instead of on the first task
+    import file_manager.dataset.file_dataset  # noqa: F401
+
+
+def _ordered_results(results, errors):
+    # Raise the exceptions of the tasks when their results are reached, as Executor.map
+    for position, result in enumerate(results):
+        if position in errors:
+            raise errors[position]
+        yield result
+
+
+class InlineExecutor:
+    """
+    Executor that runs the tasks in the calling thread
+    """
+
+    def map(self, fn, *iterables, max_concurrency=None):
+        return iter([fn(*args) for args in zip(*iterables)])
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exception:
+            future.set_exception(exception)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+    def stats(self):
+        return {"max_workers": 1, "queued": 0, "active": 0}
+
+
+class ThreadExecutor:
+    def __init__(
+        self, max_workers=EXECUTOR_MAX_WORKERS, request_limit=EXECUTOR_REQUEST_LIMIT
+    ):
+        """
+        Bounded pool of threads shared across requests. The calling thread of map works
+        on its tasks too, so nested map calls on the same pool cannot deadlock when all
+        the threads are busy
+        Args:
+            max_workers:    Number of threads
+            request_limit:  Default maximum number of threads used by a single map call
+        """
+        self.max_workers = max_workers
+        self.request_limit = request_limit
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="file-manager"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _cancelled(self, future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(self._run, fn, *args, **kwargs)
+        future.add_done_callback(self._cancelled)
+        return future
+
+    def map(self, fn, *iterables, max_concurrency=None):
+        """
+        Run a function over iterables, with the calling thread and at most
+        max_concurrency - 1 threads of the pool
+        Args:
+            fn:                 Function to run
+            iterables:          Iterables of arguments
+            max_concurrency:    Maximum number of threads, defaults to request_limit
+        Returns:
+            Iterator over the results, in order
+        """
+        tasks = list(zip(*iterables))
+        results = [None] * len(tasks)
+        errors = {}
+        finished = [threading.Event() for _ in tasks]
+        positions = itertools.count()
+        positions_lock = threading.Lock()
+
+        def work():
+            while True:
+                with positions_lock:
+                    position = next(positions)
+                if position >= len(tasks):
+                    return
+                try:
+                    results[position] = fn(*tasks[position])
+                except Exception as exception:
+                    errors[position] = exception
+                finally:
+                    finished[position].set()
+
+        num_helpers = min(max_concurrency or self.request_limit, len(tasks)) - 1
+        helpers = [self.submit(work) for _ in range(max(0, num_helpers))]
+        work()
+        # Every task has been claimed, by this thread or by a running helper
+        for event in finished:
+            event.wait()
+        for helper in helpers:
+            helper.cancel()
+        return _ordered_results(results, errors)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """
+        Get the gauges of the pool
+        Returns:
+            Dictionary with the number of threads, queued tasks and running tasks
+        """
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+            }
+
+
+class ProcessExecutor:
+    def __init__(self, max_workers=PROCESS_MAX_WORKERS):
+        """
+        Pool of worker processes that are started once and kept warm across calls. Large
+        arrays are handed back to the caller through shared memory
+        Args:
+            max_workers:    Number of worker processes
+        """
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in start_methods else "spawn"
+        )
+        self.max_workers = max_workers
+        self._executor = ProcessPoolExecutor(
+            max_workers, mp_context=context, initializer=_initialize_worker
+        )
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def warm_up(self):
+        """
+        Start all the worker processes
+        """
+        list(self._executor.map(_worker_pid, range(self.max_workers)))
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._finished)
+        return future
+
+    def map(self, fn, *iterables, max_concurrency=None):
+        """
+        Run a function over iterables, with at most max_concurrency tasks in flight
+        Args:
+            fn:                 Function to run
+            iterables:          Iterables of arguments
+            max_concurrency:    Maximum number of tasks in flight, defaults to max_workers
+        Returns:
+            Iterator over the results, in order. Closing it early, or a task error,
+            cancels the tasks in flight and frees their shared memory
+        """
+        call = partial(_call_shared, fn)
+        tasks = zip(*iterables)
+        futures = deque(
+            self.submit(call, *args)
+            for args in itertools.islice(tasks, max_concurrency or self.max_workers)
+        )
+        try:
+            while futures:
+                result = futures.popleft().result()
+                for args in itertools.islice(tasks, 1):
+                    futures.append(self.submit(call, *args))
+                yield (
+                    _from_shared(result) if isinstance(result, SharedArray) else result
+                )
+        finally:
+            _release_futures(futures)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """
+        Get the gauges of the pool
+        Returns:
+            Dictionary with the number of processes, queued tasks and running tasks
+        """
+        with self._lock:
+            active = min(self.pending, self.max_workers)
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.pending - active,
+                "active": active,
+            }
+
+
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def get_executor(executor=None):
+    """
+    Get a shared executor, which is created on first use and reused across calls
+    Args:
+        executor:       Executor backend ("thread", "process" or "inline") or executor
+                        instance, defaults to EXECUTOR_BACKEND
+    Returns:
+        Executor
+    """
+    if executor is None:
+        executor = EXECUTOR_BACKEND
+    if not isinstance(executor, str):
+        return executor
+    with _EXECUTORS_LOCK:
+        if executor not in _EXECUTORS:
+            if executor == "thread":
+                _EXECUTORS[executor] = ThreadExecutor()
+            elif executor == "process":
+                _EXECUTORS[executor] = ProcessExecutor()
+                _EXECUTORS[executor].warm_up()
+            elif executor == "inline":
+                _EXECUTORS[executor] = InlineExecutor()
+            else:
+                raise ValueError(f"Unknown executor backend: {executor}")
+        return _EXECUTORS[executor]
+
+
+def executor_stats():
+    """
+    Get the gauges of the shared executors
+    Returns:
+        Dictionary of executor backend to its number of workers, queued and running tasks
+    """
+    with _EXECUTORS_LOCK:
+        executors = dict(_EXECUTORS)
+    return {name: executor.stats() for name, executor in executors.items()}
+
+
+def shutdown_executors(wait=True):
+    """
+    Shut down the shared executors
+    Args:
+        wait:           Wait for the pending tasks to finish, defaults to True
+    """
+    with _EXECUTORS_LOCK:
+        for executor in _EXECUTORS.values():
+            executor.shutdown(wait=wait)
+        _EXECUTORS.clear()
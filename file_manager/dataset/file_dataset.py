@@ -1,35 +1,42 @@
-import concurrent
-import glob
+import bisect
+import fnmatch
 import os
-from concurrent.futures import ThreadPoolExecutor
-from functools import reduce
+import re
+import time
+from functools import partial
 
 import numpy as np
+import tifffile
 from PIL import Image
 
-from file_manager.dataset.dataset import Dataset
+from file_manager.dataset.dataset import (
+    DEFAULT_THUMBNAIL_ENCODER,
+    THUMBNAIL_SIZE,
+    Dataset,
+    DatasetDiff,
+)
+from file_manager.dataset.directory_index import RACY_MTIME_NS
+from file_manager.dataset.executors import get_executor
+from file_manager.dataset.filename_list import FILENAMES_MODE, FilenameList
+from file_manager.dataset.thumbnail_store import THUMBNAIL_STORE
 
-# List of allowed and not allowed formats
+# List of allowed formats, matched case-insensitively
 FORMATS = [
-    "**/*.[pP][nN][gG]",
-    "**/*.[jJ][pP][gG]",
-    "**/*.[jJ][pP][eE][gG]",
-    "**/*.[tT][iI][fF]",
-    "**/*.[tT][iI][fF][fF]",
+    "**/*.png",
+    "**/*.jpg",
+    "**/*.jpeg",
+    "**/*.tif",
+    "**/*.tiff",
 ]
-NOT_ALLOWED_FORMATS = [
-    "**/__pycache__/**",
-    "**/.*",
-    "cache/",
-    "cache/**/",
-    "cache/**",
-    "tiled_local_copy/",
-    "**/tiled_local_copy/**",
-    "**/tiled_local_copy/**/",
-    "mlexchange_store/**/",
-    "mlexchange_store/**",
-    "labelmaker_outputs/**/",
-    "labelmaker_outputs/**",
+# Extensions of the files that are memory-mapped when their layout allows it
+TIFF_EXTENSIONS = (".tif", ".tiff")
+# Directories that are skipped while browsing, together with hidden files and directories
+NOT_ALLOWED_DIRECTORIES = [
+    "__pycache__",
+    "cache",
+    "tiled_local_copy",
+    "mlexchange_store",
+    "labelmaker_outputs",
 ]
 
 
@@ -39,25 +46,145 @@ class FileDataset(Dataset):
         uri,
         cumulative_data_count,
         filenames=[],
+        frame_counts=None,
+        formats=None,
+        directory_mtimes=None,
     ):
         """
         Definition of a file data set
+        Args:
+            uri:                    Data set URI
+            cumulative_data_count:  Cumulative data count
+            filenames:              List of filenames, kept as a read-only FilenameList
+                                    unless FILENAMES_MODE is list
+            frame_counts:           Number of frames of each file, None if every file
+                                    holds a single frame
+            formats:                List of glob patterns the filenames were browsed
+                                    with, used on refresh, defaults to None
+            directory_mtimes:       Modification times of the walked directories,
+                                    relative to the data set directory, so that refresh
+                                    only lists the directories that changed, defaults
+                                    to None
         """
         super().__init__(uri, cumulative_data_count)
         self.filenames = filenames
+        self.frame_counts = frame_counts
+        self.formats = formats
+        self.directory_mtimes = directory_mtimes
         pass
 
-    def to_dict(self):
+    @property
+    def filenames(self):
+        return self._filenames
+
+    @filenames.setter
+    def filenames(self, filenames):
+        if FILENAMES_MODE != "list":
+            self._filenames = FilenameList.from_dict(filenames)
+        elif isinstance(filenames, list):
+            self._filenames = filenames
+        else:
+            self._filenames = list(FilenameList.from_dict(filenames))
+        self._filename_positions = None
+
+    def filename_list(self):
+        """
+        Get the filenames as a FilenameList, e.g. to serialize them
+        Returns:
+            FilenameList
+        """
+        return FilenameList.from_dict(self._filenames)
+
+    def _filename_index(self, filename):
+        """
+        Get the index of a filename with a hash lookup
+        Args:
+            filename:     Filename relative to the dataset URI
+        Returns:
+            Index of the filename
+        """
+        if isinstance(self._filenames, FilenameList):
+            return self._filenames.index(filename)
+        # Plain lists can be modified in place, the positions are checked before use
+        if self._filename_positions is None:
+            positions = {}
+            for position, name in enumerate(self._filenames):
+                positions.setdefault(name, position)
+            self._filename_positions = positions
+        position = self._filename_positions.get(filename)
+        if (
+            position is not None
+            and position < len(self._filenames)
+            and self._filenames[position] == filename
+        ):
+            return position
+        return self._filenames.index(filename)
+
+    @property
+    def frame_counts(self):
+        return self._frame_counts
+
+    @frame_counts.setter
+    def frame_counts(self, frame_counts):
+        if frame_counts is None:
+            self._frame_counts = None
+            self._frame_offsets = None
+        else:
+            self._frame_counts = np.asarray(frame_counts, dtype=np.int64)
+            self._frame_offsets = np.cumsum(self._frame_counts)
+
+    @property
+    def num_frames(self):
+        if self._frame_offsets is None:
+            return len(self.filenames)
+        return int(self._frame_offsets[-1]) if len(self._frame_offsets) > 0 else 0
+
+    def _locate_frames(self, indices):
+        """
+        Find the file and page of each frame
+        Args:
+            indices:            List of frame indices within the data set
+        Returns:
+            file_indices:       List of indices of the files
+            pages:              List of pages within the files
+        """
+        if self._frame_offsets is None:
+            return list(indices), [0] * len(indices)
+        indices = np.asarray(indices, dtype=np.int64)
+        file_indices = np.searchsorted(self._frame_offsets, indices, side="right")
+        pages = (
+            indices
+            - self._frame_offsets[file_indices]
+            + self._frame_counts[file_indices]
+        )
+        return file_indices.tolist(), pages.tolist()
+
+    def to_dict(self, filenames_mode=None):
         """
         Convert to dictionary
+        Args:
+            filenames_mode:     Serialization of the filenames, "list", "compact" or
+                                "reference", defaults to FILENAMES_MODE
         Returns:
             Dictionary
         """
-        return {
+        dataset_dict = {
             "uri": self.uri,
             "cumulative_data_count": self.cumulative_data_count,
-            "filenames": self.filenames,
+            "filenames": (
+                self._filenames
+                if (filenames_mode or FILENAMES_MODE) == "list"
+                and isinstance(self._filenames, list)
+                else self.filename_list().to_dict(filenames_mode)
+            ),
         }
+        if self.frame_counts is not None:
+            dataset_dict["frame_counts"] = self.frame_counts.tolist()
+        if self.formats is not None:
+            dataset_dict["formats"] = self.formats
+        if self.directory_mtimes is not None:
+            dataset_dict["directory_mtimes"] = self.directory_mtimes
+        return dataset_dict
 
     @classmethod
     def from_dict(cls, dataset_dict):
@@ -65,36 +192,416 @@ class FileDataset(Dataset):
             dataset_dict["uri"],
             dataset_dict["cumulative_data_count"],
             dataset_dict["filenames"],
+            frame_counts=dataset_dict.get("frame_counts"),
+            formats=dataset_dict.get("formats"),
+            directory_mtimes=dataset_dict.get("directory_mtimes"),
         )
 
+    def _browse_formats(self):
+        if self.formats is not None:
+            return self.formats
+        # Data sets saved without their formats were browsed by extension
+        extensions = {
+            os.path.splitext(filename)[1].lower() for filename in self.filenames
+        }
+        return sorted(f"**/*{extension}" for extension in extensions if extension)
+
+    def refresh(self, root_uri, offset=0, directory_index=None):
+        """
+        Rescan the directory of the data set and update its filenames, frame counts and
+        cumulative data count in place. Only the directories whose modification time
+        changed since the last scan are listed again, and only their TIFF files are
+        counted again, or every TIFF file whose size or modification time changed with a
+        directory index. Data sets browsed without directory modification times are
+        rescanned entirely
+        Args:
+            root_uri:           Root directory
+            offset:             Cumulative data count of the previous data sets,
+                                defaults to 0
+            directory_index:    DirectoryIndex used to answer the listings, defaults to None
+        Returns:
+            DatasetDiff with the added and removed filenames
+        """
+        dataset_path = os.path.join(root_uri, self.uri)
+        if len(self.filenames) == 0 and not os.path.isdir(dataset_path):
+            # Single file data sets have no listing to refresh
+            self.directory_mtimes = None
+            self.cumulative_data_count = offset + self.num_frames
+            return DatasetDiff(self.uri, [], [], self.num_frames)
+        if self.directory_mtimes is None or not os.path.isdir(dataset_path):
+            added, removed = self._refresh_all(root_uri, directory_index)
+        else:
+            added, removed = self._refresh_changed(root_uri, directory_index)
+        self.cumulative_data_count = offset + self.num_frames
+        return DatasetDiff(self.uri, added, removed, self.num_frames)
+
+    def _refresh_all(self, root_uri, directory_index):
+        """
+        Rescan every directory of the data set
+        Args:
+            root_uri:           Root directory
+            directory_index:    DirectoryIndex used to answer the listings
+        Returns:
+            added:              Sorted list of added filenames
+            removed:            Sorted list of removed filenames
+        """
+        stats = {}
+        mtimes = {}
+        paths = self._dataset_filepaths(
+            root_uri,
+            self.uri,
+            self._browse_formats(),
+            True,
+            directory_index,
+            stats,
+            mtimes,
+        )
+        # Data sets whose directory was removed are rescanned entirely until it is back
+        self.directory_mtimes = mtimes if paths is not None else None
+        paths = paths or []
+        frame_counts = self._dataset_frame_counts(
+            root_uri, self.uri, paths, directory_index, stats
+        )
+
+        previous = set(self.filenames)
+        current = set(paths)
+        added = [path for path in paths if path not in previous]
+        removed = sorted(previous - current)
+        if (
+            added
+            or removed
+            or not np.array_equal(
+                frame_counts if frame_counts is not None else [],
+                self.frame_counts if self.frame_counts is not None else [],
+            )
+        ):
+            self.filenames = paths
+            self.frame_counts = frame_counts
+        return added, removed
+
+    @staticmethod
+    def _direct_filenames(filenames, rel_dir):
+        """
+        Find the filenames that are directly in a directory, skipping the files of its
+        subdirectories with a binary search
+        Args:
+            filenames:          Sorted list of filenames
+            rel_dir:            Directory relative to the data set directory
+        Returns:
+            List of (position, filename)
+        """
+        # The paths under a directory are contiguous once sorted, as "0" follows "/"
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        position = bisect.bisect_left(filenames, prefix)
+        stop = (
+            bisect.bisect_left(filenames, rel_dir + "0") if rel_dir else len(filenames)
+        )
+        direct = []
+        while position < stop:
+            filename = filenames[position]
+            name, separator, _ = filename[len(prefix) :].partition("/")
+            if separator:
+                position = bisect.bisect_left(
+                    filenames, f"{prefix}{name}0", position, stop
+                )
+            else:
+                direct.append((position, filename))
+                position += 1
+        return direct
+
+    def _refresh_changed(self, root_uri, directory_index):
+        """
+        List again the directories whose modification time changed, walk their new
+        subdirectories and drop the removed ones. TIFF stacks rewritten in place do not
+        change the modification time of their directory, so the frames of every TIFF
+        file are counted again when a directory index validates the cached counts
+        Args:
+            root_uri:           Root directory
+            directory_index:    DirectoryIndex used to answer the listings
+        Returns:
+            added:              Sorted list of added filenames
+            removed:            Sorted list of removed filenames
+        """
+        dataset_path = os.path.join(root_uri, self.uri)
+        changed_dirs = []
+        removed_dirs = []
+        for rel_dir, mtime in self.directory_mtimes.items():
+            try:
+                current_mtime = os.stat(os.path.join(dataset_path, rel_dir)).st_mtime_ns
+            except OSError:
+                removed_dirs.append(rel_dir)
+                continue
+            if mtime == -1 or current_mtime != mtime:
+                changed_dirs.append(rel_dir)
+        if not changed_dirs and not removed_dirs and directory_index is None:
+            return [], []
+
+        filenames = self.filenames
+        mtimes = dict(self.directory_mtimes)
+        removed_positions = set()
+        for rel_dir in removed_dirs:
+            removed_positions.update(
+                range(
+                    bisect.bisect_left(filenames, f"{rel_dir}/"),
+                    bisect.bisect_left(filenames, f"{rel_dir}0"),
+                )
+            )
+            mtimes.pop(rel_dir, None)
+
+        listdir = self._listdir_function(dataset_path, directory_index)
+        root_node = self._compile_patterns(self._browse_formats())
+        known_dirs = set(mtimes)
+        stats = {}
+        added = set()
+        counted = set()
+        for rel_dir in changed_dirs:
+            level = [
+                (rel_dir, node) for node in self._pattern_nodes(root_node, rel_dir)
+            ]
+            # New subdirectories are walked entirely, known ones only if they changed
+            current = self._walk_level(
+                dataset_path, level, listdir, stats, mtimes, known_dirs
+            )
+            previous = {}
+            for position, filename in self._direct_filenames(filenames, rel_dir):
+                previous[filename] = position
+                if filename not in current:
+                    removed_positions.add(position)
+            added.update(path for path in current if path not in previous)
+            counted.update(path for path in current if path in previous)
+        self.directory_mtimes = mtimes
+        if directory_index is not None:
+            counted.update(
+                filename
+                for position, filename in enumerate(filenames)
+                if position not in removed_positions
+                and filename.lower().endswith(TIFF_EXTENSIONS)
+            )
+
+        # Only the TIFF files of the changed directories are counted again, or the ones
+        # whose size or modification time changed with a directory index
+        counted = sorted(counted | added)
+        counts = self._dataset_frame_counts(
+            root_uri, self.uri, counted, directory_index, stats
+        )
+        if counts is None:
+            counts = np.ones(len(counted), dtype=np.int64)
+        previous_counts = (
+            self.frame_counts
+            if self.frame_counts is not None
+            else np.ones(len(filenames), dtype=np.int64)
+        )
+        removed = sorted(filenames[position] for position in removed_positions)
+        if removed_positions or added:
+            kept = [
+                filename
+                for position, filename in enumerate(filenames)
+                if position not in removed_positions
+            ]
+            frame_counts = np.delete(previous_counts, sorted(removed_positions))
+            added = sorted(added)
+            insert_positions = [bisect.bisect_left(kept, path) for path in added]
+            merged = []
+            start = 0
+            for position, path in zip(insert_positions, added):
+                merged.extend(kept[start:position])
+                merged.append(path)
+                start = position
+            merged.extend(kept[start:])
+            frame_counts = np.insert(frame_counts, insert_positions, 1)
+        else:
+            added = []
+            merged = filenames
+            frame_counts = previous_counts.copy()
+        frame_counts[[bisect.bisect_left(merged, path) for path in counted]] = counts
+        if removed or added:
+            self.filenames = merged
+        if removed or added or not np.array_equal(frame_counts, previous_counts):
+            self.frame_counts = None if np.all(frame_counts == 1) else frame_counts
+        return added, removed
+
+    @staticmethod
+    def _count_frames(file_path):
+        """
+        Count the frames of an image file, reading only the TIFF page headers
+        Args:
+            file_path:         Path to the image
+        Returns:
+            Number of frames
+        """
+        if not file_path.lower().endswith(TIFF_EXTENSIONS):
+            return 1
+        try:
+            with tifffile.TiffFile(file_path) as tif:
+                return max(1, len(tif.pages))
+        except (OSError, ValueError):
+            return 1
+
+    @staticmethod
+    def _open_image(file_path, page=0):
+        """
+        Open a page of an image, memory-mapping uncompressed TIFF pages and decoding
+        compressed TIFF and other files with PIL, seeking to the page without decoding
+        the previous ones
+        Args:
+            file_path:         Path to the image
+            page:              Page of the image, defaults to 0
+        Returns:
+            Array in the data type of the file, a read-only memmap for uncompressed TIFFs
+        """
+        if file_path.lower().endswith(TIFF_EXTENSIONS):
+            try:
+                return tifffile.memmap(file_path, page=page, mode="r")
+            except (OSError, ValueError):
+                # Compressed, tiled or non-contiguous image data
+                pass
+        with Image.open(file_path) as img:
+            if page > 0:
+                img.seek(page)
+            return np.array(img)
+
+    @staticmethod
+    def _reduction_factor(size, thumbnail_size=THUMBNAIL_SIZE):
+        """
+        Largest integer reduction factor that keeps the image at least as large as the
+        thumbnail
+        Args:
+            size:              Size of the image (width, height)
+            thumbnail_size:    Size of the thumbnail (width, height)
+        Returns:
+            Reduction factor
+        """
+        return max(1, min(size[0] // thumbnail_size[0], size[1] // thumbnail_size[1]))
+
+    @classmethod
+    def _open_thumbnail(cls, file_path, page=0, thumbnail_size=THUMBNAIL_SIZE):
+        """
+        Open a page of an image at a reduced resolution that still covers the thumbnail,
+        decoding as few pixels as the format allows: the smallest large enough level of
+        pyramidal TIFFs, strided reads of memory-mapped TIFFs, DCT scaling of JPEGs, and
+        a box reduction after decoding otherwise
+        Args:
+            file_path:         Path to the image
+            page:              Page of the image, defaults to 0
+            thumbnail_size:    Size of the thumbnail (width, height)
+        Returns:
+            Array in the data type of the file
+        """
+        reduction_factor = partial(cls._reduction_factor, thumbnail_size=thumbnail_size)
+        if file_path.lower().endswith(TIFF_EXTENSIONS):
+            if page == 0:
+                with tifffile.TiffFile(file_path) as tif:
+                    levels = tif.series[0].levels if tif.series else []
+                    # Smallest reduced-resolution level of pyramidal TIFFs that covers
+                    # the thumbnail
+                    for level in reversed(levels[1:]):
+                        height, width = level.shape[:2]
+                        if width >= thumbnail_size[0] and height >= thumbnail_size[1]:
+                            factor = reduction_factor((width, height))
+                            return np.ascontiguousarray(
+                                level.asarray()[::factor, ::factor]
+                            )
+            try:
+                image = tifffile.memmap(file_path, page=page, mode="r")
+                factor = reduction_factor((image.shape[1], image.shape[0]))
+                return np.ascontiguousarray(image[::factor, ::factor])
+            except (OSError, ValueError):
+                # Compressed, tiled or non-contiguous image data
+                pass
+        with Image.open(file_path) as img:
+            if page > 0:
+                img.seek(page)
+            factor = reduction_factor(img.size)
+            if factor > 1 and img.format == "JPEG":
+                # Decode at 1/2, 1/4 or 1/8 of the resolution
+                img.draft(img.mode, (img.size[0] // factor, img.size[1] // factor))
+                factor = reduction_factor(img.size)
+            if factor == 1:
+                return np.array(img)
+            try:
+                return np.array(img.reduce(factor))
+            except ValueError:
+                # Modes that PIL cannot reduce, such as 16-bit grayscale
+                return np.ascontiguousarray(np.array(img)[::factor, ::factor])
+
     @classmethod
     def _read_data_point(
         cls,
         root_uri,
         filename,
+        page=0,
         export="base64",
         resize=True,
         log=False,
         percentiles=[0, 100],
+        encoder=None,
     ):
         """
         Read data point
         Args:
             root_uri:          Root URI from which data should be retrieved
             filename:          Filename of the image to retrieve
+            page:              Page of the image to retrieve, defaults to 0
             export:            Export format, defaults to base64
             resize:            Resize image to 200x200, defaults to True
             log:               Apply log to the images, defaults to False
             percentiles:       Percentiles for normalization, defaults to [0, 100]
+            encoder:           ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
         Returns:
-            Base64/PIL image
-            Dataset URI
+            Base64/PIL image or array in the data type of the file
         """
+        encoder = encoder or DEFAULT_THUMBNAIL_ENCODER
         file_path = os.path.join(root_uri, filename)
-        img = Image.open(file_path)
+        if export == "raw":
+            return cls._open_image(file_path, page)
+        if resize:
+            # Thumbnails are normalized after the reduction
+            img = cls._open_thumbnail(file_path, page, encoder.size)
+        else:
+            img = cls._open_image(file_path, page)
+        # Normalize in place in the float32 copy
         img = np.array(img, dtype=np.float32)
-        img = cls._process_image(img, log, resize, export, percentiles)
-        return img
+        img = cls._normalize_batch(img[np.newaxis], log, percentiles)[0]
+        return cls._export_image(img, resize, export, encoder)
+
+    def is_cached(
+        self,
+        root_uri,
+        indices,
+        export="base64",
+        resize=True,
+        log=False,
+        percentiles=[0, 100],
+        encoder=None,
+        **kwargs,
+    ):
+        """
+        Check which frames are in the thumbnail cache for the given read parameters
+        Args:
+            root_uri:          Root URI from which data should be retrieved
+            indices:           List of indexes of the frames
+            export:            Export format, defaults to base64
+            resize:            Resize images, defaults to True
+            log:               Apply log to the images, defaults to False
+            percentiles:       Percentiles for normalization, defaults to [0, 100]
+            encoder:           ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+        Returns:
+            List of flags, True where the frame is cached
+        """
+        file_indices, pages = self._locate_frames(indices)
+        filenames = [self.uri + "/" + self.filenames[i] for i in file_indices]
+        return self._is_cached(
+            [
+                (f"{root_uri}/{filename}", page)
+                for filename, page in zip(filenames, pages)
+            ],
+            log,
+            resize,
+            export,
+            percentiles,
+            encoder=encoder,
+            versions=self._source_versions(root_uri, filenames),
+        )
 
     def read_data(
         self,
@@ -105,61 +612,166 @@ class FileDataset(Dataset):
         log=False,
         just_uri=False,
         percentiles=[0, 100],
+        executor=None,
+        encoder=None,
         **kwargs,
     ):
         """
         Read data set
         Args:
             root_uri:          Root URI from which data should be retrieved
-            indices:           List of indexes of the images to retrieve
-            export:            Export format, defaults to base64
+            indices:           List of indexes of the frames to retrieve
+            export:            Export format (base64, bytes, pillow or raw), defaults to
+                               base64
             resize:            Resize images, defaults to True
             log:               Apply log to the images, defaults to False
             just_uri:          Return only the uri, defaults to False
             percentiles:       Percentiles for normalization, defaults to [0, 100]
+            executor:          Executor backend or instance used to decode and encode the
+                               images, defaults to the shared EXECUTOR_BACKEND executor
+            encoder:           ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
         Returns:
-            Base64/PIL image
+            Base64/PIL image or array in the data type of the file
             Dataset URI
         """
-        results = []
-        # Filter filenames to process based on indices, ensuring they are within bounds
+        # Filter indices to process, ensuring they are within bounds
+        indices = [i for i in indices if i < self.num_frames]
+        file_indices, pages = self._locate_frames(indices)
         filenames_to_process = [
-            self.uri + "/" + self.filenames[i]
-            for i in indices
-            if i < len(self.filenames)
+            self.uri + "/" + self.filenames[i] for i in file_indices
+        ]
+        uris = [
+            (
+                f"{root_uri}/{filename}?page={page}"
+                if self.frame_counts is not None and self.frame_counts[file_index] > 1
+                else f"{root_uri}/{filename}"
+            )
+            for filename, file_index, page in zip(
+                filenames_to_process, file_indices, pages
+            )
         ]
 
         if just_uri:
-            return [f"{root_uri}/{filename}" for filename in filenames_to_process]
-
-        thread_indexes = []
-        # Use ThreadPoolExecutor to read files in parallel
-        with ThreadPoolExecutor() as executor:
-            future_to_index = {
-                executor.submit(
-                    self._read_data_point,
-                    root_uri,
-                    filename,
-                    export,
-                    resize,
-                    log,
-                    percentiles=percentiles,
-                ): index
-                for index, filename in enumerate(filenames_to_process)
-            }
-
-            for future in concurrent.futures.as_completed(future_to_index):
-                thread_index = future_to_index[future]
-                result = future.result()
-                results.append(result)
-                thread_indexes.append(thread_index)
-
-        ordered_results = [
-            results[thread_indexes.index(i)] for i in range(len(indices))
+            return uris
+
+        sources = [
+            (f"{root_uri}/{filename}", page)
+            for filename, page in zip(filenames_to_process, pages)
+        ]
+        versions = self._source_versions(root_uri, filenames_to_process)
+        results, cache_keys = self._read_cached(
+            sources,
+            log,
+            resize,
+            export,
+            percentiles,
+            encoder=encoder,
+            versions=versions,
+        )
+        missing = [
+            position for position, result in enumerate(results) if result is None
         ]
-        return ordered_results, [
-            f"{root_uri}/{filename}" for filename in filenames_to_process
+
+        # Serve the precomputed thumbnails of unchanged files from the store
+        to_read = missing
+        if missing and THUMBNAIL_STORE.serves(log, resize, export, percentiles):
+            stored = self._read_stored(
+                [sources[position] for position in missing],
+                [versions[position] for position in missing],
+                export,
+                encoder=encoder,
+            )
+            for position, result in zip(missing, stored):
+                results[position] = result
+            to_read = [position for position in missing if results[position] is None]
+
+        # Read the files that are not cached in parallel
+        missing_results = get_executor(executor).map(
+            partial(
+                self._read_data_point,
+                root_uri,
+                export=export,
+                resize=resize,
+                log=log,
+                percentiles=percentiles,
+                encoder=encoder,
+            ),
+            [filenames_to_process[position] for position in to_read],
+            [pages[position] for position in to_read],
+        )
+        for position, result in zip(to_read, missing_results):
+            results[position] = result
+
+        self._write_cached(cache_keys, results, missing)
+        return results, uris
+
+    def source_versions(self, root_uri, indices):
+        """
+        Versions of the files of frames, which change when a file is modified
+        Args:
+            root_uri:          Root URI of the files
+            indices:           List of indexes of the frames
+        Returns:
+            List of (modification time, size) pairs, None where the file is missing
+        """
+        file_indices, _ = self._locate_frames(indices)
+        return self._source_versions(
+            root_uri, [self.uri + "/" + self.filenames[i] for i in file_indices]
+        )
+
+    @staticmethod
+    def _source_versions(root_uri, filenames):
+        """
+        Versions of the files, used to validate their cached and stored thumbnails
+        Args:
+            root_uri:          Root URI of the files
+            filenames:         List of filenames relative to the root URI
+        Returns:
+            List of (modification time, size) pairs, None where the file is missing
+        """
+        versions = []
+        for filename in filenames:
+            try:
+                stat = os.stat(os.path.join(root_uri, filename))
+                versions.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                versions.append(None)
+        return versions
+
+    def build_thumbnails(self, root_uri, indices, encoders, executor=None, **kwargs):
+        """
+        Precompute the thumbnails of frames in the thumbnail store, skipping the ones
+        that are already stored for the current version of their file
+        Args:
+            root_uri:          Root URI from which data should be retrieved
+            indices:           List of indexes of the frames
+            encoders:          List of ThumbnailEncoder, one per level, from the largest
+                               to the smallest level
+            executor:          Executor backend or instance used to decode and encode the
+                               images, defaults to the shared EXECUTOR_BACKEND executor
+        Returns:
+            Number of stored thumbnails
+        """
+        file_indices, pages = self._locate_frames(
+            [i for i in indices if i < self.num_frames]
+        )
+        filenames = [self.uri + "/" + self.filenames[i] for i in file_indices]
+        sources = [
+            (f"{root_uri}/{filename}", page) for filename, page in zip(filenames, pages)
         ]
+        versions = self._source_versions(root_uri, filenames)
+        positions, levels = self._missing_levels(sources, versions, encoders)
+        if len(positions) == 0:
+            return 0
+        # Each frame is decoded and normalized once, at the largest level
+        images = get_executor(executor).map(
+            partial(
+                self._read_data_point, root_uri, export="pillow", encoder=encoders[0]
+            ),
+            [filenames[position] for position in positions],
+            [pages[position] for position in positions],
+        )
+        return self._store_levels(list(images), positions, levels, encoders, executor)
 
     def get_uri_index(self, uri):
         """
@@ -169,8 +781,268 @@ class FileDataset(Dataset):
         Returns:
             Index of the URI
         """
+        uri, _, page = uri.partition("?page=")
         filename = uri.split(self.uri, 1)[-1]
-        return self.filenames.index(filename[1:])
+        return self.get_frame_index(filename[1:], int(page or 0))
+
+    def get_frame_index(self, filename, page=0):
+        """
+        Get index of a frame of a file
+        Args:
+            filename:     Filename relative to the dataset URI
+            page:         Page of the frame within the file, defaults to 0
+        Returns:
+            Index of the frame
+        """
+        file_index = self._filename_index(filename)
+        if self._frame_offsets is None:
+            return file_index
+        if not 0 <= page < self._frame_counts[file_index]:
+            raise ValueError(f"Page {page} is out of range for {filename}")
+        return (
+            int(self._frame_offsets[file_index] - self._frame_counts[file_index]) + page
+        )
+
+    @staticmethod
+    def _scandir(path):
+        with os.scandir(path) as iterator:
+            return [(entry.name, entry.is_dir()) for entry in iterator]
+
+    @staticmethod
+    def _listdir_function(dataset_path, directory_index=None):
+        """
+        Build the listing function of a walk, answered by the directory index when the
+        data set is under its root
+        Args:
+            dataset_path:       Directory of the data set
+            directory_index:    DirectoryIndex used to answer the listings, defaults to None
+        Returns:
+            Function that lists a directory as (name, is_dir, (size, mtime)) tuples, with
+            None stats when they are not known from the listing
+        """
+        rel_dir = None
+        if directory_index is not None:
+            rel_dir = os.path.relpath(dataset_path, directory_index.root)
+        if rel_dir is None or rel_dir.startswith(".."):
+
+            def listdir(path):
+                return [
+                    (name, is_dir, None) for name, is_dir in FileDataset._scandir(path)
+                ]
+
+        else:
+
+            def listdir(path):
+                rel_path = os.path.join(rel_dir, os.path.relpath(path, dataset_path))
+                return [
+                    (name, is_dir, (size, mtime))
+                    for name, is_dir, size, mtime in directory_index.listdir(rel_path)
+                ]
+
+        return listdir
+
+    @staticmethod
+    def _compile_patterns(patterns):
+        """
+        Merge glob patterns into a tree of path components, where each node matches the
+        names that end a pattern with a single regular expression
+        Args:
+            patterns:           List of glob patterns, matched case-insensitively
+        Returns:
+            Root node, as a (match_any, match_dir, children) tuple
+        """
+        tree = {"children": {}, "any": [], "dirs": []}
+        for pattern in patterns:
+            parts = [part for part in pattern.split("/") if part]
+            node = tree
+            for part in parts[:-1]:
+                node = node["children"].setdefault(
+                    part, {"children": {}, "any": [], "dirs": []}
+                )
+            node["dirs" if pattern.endswith("/") else "any"].append(parts[-1])
+
+        def compile_node(node):
+            def compile_parts(parts):
+                if len(parts) == 0:
+                    return None
+                regex = "|".join(fnmatch.translate(part) for part in parts)
+                return re.compile(regex, re.IGNORECASE).match
+
+            return (
+                compile_parts(node["any"]),
+                compile_parts(node["dirs"]),
+                [
+                    (compile_parts([part]), compile_node(child))
+                    for part, child in node["children"].items()
+                ],
+            )
+
+        return compile_node(tree)
+
+    @staticmethod
+    def _pattern_nodes(root_node, rel_dir):
+        """
+        Find the nodes of the pattern tree reached by a directory
+        Args:
+            root_node:          Root node of the pattern tree
+            rel_dir:            Directory relative to the data set directory
+        Returns:
+            List of nodes
+        """
+        nodes = [root_node]
+        for name in rel_dir.split("/") if rel_dir else []:
+            nodes = [
+                child
+                for _, _, children in nodes
+                for match_child, child in children
+                if match_child(name)
+            ]
+        return nodes
+
+    @staticmethod
+    def _walk_level(
+        dataset_path, level, listdir, stats=None, mtimes=None, known_dirs=None
+    ):
+        """
+        Walk the directories of a level and their subdirectories, matching their entries
+        with the nodes of the pattern tree they reached, and pruning hidden and not
+        allowed directories before descending into them
+        Args:
+            dataset_path:       Directory of the data set
+            level:              List of (directory, node) to visit, with directories
+                                relative to dataset_path
+            listdir:            Listing function returned by _listdir_function
+            stats:              Dictionary filled with the (size, mtime) of the matching
+                                files listed by the directory index, defaults to None
+            mtimes:             Dictionary filled with the modification time of each
+                                listed directory, -1 when it is too recent to be
+                                trusted, defaults to None
+            known_dirs:         Subdirectories that are not descended into, defaults to
+                                None
+        Returns:
+            Set of matching paths relative to dataset_path
+        """
+        paths = set()
+        while level:
+            next_level = []
+            for rel_path, (match_any, match_dir, children) in level:
+                path = os.path.join(dataset_path, rel_path)
+                if mtimes is not None:
+                    # The directory is stat'ed before it is listed, so that later changes
+                    # are detected on refresh
+                    try:
+                        mtime = os.stat(path).st_mtime_ns
+                    except OSError:
+                        continue
+                    if time.time_ns() - mtime < RACY_MTIME_NS:
+                        mtime = -1
+                    mtimes[rel_path] = mtime
+                for name, is_dir, stat in listdir(path):
+                    if name.startswith(".") or name in NOT_ALLOWED_DIRECTORIES:
+                        continue
+                    child_path = f"{rel_path}/{name}" if rel_path else name
+                    if match_any is not None and match_any(name):
+                        paths.add(child_path)
+                        if stats is not None and stat is not None and not is_dir:
+                            stats[child_path] = stat
+                    elif is_dir and match_dir is not None and match_dir(name):
+                        paths.add(child_path)
+                    if is_dir and (known_dirs is None or child_path not in known_dirs):
+                        for match_child, child in children:
+                            if match_child(name):
+                                next_level.append((child_path, child))
+            level = next_level
+        return paths
+
+    @staticmethod
+    def _walk_paths(
+        dataset_path, patterns, directory_index=None, stats=None, mtimes=None
+    ):
+        """
+        Find the paths that match a list of non-recursive glob patterns in a single walk
+        Args:
+            dataset_path:       Directory in which the patterns are matched
+            patterns:           List of glob patterns, matched case-insensitively
+            directory_index:    DirectoryIndex used to answer the listings, defaults to None
+            stats:              Dictionary filled with the (size, mtime) of the matching
+                                files listed by the directory index, defaults to None
+            mtimes:             Dictionary filled with the modification time of each
+                                listed directory, defaults to None
+        Returns:
+            Set of matching paths relative to dataset_path
+        """
+        return FileDataset._walk_level(
+            dataset_path,
+            [("", FileDataset._compile_patterns(patterns))],
+            FileDataset._listdir_function(dataset_path, directory_index),
+            stats=stats,
+            mtimes=mtimes,
+        )
+
+    @staticmethod
+    def _dataset_filepaths(
+        directory, dataset, formats, sort, directory_index, stats=None, mtimes=None
+    ):
+        dataset_path = os.path.join(directory, dataset)
+        if not os.path.isdir(dataset_path):
+            return None
+        paths = list(
+            FileDataset._walk_paths(
+                dataset_path, formats, directory_index, stats, mtimes
+            )
+        )
+        if sort:
+            paths.sort()
+        return paths
+
+    @staticmethod
+    def _dataset_frame_counts(directory, dataset, paths, directory_index, stats=None):
+        """
+        Count the frames of the files of a data set. Only TIFF files can hold several
+        frames, the other files are not accessed
+        Args:
+            directory:          Root directory
+            dataset:            Data set directory relative to the root directory
+            paths:              List of file paths relative to the data set directory
+            directory_index:    DirectoryIndex used to cache the counts, defaults to None
+            stats:              Dictionary of the (size, mtime) of the files listed by
+                                the directory index, defaults to None
+        Returns:
+            Array of frame counts, None if every file holds a single frame
+        """
+        if paths is None:
+            return None
+        tiff_positions = [
+            position
+            for position, path in enumerate(paths)
+            if path.lower().endswith(TIFF_EXTENSIONS)
+        ]
+        if len(tiff_positions) == 0:
+            return None
+        tiff_paths = [paths[position] for position in tiff_positions]
+        dataset_path = os.path.join(directory, dataset)
+        rel_dir = None
+        if directory_index is not None:
+            rel_dir = os.path.relpath(dataset_path, directory_index.root)
+        if rel_dir is None or rel_dir.startswith(".."):
+            tiff_counts = get_executor("thread").map(
+                FileDataset._count_frames,
+                [os.path.join(dataset_path, path) for path in tiff_paths],
+            )
+        else:
+            stats = stats or {}
+            tiff_counts = directory_index.frame_counts(
+                [os.path.normpath(os.path.join(rel_dir, path)) for path in tiff_paths],
+                FileDataset._count_frames,
+                stats=[stats.get(path) for path in tiff_paths],
+            )
+        counts = np.ones(len(paths), dtype=np.int64)
+        counts[tiff_positions] = np.fromiter(
+            tiff_counts, dtype=np.int64, count=len(tiff_positions)
+        )
+        if np.all(counts == 1):
+            return None
+        return counts
 
     @staticmethod
     def filepaths_from_directory(
@@ -178,6 +1050,10 @@ class FileDataset(Dataset):
         formats=FORMATS,
         selected_sub_uris=[""],
         sort=True,
+        directory_index=None,
+        max_workers=None,
+        count_frames=False,
+        directory_mtimes=False,
     ):
         """
         Retrieve a list of filepaths from a given directory
@@ -186,62 +1062,97 @@ class FileDataset(Dataset):
             formats:            List of file formats/extensions of interest, defaults to FORMATS
             selected_sub_uris:  List of selected sub uris, defaults to None
             sort:               Sort output list of filepaths, defaults to True
+            directory_index:    DirectoryIndex used to answer the listings, defaults to None
+            max_workers:        Number of sub uris walked in parallel, defaults to None
+            count_frames:       Count the frames of multi-page files, so that the
+                                cumulative data counts are in frames, defaults to False
+            directory_mtimes:   Record the modification times of the walked directories
+                                of each sub uri, for incremental refreshes, defaults to
+                                False
         Returns:
             paths:              List of filepaths in directory
+            cumulative_data_counts: Cumulative data counts
+            filenames_per_uri:  List of filenames of each sub uri
+            frame_counts_per_uri: List of frame counts of each sub uri, only returned
+                                when count_frames is True
+            mtimes_per_uri:     List of directory modification times of each sub uri,
+                                only returned when directory_mtimes is True
         """
         if type(formats) is str:  # If a single format was selected, adapt to list
             formats = [formats]
 
+        # Walk the selected sub uris in parallel, keeping the file stats of the listings
+        # for the frame counts
+        stats_per_uri = [{} for _ in selected_sub_uris]
+        # The top level listing is not a data set, it is never refreshed
+        record_mtimes = directory_mtimes and selected_sub_uris != [""]
+        mtimes_per_uri = [{} if record_mtimes else None for _ in selected_sub_uris]
+
+        def dataset_filepaths(sub_uri, stats, mtimes):
+            return FileDataset._dataset_filepaths(
+                directory, sub_uri, formats, sort, directory_index, stats, mtimes
+            )
+
+        if max_workers == 1 or len(selected_sub_uris) == 1:
+            paths_per_uri = list(
+                map(dataset_filepaths, selected_sub_uris, stats_per_uri, mtimes_per_uri)
+            )
+        else:
+            paths_per_uri = list(
+                get_executor("thread").map(
+                    dataset_filepaths,
+                    selected_sub_uris,
+                    stats_per_uri,
+                    mtimes_per_uri,
+                    max_concurrency=max_workers,
+                )
+            )
+
+        # The top level listing is not a data set, its frames are not counted
+        if count_frames and selected_sub_uris != [""]:
+            frame_counts_per_uri = list(
+                get_executor("thread").map(
+                    partial(FileDataset._dataset_frame_counts, directory),
+                    selected_sub_uris,
+                    paths_per_uri,
+                    [directory_index] * len(paths_per_uri),
+                    stats_per_uri,
+                )
+            )
+        else:
+            frame_counts_per_uri = [None] * len(paths_per_uri)
+
         cumulative_data_counts = []
         filenames_per_uri = []
+        dataset_frame_counts = []
+        dataset_mtimes = []
 
         cumulative_dataset_size = 0
-        for dataset in selected_sub_uris:
-            dataset_path = os.path.join(directory, dataset)
-            if os.path.isdir(dataset_path):
-                # Find paths that match the format of interest
-                all_paths = list(
-                    reduce(
-                        lambda list1, list2: list1 + list2,
-                        (
-                            [
-                                os.path.relpath(path, start=dataset_path)
-                                for path in glob.glob(
-                                    str(dataset_path) + "/" + t, recursive=False
-                                )
-                            ]
-                            for t in formats
-                        ),
-                    )
-                )
-                # Find paths that match the not allowed file/directory formats
-                not_allowed_paths = list(
-                    reduce(
-                        lambda list1, list2: list1 + list2,
-                        (
-                            [
-                                os.path.relpath(path, start=dataset_path)
-                                for path in glob.glob(
-                                    str(dataset_path) + "/" + t, recursive=False
-                                )
-                            ]
-                            for t in NOT_ALLOWED_FORMATS
-                        ),
-                    )
-                )
-                # Remove not allowed filepaths from filepaths of interest
-                paths = list(set(all_paths) - set(not_allowed_paths))
-                if sort:
-                    paths.sort()
-                cumulative_dataset_size += len(paths)
+        for paths, frame_counts, mtimes in zip(
+            paths_per_uri, frame_counts_per_uri, mtimes_per_uri
+        ):
+            if paths is not None:
+                if frame_counts is None:
+                    cumulative_dataset_size += len(paths)
+                else:
+                    cumulative_dataset_size += int(frame_counts.sum())
                 cumulative_data_counts.append(cumulative_dataset_size)
                 filenames_per_uri.append(paths)
+                dataset_frame_counts.append(frame_counts)
+                dataset_mtimes.append(mtimes)
 
         if selected_sub_uris == [""]:
-            return (
+            results = (
                 filenames_per_uri[0] if len(filenames_per_uri) > 0 else [],
                 [0] * len(filenames_per_uri[0]) if len(filenames_per_uri) > 0 else [],
                 [[]] * len(filenames_per_uri[0]) if len(filenames_per_uri) > 0 else [],
             )
+            dataset_frame_counts = [None] * len(results[0])
+            dataset_mtimes = [None] * len(results[0])
         else:
-            return selected_sub_uris, cumulative_data_counts, filenames_per_uri
+            results = selected_sub_uris, cumulative_data_counts, filenames_per_uri
+        if count_frames:
+            results = (*results, dataset_frame_counts)
+        if directory_mtimes:
+            results = (*results, dataset_mtimes)
+        return results
@@ -0,0 +1,339 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import diskcache
+import numpy as np
+
+# Serialization of the filenames in the data project dictionary: "list", "compact" (front
+# coded) or "reference" (only an ID, the filenames stay server-side). File datasets keep
+# their filenames as plain lists in list mode, and as FilenameList otherwise
+FILENAMES_MODE = os.getenv("FILENAMES_MODE") or "list"
+# Directory where the referenced filename lists are stored, and number of lists kept in memory
+FILENAME_LIST_DIR = os.getenv("FILENAME_LIST_DIR") or os.path.join(
+    os.getenv("DATA_DIR", "."), ".file_manager_filename_lists"
+)
+FILENAME_LIST_CACHE_SIZE = int(os.getenv("FILENAME_LIST_CACHE_SIZE") or 16)
+
+# Every RESTART_INTERVAL filenames is stored in full, bounding the cost of random access
+RESTART_INTERVAL = 16
+# Number of filenames compared at once while computing the shared prefixes
+PREFIX_CHUNK_SIZE = 65536
+
+
+def _shared_prefix_lengths(encoded, lengths):
+    """
+    Length of the prefix that each filename shares with the previous one
+    Args:
+        encoded:        List of UTF-8 encoded filenames
+        lengths:        Array of the lengths of the encoded filenames
+    Returns:
+        Array of shared prefix lengths, 0 for the first filename
+    """
+    prefix_lengths = np.zeros(len(encoded), dtype=np.int32)
+    for start in range(1, len(encoded), PREFIX_CHUNK_SIZE):
+        stop = min(start + PREFIX_CHUNK_SIZE, len(encoded))
+        # Fixed-width byte matrix of the chunk, together with the previous filename
+        chunk = np.array(encoded[start - 1 : stop], dtype=bytes)
+        width = chunk.dtype.itemsize
+        if width == 0:
+            continue
+        chunk = chunk.view(np.uint8).reshape(-1, width)
+        differ = chunk[1:] != chunk[:-1]
+        first_difference = np.where(differ.any(axis=1), differ.argmax(axis=1), width)
+        prefix_lengths[start:stop] = np.minimum(
+            first_difference,
+            np.minimum(lengths[start - 1 : stop - 1], lengths[start:stop]),
+        )
+    return prefix_lengths
+
+
+class FilenameList(Sequence):
+    def __init__(self, filenames=()):
+        """
+        Read-only list of filenames stored front coded in NumPy buffers: each filename
+        keeps only the suffix that differs from the previous one. Reverse lookups use a
+        sorted array of hashes that is built on first use
+        Args:
+            filenames:      Iterable of filenames
+        """
+        encoded = [filename.encode("utf-8") for filename in filenames]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        prefix_lengths = _shared_prefix_lengths(encoded, lengths)
+        prefix_lengths[::RESTART_INTERVAL] = 0
+        suffix_lengths = lengths - prefix_lengths
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(suffix_lengths, out=offsets[1:])
+        suffixes = b"".join(
+            name[prefix_length:]
+            for name, prefix_length in zip(encoded, prefix_lengths.tolist())
+        )
+        self._set_buffers(prefix_lengths, offsets, suffixes)
+
+    def _set_buffers(self, prefix_lengths, offsets, suffixes):
+        self._prefix_lengths = prefix_lengths
+        self._offsets = offsets
+        self._suffixes = suffixes
+        self._hashes = None
+        self._hash_order = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_buffers(cls, prefix_lengths, offsets, suffixes):
+        """
+        Create a new instance from its front coded buffers
+        Args:
+            prefix_lengths: Array of shared prefix lengths
+            offsets:        Array of offsets of the suffixes
+            suffixes:       Concatenated suffixes
+        Returns:
+            New instance
+        """
+        filename_list = cls.__new__(cls)
+        filename_list._set_buffers(
+            np.asarray(prefix_lengths, dtype=np.int32),
+            np.asarray(offsets, dtype=np.int64),
+            bytes(suffixes),
+        )
+        return filename_list
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _suffix(self, index):
+        return self._suffixes[self._offsets[index] : self._offsets[index + 1]]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("FilenameList index out of range")
+        start = index - index % RESTART_INTERVAL
+        name = self._suffix(start)
+        for position in range(start + 1, index + 1):
+            name = name[: self._prefix_lengths[position]] + self._suffix(position)
+        return name.decode("utf-8")
+
+    def __iter__(self):
+        name = b""
+        prefix_lengths = self._prefix_lengths.tolist()
+        offsets = self._offsets.tolist()
+        for index, prefix_length in enumerate(prefix_lengths):
+            name = (
+                name[:prefix_length]
+                + self._suffixes[offsets[index] : offsets[index + 1]]
+            )
+            yield name.decode("utf-8")
+
+    def __eq__(self, other):
+        if isinstance(other, (FilenameList, list, tuple)):
+            return len(self) == len(other) and all(
+                name == other_name for name, other_name in zip(self, other)
+            )
+        return NotImplemented
+
+    def __repr__(self):
+        return f"FilenameList({len(self)} filenames)"
+
+    def _hash_index(self):
+        with self._lock:
+            if self._hashes is None:
+                hashes = np.fromiter(
+                    (hash(name) for name in self), dtype=np.int64, count=len(self)
+                )
+                self._hash_order = np.argsort(hashes, kind="stable")
+                self._hashes = hashes[self._hash_order]
+            return self._hashes, self._hash_order
+
+    def index(self, filename, start=0, stop=None):
+        """
+        Get the index of the first occurrence of a filename
+        Args:
+            filename:       Filename
+            start:          First index to search, defaults to 0
+            stop:           Index at which the search stops, defaults to the end
+        Returns:
+            Index of the filename
+        """
+        stop = len(self) if stop is None else stop
+        hashes, hash_order = self._hash_index()
+        name_hash = hash(filename)
+        low = np.searchsorted(hashes, name_hash, side="left")
+        high = np.searchsorted(hashes, name_hash, side="right")
+        for position in hash_order[low:high].tolist():
+            if start <= position < stop and self[position] == filename:
+                return position
+        raise ValueError(f"{filename} is not in the list")
+
+    def __contains__(self, filename):
+        try:
+            self.index(filename)
+            return True
+        except ValueError:
+            return False
+
+    def to_buffers(self):
+        """
+        Get the front coded buffers, the inverse of from_buffers
+        Returns:
+            Bytes of the prefix lengths, bytes of the offsets and concatenated suffixes
+        """
+        return (
+            self._prefix_lengths.tobytes(),
+            self._offsets.tobytes(),
+            self._suffixes,
+        )
+
+    @property
+    def ref(self):
+        """
+        Content hash of the list, used as its reference ID
+        """
+        content = hashlib.sha256()
+        content.update(self._prefix_lengths.tobytes())
+        content.update(self._offsets.tobytes())
+        content.update(self._suffixes)
+        return content.hexdigest()[:32]
+
+    @property
+    def nbytes(self):
+        return self._prefix_lengths.nbytes + self._offsets.nbytes + len(self._suffixes)
+
+    def to_dict(self, mode=None):
+        """
+        Serialize the filenames for the data project dictionary
+        Args:
+            mode:           "list", "compact" or "reference", defaults to FILENAMES_MODE
+        Returns:
+            List of filenames, or dictionary with the front coded or referenced filenames
+        """
+        mode = mode or FILENAMES_MODE
+        if mode == "reference":
+            FILENAME_LIST_REGISTRY.put(self)
+            return {"ref": self.ref, "count": len(self)}
+        if mode not in ("list", "compact"):
+            raise ValueError(f"Unknown filenames mode: {mode}")
+        if mode == "list" or b"\n" in self._suffixes:
+            return list(self)
+        if self._suffixes.isascii():
+            # Prefixes in bytes are prefixes in characters
+            offsets = self._offsets.tolist()
+            text = self._suffixes.decode("ascii")
+            return {
+                "prefix_lengths": self._prefix_lengths.tolist(),
+                "suffixes": "\n".join(
+                    text[offsets[index] : offsets[index + 1]]
+                    for index in range(len(self))
+                ),
+            }
+        # JSON-friendly front coding, with prefixes counted in characters
+        prefix_lengths = []
+        suffixes = []
+        previous = ""
+        for filename in self:
+            prefix_length = len(os.path.commonprefix([previous, filename]))
+            prefix_lengths.append(prefix_length)
+            suffixes.append(filename[prefix_length:])
+            previous = filename
+        return {"prefix_lengths": prefix_lengths, "suffixes": "\n".join(suffixes)}
+
+    @classmethod
+    def from_dict(cls, filenames):
+        """
+        Create a new instance from the serialized filenames
+        Args:
+            filenames:      List of filenames, or dictionary with the front coded or
+                            referenced filenames
+        Returns:
+            New instance
+        """
+        if isinstance(filenames, FilenameList):
+            return filenames
+        if isinstance(filenames, list):
+            return cls(filenames)
+        if "ref" in filenames:
+            return FILENAME_LIST_REGISTRY.get(filenames["ref"])
+        names = []
+        previous = ""
+        suffixes = filenames["suffixes"].split("\n") if filenames["suffixes"] else [""]
+        for prefix_length, suffix in zip(filenames["prefix_lengths"], suffixes):
+            previous = previous[:prefix_length] + suffix
+            names.append(previous)
+        return cls(names)
+
+
+class FilenameListRegistry:
+    def __init__(self, directory=FILENAME_LIST_DIR, max_size=FILENAME_LIST_CACHE_SIZE):
+        """
+        Server-side store of the filename lists that are serialized by reference. Lists
+        are kept in memory and persisted to disk, so that other worker processes and
+        restarts can resolve the references
+        Args:
+            directory:      Directory of the disk store
+            max_size:       Maximum number of lists kept in memory
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._lists = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+
+    def _get_disk(self):
+        if self._disk is None:
+            self._disk = diskcache.Cache(self.directory)
+        return self._disk
+
+    def _remember(self, ref, filename_list):
+        with self._lock:
+            self._lists[ref] = filename_list
+            self._lists.move_to_end(ref)
+            while len(self._lists) > self.max_size:
+                self._lists.popitem(last=False)
+
+    def put(self, filename_list):
+        """
+        Store a filename list
+        Args:
+            filename_list:  FilenameList
+        Returns:
+            Reference ID of the list
+        """
+        ref = filename_list.ref
+        with self._lock:
+            known = ref in self._lists
+        if not known:
+            disk = self._get_disk()
+            if ref not in disk:
+                disk[ref] = filename_list.to_buffers()
+        self._remember(ref, filename_list)
+        return ref
+
+    def get(self, ref):
+        """
+        Get a stored filename list
+        Args:
+            ref:            Reference ID of the list
+        Returns:
+            FilenameList
+        """
+        with self._lock:
+            filename_list = self._lists.get(ref)
+        if filename_list is None:
+            buffers = self._get_disk().get(ref)
+            if buffers is None:
+                raise KeyError(f"Unknown filename list reference: {ref}")
+            prefix_lengths, offsets, suffixes = buffers
+            filename_list = FilenameList.from_buffers(
+                np.frombuffer(prefix_lengths, dtype=np.int32),
+                np.frombuffer(offsets, dtype=np.int64),
+                suffixes,
+            )
+        self._remember(ref, filename_list)
+        return filename_list
+
+
+FILENAME_LIST_REGISTRY = FilenameListRegistry()
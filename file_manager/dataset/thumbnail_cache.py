@@ -0,0 +1,194 @@
+import os
+import threading
+from collections import OrderedDict
+
+import diskcache
+from PIL import Image
+
+from file_manager.dataset.thumbnail_encoder import DEFAULT_THUMBNAIL_ENCODER
+
+# Maximum size of the in-memory cache in bytes, and optional directory to spill evicted
+# thumbnails to disk
+THUMBNAIL_CACHE_SIZE = int(os.getenv("THUMBNAIL_CACHE_SIZE") or 256 * 1024**2)
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", None)
+THUMBNAIL_CACHE_DISK_SIZE = int(os.getenv("THUMBNAIL_CACHE_DISK_SIZE") or 2 * 1024**3)
+
+# Export formats whose results are cached, raw data is returned as is
+CACHED_EXPORTS = ["base64", "bytes", "pillow"]
+
+
+class ThumbnailCache:
+    def __init__(
+        self, max_bytes=THUMBNAIL_CACHE_SIZE, spill_dir=None, spill_bytes=None
+    ):
+        """
+        Process-wide LRU cache of processed images, bounded by size in bytes
+        Args:
+            max_bytes:          Maximum size of the in-memory cache in bytes
+            spill_dir:          Directory where evicted entries are spilled, defaults to None
+            spill_bytes:        Maximum size of the disk spill in bytes
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        if spill_dir:
+            self._disk = diskcache.Cache(
+                spill_dir, size_limit=spill_bytes or THUMBNAIL_CACHE_DISK_SIZE
+            )
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(
+        uri,
+        index,
+        log,
+        percentiles,
+        resize,
+        export,
+        downsample=False,
+        encoder=None,
+        version=None,
+    ):
+        """
+        Build the cache key of a processed image. The version of the source is part of
+        the key, so that a file rewritten in place is read again
+        Args:
+            uri:            Source URI of the dataset
+            index:          Index of the image within the dataset
+            log:            Log transform flag
+            percentiles:    Percentiles used for normalization
+            resize:         Resize flag
+            export:         Export format
+            downsample:     Downsampling applied to the source, defaults to False
+            encoder:        ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+            version:        Version of the source, file modification time and size or
+                            tiled node ETag, defaults to None
+        Returns:
+            Cache key
+        """
+        return (
+            uri,
+            int(index),
+            bool(log),
+            tuple(percentiles),
+            bool(resize),
+            export,
+            downsample,
+            (encoder or DEFAULT_THUMBNAIL_ENCODER).key,
+            version,
+        )
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, Image.Image):
+            return value.width * value.height * len(value.getbands())
+        return len(value)
+
+    @staticmethod
+    def _copy(value):
+        # PIL images are mutable, hand out copies to protect the cached entry
+        if isinstance(value, Image.Image):
+            return value.copy()
+        return value
+
+    def get(self, key):
+        """
+        Get a cached entry
+        Args:
+            key:            Cache key
+        Returns:
+            Cached value, or None if the key is not cached
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(value)
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                self._put(key, value)
+                return self._copy(value)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def contains(self, key):
+        """
+        Check if an entry is cached, without counting a hit or a miss
+        Args:
+            key:            Cache key
+        Returns:
+            True if the key is cached in memory or in the disk spill
+        """
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self._disk is not None and key in self._disk
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def put(self, key, value):
+        """
+        Add an entry to the cache, evicting the least recently used entries if needed
+        Args:
+            key:            Cache key
+            value:          Base64 string, encoded bytes or PIL image
+        """
+        self._put(key, self._copy(value))
+
+    def _put(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizeof(self._entries.pop(key))
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self._bytes -= self._sizeof(old_value)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        if self._disk is not None:
+            for old_key, old_value in evicted:
+                self._disk.set(old_key, old_value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self):
+        """
+        Get cache statistics
+        Returns:
+            Dictionary with hit/miss counters and current size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+THUMBNAIL_CACHE = ThumbnailCache(spill_dir=THUMBNAIL_CACHE_DIR)
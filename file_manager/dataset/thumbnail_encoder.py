@@ -0,0 +1,175 @@
+import base64
+import io
+import os
+
+# Size of the thumbnails (width, height)
+THUMBNAIL_SIZE = (200, 200)
+
+# Default thumbnail encoding: format ("png", "jpeg" or "webp"), PNG zlib compression level
+# (0-9), JPEG and lossy WebP quality (1-100), lossless WebP, and whether the resize keeps
+# the aspect ratio of the image within THUMBNAIL_SIZE
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT") or "png"
+THUMBNAIL_COMPRESS_LEVEL = int(os.getenv("THUMBNAIL_COMPRESS_LEVEL") or 6)
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY") or 85)
+THUMBNAIL_LOSSLESS = (os.getenv("THUMBNAIL_LOSSLESS") or "false").lower() == "true"
+THUMBNAIL_KEEP_ASPECT = (
+    os.getenv("THUMBNAIL_KEEP_ASPECT") or "false"
+).lower() == "true"
+
+# MIME type of each thumbnail format
+THUMBNAIL_FORMATS = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class ThumbnailEncoder:
+    def __init__(
+        self,
+        format=THUMBNAIL_FORMAT,
+        size=THUMBNAIL_SIZE,
+        keep_aspect=THUMBNAIL_KEEP_ASPECT,
+        compress_level=THUMBNAIL_COMPRESS_LEVEL,
+        quality=THUMBNAIL_QUALITY,
+        lossless=THUMBNAIL_LOSSLESS,
+    ):
+        """
+        Resizing and encoding settings of the thumbnails
+        Args:
+            format:             Image format, "png", "jpeg" or "webp"
+            size:               Size of the thumbnails (width, height)
+            keep_aspect:        Fit the image within size keeping its aspect ratio,
+                                instead of stretching it to size
+            compress_level:     PNG zlib compression level, from 0 (fastest) to 9
+            quality:            JPEG and lossy WebP quality, from 1 to 100
+            lossless:           Encode WebP losslessly
+        """
+        format = format.lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in THUMBNAIL_FORMATS:
+            raise ValueError(f"Unknown thumbnail format: {format}")
+        self.format = format
+        self.size = tuple(size)
+        self.keep_aspect = bool(keep_aspect)
+        self.compress_level = int(compress_level)
+        self.quality = int(quality)
+        self.lossless = bool(lossless)
+
+    @property
+    def mime_type(self):
+        return THUMBNAIL_FORMATS[self.format]
+
+    @property
+    def key(self):
+        """
+        Settings that determine the encoded thumbnail, used in the cache keys
+        """
+        return (
+            self.format,
+            self.size,
+            self.keep_aspect,
+            self.compress_level,
+            self.quality,
+            self.lossless,
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, ThumbnailEncoder) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"ThumbnailEncoder{self.key}"
+
+    def to_dict(self):
+        """
+        Convert to dictionary
+        Returns:
+            Dictionary
+        """
+        return {
+            "format": self.format,
+            "size": list(self.size),
+            "keep_aspect": self.keep_aspect,
+            "compress_level": self.compress_level,
+            "quality": self.quality,
+            "lossless": self.lossless,
+        }
+
+    @classmethod
+    def from_dict(cls, encoder_dict):
+        """
+        Create a new instance from dictionary
+        Args:
+            encoder_dict:           Dictionary
+        Returns:
+            New instance
+        """
+        return cls(**encoder_dict)
+
+    def thumbnail_size(self, size):
+        """
+        Size of the thumbnail of an image
+        Args:
+            size:           Size of the image (width, height)
+        Returns:
+            Size of the thumbnail (width, height)
+        """
+        if not self.keep_aspect:
+            return self.size
+        scale = min(self.size[0] / size[0], self.size[1] / size[1])
+        return (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+
+    def resize(self, image):
+        """
+        Resize a PIL image to the thumbnail size
+        Args:
+            image:          PIL image
+        Returns:
+            Resized PIL image
+        """
+        return image.resize(self.thumbnail_size(image.size))
+
+    def encode(self, image):
+        """
+        Encode a PIL image
+        Args:
+            image:          PIL image
+        Returns:
+            Encoded bytes
+        """
+        buffered = io.BytesIO()
+        if self.format == "png":
+            image.save(buffered, format="PNG", compress_level=self.compress_level)
+        elif self.format == "jpeg":
+            if image.mode not in ("L", "RGB"):
+                image = image.convert("RGB")
+            image.save(buffered, format="JPEG", quality=self.quality)
+        else:
+            image.save(
+                buffered, format="WEBP", quality=self.quality, lossless=self.lossless
+            )
+        return buffered.getvalue()
+
+    def to_data_url(self, image):
+        """
+        Encode a PIL image as a base64 data URL
+        Args:
+            image:          PIL image
+        Returns:
+            Data URL
+        """
+        return self.data_url(self.encode(image))
+
+    def data_url(self, data):
+        """
+        Wrap encoded bytes in a base64 data URL
+        Args:
+            data:           Bytes encoded by this encoder
+        Returns:
+            Data URL
+        """
+        contents_base64 = base64.b64encode(data).decode("utf-8")
+        return f"data:{self.mime_type};base64,{contents_base64}"
+
+
+DEFAULT_THUMBNAIL_ENCODER = ThumbnailEncoder()
@@ -0,0 +1,206 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import diskcache
+
+from file_manager.dataset.thumbnail_encoder import (
+    DEFAULT_THUMBNAIL_ENCODER,
+    ThumbnailEncoder,
+)
+
+# Directory of the precomputed thumbnails, the store is disabled when it is not set, and
+# maximum size of the store in bytes
+THUMBNAIL_STORE_DIR = os.getenv("THUMBNAIL_STORE_DIR", None)
+THUMBNAIL_STORE_SIZE = int(os.getenv("THUMBNAIL_STORE_SIZE") or 4 * 1024**3)
+# Sizes in pixels of the precomputed levels, defaults to the thumbnail size of the project
+# encoder, which is the only level read by the file manager, and number of frames encoded
+# per batch
+THUMBNAIL_STORE_LEVELS = (
+    [int(size) for size in os.getenv("THUMBNAIL_STORE_LEVELS").split(",")]
+    if os.getenv("THUMBNAIL_STORE_LEVELS")
+    else None
+)
+THUMBNAIL_STORE_BATCH_SIZE = int(os.getenv("THUMBNAIL_STORE_BATCH_SIZE") or 64)
+
+# Export formats served from the store, which holds encoded thumbnails
+STORED_EXPORTS = ["base64", "bytes"]
+
+
+class ThumbnailStore:
+    def __init__(
+        self,
+        directory=THUMBNAIL_STORE_DIR,
+        size_limit=THUMBNAIL_STORE_SIZE,
+        levels=THUMBNAIL_STORE_LEVELS,
+    ):
+        """
+        Persistent store of encoded thumbnails, precomputed in the background at each
+        level of a small pyramid. Entries are addressed by the source, its version (file
+        modification time and size, or hash of the tiled node metadata, which expires
+        every TILED_VERSION_TTL seconds) and the encoder, so a changed source is never
+        served from the store
+        Args:
+            directory:      Directory of the store, disabled when None
+            size_limit:     Maximum size of the store in bytes
+            levels:         Sizes in pixels of the precomputed levels, defaults to the
+                            thumbnail size of the encoder
+        """
+        self.directory = directory
+        self.size_limit = size_limit
+        self.levels = levels
+        self._disk = None
+        self._builder = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def _get_disk(self):
+        if self._disk is None:
+            self._disk = diskcache.Cache(self.directory, size_limit=self.size_limit)
+        return self._disk
+
+    def serves(self, log, resize, export, percentiles):
+        """
+        Check if a read can be served from the store, which only holds the thumbnails
+        of the default normalization
+        Args:
+            log:            Log transform flag
+            resize:         Resize flag
+            export:         Export format
+            percentiles:    Percentiles used for normalization
+        Returns:
+            True if the read can be served from the store
+        """
+        return (
+            self.enabled
+            and resize
+            and not log
+            and list(percentiles) == [0, 100]
+            and export in STORED_EXPORTS
+        )
+
+    def level_encoders(self, encoder=None):
+        """
+        Encoders of the levels of the pyramid, from the largest to the smallest level
+        Args:
+            encoder:        ThumbnailEncoder of the data project, defaults to
+                            DEFAULT_THUMBNAIL_ENCODER
+        Returns:
+            List of ThumbnailEncoder, one per level
+        """
+        encoder = encoder or DEFAULT_THUMBNAIL_ENCODER
+        if not self.levels:
+            return [encoder]
+        encoder_dict = encoder.to_dict()
+        return [
+            ThumbnailEncoder.from_dict({**encoder_dict, "size": (size, size)})
+            for size in sorted(self.levels, reverse=True)
+        ]
+
+    @staticmethod
+    def make_key(uri, index, version, downsample=False, encoder=None):
+        """
+        Build the content address of a thumbnail
+        Args:
+            uri:            Source URI of the dataset
+            index:          Index of the image within the dataset
+            version:        Version of the source
+            downsample:     Downsampling applied to the source, defaults to False
+            encoder:        ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+        Returns:
+            Key of the thumbnail
+        """
+        key = repr(
+            (
+                uri,
+                int(index),
+                version,
+                downsample,
+                (encoder or DEFAULT_THUMBNAIL_ENCODER).key,
+            )
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Get stored thumbnails
+        Args:
+            keys:           List of keys, None where the source version is unknown
+        Returns:
+            List of encoded thumbnails, None where the thumbnail is not stored
+        """
+        disk = self._get_disk()
+        values = [disk.get(key) if key is not None else None for key in keys]
+        with self._lock:
+            hits = sum(value is not None for value in values)
+            self.hits += hits
+            self.misses += len(values) - hits
+        return values
+
+    def missing(self, keys):
+        """
+        Filter the keys that are not stored yet
+        Args:
+            keys:           List of keys, None where the source version is unknown
+        Returns:
+            Positions of the keys that are not stored
+        """
+        disk = self._get_disk()
+        return [
+            position
+            for position, key in enumerate(keys)
+            if key is not None and key not in disk
+        ]
+
+    def put_many(self, keys, values):
+        """
+        Store encoded thumbnails
+        Args:
+            keys:           List of keys
+            values:         List of encoded thumbnails
+        """
+        disk = self._get_disk()
+        for key, value in zip(keys, values):
+            disk.set(key, value)
+        with self._lock:
+            self.writes += len(keys)
+
+    def submit(self, build, *args, **kwargs):
+        """
+        Run a build of thumbnails in the background, after the builds submitted before
+        Args:
+            build:          Function that builds the thumbnails
+        Returns:
+            Future of the build
+        """
+        with self._lock:
+            if self._builder is None:
+                self._builder = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="file-manager-thumbnails"
+                )
+            return self._builder.submit(build, *args, **kwargs)
+
+    def clear(self):
+        if self.enabled:
+            self._get_disk().clear()
+
+    def stats(self):
+        """
+        Get store statistics
+        Returns:
+            Dictionary with hit/miss/write counters and current size
+        """
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+        stats["bytes"] = self._get_disk().volume() if self.enabled else 0
+        return stats
+
+
+THUMBNAIL_STORE = ThumbnailStore()
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+from tiled.client import from_context
+from tiled.client.context import Context
+
+# Time to live in seconds and maximum number of pooled tiled clients
+TILED_CLIENT_TTL = float(os.getenv("TILED_CLIENT_TTL") or 600)
+TILED_CLIENT_POOL_SIZE = int(os.getenv("TILED_CLIENT_POOL_SIZE") or 32)
+
+
+class TiledClientPool:
+    def __init__(self, ttl=TILED_CLIENT_TTL, max_size=TILED_CLIENT_POOL_SIZE):
+        """
+        Pool of tiled clients keyed by (uri, api_key). Clients that point to the same tiled
+        server and use the same API key share a single context, and thus a single HTTP
+        connection pool
+        Args:
+            ttl:            Time to live of a client in seconds
+            max_size:       Maximum number of clients in the pool
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clients = OrderedDict()
+        self._contexts = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _split_uri(uri):
+        """
+        Split a tiled URI into the URI of the API and the path to the node
+        Args:
+            uri:            Tiled URI
+        Returns:
+            api_uri:        URI of the tiled API
+            node_path_parts: List of path segments to the node
+        """
+        scheme, netloc, path, query, fragment = urlsplit(uri)
+        if "/metadata" not in path:
+            return uri, []
+        api_path, _, node_path = path.partition("/metadata")
+        api_uri = urlunsplit((scheme, netloc, api_path, query, fragment))
+        return api_uri, [segment for segment in node_path.split("/") if segment]
+
+    def get(self, uri, api_key=None):
+        """
+        Get a tiled client, reusing a pooled one when it has not expired
+        Args:
+            uri:            Tiled URI
+            api_key:        Tiled API key
+        Returns:
+            Tiled client
+        """
+        key = (uri, api_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._clients.move_to_end(key)
+                self.reused += 1
+                return entry[0]
+
+        api_uri, node_path_parts = self._split_uri(uri)
+        context_key = (api_uri, api_key)
+        with self._lock:
+            context = self._contexts.get(context_key)
+        if context is None:
+            context, _ = Context.from_any_uri(api_uri, api_key=api_key)
+        client = from_context(context, node_path_parts=node_path_parts)
+
+        with self._lock:
+            self._contexts[context_key] = context
+            self._clients[key] = (client, now, context_key)
+            self._clients.move_to_end(key)
+            self.created += 1
+            self._evict(now)
+        return client
+
+    def _evict(self, now):
+        for key, (_, created, _) in list(self._clients.items()):
+            if now - created >= self.ttl:
+                del self._clients[key]
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+        # Drop the contexts that are no longer used by any pooled client
+        used_contexts = {entry[2] for entry in self._clients.values()}
+        for context_key in list(self._contexts):
+            if context_key not in used_contexts:
+                del self._contexts[context_key]
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._contexts.clear()
+
+    def stats(self):
+        """
+        Get pool statistics
+        Returns:
+            Dictionary with the number of client creations and reuses
+        """
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "clients": len(self._clients),
+                "contexts": len(self._contexts),
+            }
+
+
+TILED_CLIENT_POOL = TiledClientPool()
@@ -1,12 +1,20 @@
-import concurrent.futures
 import os
+import time
 from functools import partial
 
 import numpy as np
 from tiled.client import from_uri
-from tiled.client.array import ArrayClient
 
-from file_manager.dataset.dataset import Dataset
+from file_manager.dataset.dataset import (
+    DEFAULT_THUMBNAIL_ENCODER,
+    THUMBNAIL_SIZE,
+    Dataset,
+    DatasetDiff,
+)
+from file_manager.dataset.executors import get_executor
+from file_manager.dataset.thumbnail_store import THUMBNAIL_STORE
+from file_manager.dataset.tiled_client_pool import TILED_CLIENT_POOL
+from file_manager.dataset.tiled_metadata_cache import TILED_METADATA_CACHE
 
 # Check if a static tiled client has been set
 STATIC_TILED_URI = os.getenv("STATIC_TILED_URI", None)
@@ -16,6 +24,14 @@ if STATIC_TILED_URI:
 else:
     STATIC_TILED_CLIENT = None
 
+# Maximum number of concurrent slice requests per read, and of images per slice request
+TILED_READ_PARALLELISM = int(os.getenv("TILED_READ_PARALLELISM") or 4)
+TILED_READ_CHUNK_SIZE = int(os.getenv("TILED_READ_CHUNK_SIZE") or 64)
+# Time in seconds after which the cached and stored thumbnails of a tiled node expire. The
+# tiled server does not expose a version of the array data, so the version of a node only
+# changes with its metadata otherwise
+TILED_VERSION_TTL = float(os.getenv("TILED_VERSION_TTL") or 3600)
+
 
 class TiledDataset(Dataset):
     def __init__(
@@ -51,6 +67,35 @@ class TiledDataset(Dataset):
         """
         return cls(dataset_dict["uri"], dataset_dict["cumulative_data_count"])
 
+    def refresh(self, tiled_client, offset=0, previous_offset=None):
+        """
+        Fetch the shape of the node again and update the cumulative data count in place
+        Args:
+            tiled_client:       Tiled client
+            offset:             Cumulative data count of the previous data sets,
+                                defaults to 0
+            previous_offset:    Cumulative data count of the previous data sets before
+                                the refresh, defaults to offset
+        Returns:
+            DatasetDiff with the added and removed frame indices
+        """
+        if previous_offset is None:
+            previous_offset = offset
+        previous_count = self.cumulative_data_count - previous_offset
+        TILED_METADATA_CACHE.invalidate(self.uri)
+        try:
+            count = self._get_node_size(tiled_client, self.uri)
+        except KeyError:
+            # The node was removed
+            count = 0
+        self.cumulative_data_count = offset + count
+        return DatasetDiff(
+            self.uri,
+            list(range(previous_count, count)),
+            list(range(count, previous_count)),
+            count,
+        )
+
     @staticmethod
     def get_tiled_client(
         tiled_uri, api_key=None, static_tiled_client=STATIC_TILED_CLIENT
@@ -64,12 +109,11 @@ class TiledDataset(Dataset):
         Returns:
             Tiled client
         """
-        # Checks if a static tiled client has been set, otherwise creates a new one
+        # Checks if a static tiled client has been set, otherwise reuses a pooled one
         if static_tiled_client:
             return static_tiled_client
         else:
-            client = from_uri(tiled_uri, api_key=api_key)
-            return client
+            return TILED_CLIENT_POOL.get(tiled_uri, api_key)
 
     def read_data(
         self,
@@ -83,6 +127,8 @@ class TiledDataset(Dataset):
         just_uri=False,
         tiled_client=None,
         percentiles=[0, 100],
+        executor=None,
+        encoder=None,
     ):
         """
         Read data set
@@ -93,14 +139,19 @@ class TiledDataset(Dataset):
             resize:            Resize image to 200x200, defaults to True
             log:               Apply log(1+x) to the image, defaults to False
             api_key:           Tiled API key
-            downsample:        Downsample the image, defaults to False
+            downsample:        Downsample the image to a preview of the thumbnail size, or by
+                               a given stride, defaults to False
             just_uri:          Return only the uri, defaults to False
             tiled_client:      Tiled client
             percentiles:       Percentiles to normalize the image, defaults to [0, 100]
+            executor:          Executor backend or instance used to encode the images,
+                               defaults to the shared EXECUTOR_BACKEND executor
+            encoder:           ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
         Returns:
             Base64/PIL image
             Dataset URI
         """
+        encoder = encoder or DEFAULT_THUMBNAIL_ENCODER
         if isinstance(indexes, int):
             indexes = [indexes]
 
@@ -111,56 +162,285 @@ class TiledDataset(Dataset):
         if just_uri:
             return tiled_uris
 
-        tiled_data = tiled_client[self.uri]
-        if downsample:
-            if len(tiled_data.shape) == 4:
-                block_data = tiled_data[indexes, :, ::10, ::10]
-            elif len(tiled_data.shape) == 3:
-                block_data = tiled_data[indexes, ::10, ::10]
-            else:
-                block_data = tiled_data[::10, ::10]
-                block_data = np.expand_dims(block_data, axis=0)
-        else:
-            if len(tiled_data.shape) == 4:
-                block_data = tiled_data[indexes]
-            elif len(tiled_data.shape) == 3:
-                block_data = tiled_data[indexes]
-            else:
-                block_data = tiled_data
-                block_data = np.expand_dims(block_data, axis=0)
-
         if export == "raw":
-            return block_data, tiled_uris
+            return self._read_block(tiled_client, indexes, downsample), tiled_uris
+
+        # Only retrieve the images that are not cached yet
+        sources = [
+            (f"{root_uri.rstrip('/')}/{self.uri.lstrip('/')}", index)
+            for index in indexes
+        ]
+        versions = [self._source_version(tiled_client)] * len(sources)
+        data, cache_keys = self._read_cached(
+            sources,
+            log,
+            resize,
+            export,
+            percentiles,
+            downsample,
+            encoder,
+            versions,
+        )
+        data = data[: len(tiled_uris)]
+        missing = [position for position, item in enumerate(data) if item is None]
+        if len(missing) == 0:
+            return data, tiled_uris
+
+        # Serve the precomputed thumbnails of an unchanged node from the store
+        to_read = missing
+        if THUMBNAIL_STORE.serves(log, resize, export, percentiles):
+            stored = self._read_stored(
+                [sources[position] for position in missing],
+                [versions[position] for position in missing],
+                export,
+                downsample,
+                encoder,
+            )
+            for position, item in zip(missing, stored):
+                data[position] = item
+            to_read = [position for position in missing if data[position] is None]
+
+        if len(to_read) > 0:
+            missing_data = self._read_thumbnails(
+                tiled_client,
+                [indexes[position] for position in to_read],
+                log,
+                resize,
+                export,
+                percentiles,
+                downsample,
+                executor,
+                encoder,
+            )
+            for position, item in zip(to_read, missing_data):
+                data[position] = item
+
+        self._write_cached(cache_keys, data, missing)
+        return data, tiled_uris
+
+    def is_cached(
+        self,
+        root_uri,
+        indexes,
+        export="base64",
+        resize=True,
+        log=False,
+        percentiles=[0, 100],
+        downsample=False,
+        encoder=None,
+        tiled_client=None,
+        api_key=None,
+        **kwargs,
+    ):
+        """
+        Check which frames are in the thumbnail cache for the given read parameters
+        Args:
+            root_uri:          Root URI from which data should be retrieved
+            indexes:           List of indexes of the frames
+            export:            Export format, defaults to base64
+            resize:            Resize images, defaults to True
+            log:               Apply log(1+x) to the images, defaults to False
+            percentiles:       Percentiles to normalize the images, defaults to [0, 100]
+            downsample:        Downsampling of the previews, defaults to False
+            encoder:           ThumbnailEncoder, defaults to DEFAULT_THUMBNAIL_ENCODER
+            tiled_client:      Tiled client
+            api_key:           Tiled API key
+        Returns:
+            List of flags, True where the frame is cached
+        """
+        if tiled_client is None:
+            tiled_client = self.get_tiled_client(root_uri, api_key)
+        return self._is_cached(
+            [
+                (f"{root_uri.rstrip('/')}/{self.uri.lstrip('/')}", index)
+                for index in indexes
+            ],
+            log,
+            resize,
+            export,
+            percentiles,
+            downsample,
+            encoder or DEFAULT_THUMBNAIL_ENCODER,
+            self.source_versions(indexes, tiled_client),
+        )
+
+    def _read_thumbnails(
+        self,
+        tiled_client,
+        indexes,
+        log,
+        resize,
+        export,
+        percentiles,
+        downsample,
+        executor,
+        encoder,
+    ):
+        block_data = self._read_block(tiled_client, indexes, downsample, encoder.size)
 
         # Check if there are 4 dimensions for a grayscale image
         if block_data.shape[1] == 1:
             block_data = np.squeeze(block_data, axis=1)
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            data = list(
-                executor.map(
-                    self._read_data_point,
-                    block_data,
-                    [log] * len(indexes),
-                    [resize] * len(indexes),
-                    [export] * len(indexes),
-                    [percentiles] * len(indexes),
-                )
-            )
-        return data, tiled_uris
+        return self._process_batch(
+            block_data, log, resize, export, percentiles, executor, encoder
+        )
+
+    def source_versions(self, indexes, tiled_client):
+        """
+        Versions of the frames of the node, which change when the node metadata is
+        modified, and at least every TILED_VERSION_TTL seconds
+        Args:
+            indexes:           List of indexes of the frames
+            tiled_client:      Tiled client
+        Returns:
+            List of versions of the node
+        """
+        return [self._source_version(tiled_client)] * len(indexes)
 
-    def _read_data_point(self, image, log, resize, export, percentiles):
+    def _source_version(self, tiled_client):
         """
-        Read data point
+        Version of the node, used to validate its cached and stored thumbnails. The hash
+        of the node metadata does not cover the array data, which can be rewritten in
+        place, so it is combined with the current TILED_VERSION_TTL period
         Args:
-            image:          Image data
-            log:            Apply log(masked(x)+threshold) to the image
-            resize:         Resize image to 200x200
-            export:         Export format
-            percentiles:    Percentiles to normalize the image
-            threshold:      Threshold for log
+            tiled_client:      Tiled client
+        Returns:
+            Version of the node
         """
-        return self._process_image(image, log, resize, export, percentiles)
+        etag = TILED_METADATA_CACHE.get_node(tiled_client, self.uri).etag
+        return f"{etag}-{int(time.time() // TILED_VERSION_TTL)}"
+
+    def build_thumbnails(
+        self,
+        root_uri,
+        indexes,
+        encoders,
+        tiled_client=None,
+        api_key=None,
+        downsample=True,
+        executor=None,
+    ):
+        """
+        Precompute the thumbnails of frames in the thumbnail store, skipping the ones
+        that are already stored for the current version of the node
+        Args:
+            root_uri:          Root URI from which data should be retrieved
+            indexes:           List of indexes of the frames
+            encoders:          List of ThumbnailEncoder, one per level, from the largest
+                               to the smallest level
+            tiled_client:      Tiled client
+            api_key:           Tiled API key
+            downsample:        Downsample the image to a preview of the thumbnail size, or by
+                               a given stride, defaults to True
+            executor:          Executor backend or instance used to encode the images,
+                               defaults to the shared EXECUTOR_BACKEND executor
+        Returns:
+            Number of stored thumbnails
+        """
+        if tiled_client is None:
+            tiled_client = self.get_tiled_client(root_uri, api_key)
+        sources = [
+            (f"{root_uri.rstrip('/')}/{self.uri.lstrip('/')}", index)
+            for index in indexes
+        ]
+        versions = [self._source_version(tiled_client)] * len(indexes)
+        positions, levels = self._missing_levels(
+            sources, versions, encoders, downsample
+        )
+        if len(positions) == 0:
+            return 0
+        # Each frame is read and normalized once, at the largest level
+        images = self._read_thumbnails(
+            tiled_client,
+            [indexes[position] for position in positions],
+            False,
+            True,
+            "pillow",
+            [0, 100],
+            downsample,
+            executor,
+            encoders[0],
+        )
+        return self._store_levels(images, positions, levels, encoders, executor)
+
+    @staticmethod
+    def _contiguous_ranges(indexes, max_length=TILED_READ_CHUNK_SIZE):
+        """
+        Decompose a list of indexes into runs of consecutive indexes
+        Args:
+            indexes:           List of indexes
+            max_length:        Maximum length of a run
+        Returns:
+            List of (start, stop) ranges, in the order of indexes
+        """
+        ranges = []
+        for index in indexes:
+            if (
+                len(ranges) > 0
+                and ranges[-1][1] == index
+                and ranges[-1][1] - ranges[-1][0] < max_length
+            ):
+                ranges[-1][1] = index + 1
+            else:
+                ranges.append([index, index + 1])
+        return [(start, stop) for start, stop in ranges]
+
+    @staticmethod
+    def _preview_stride(shape, thumbnail_size=THUMBNAIL_SIZE):
+        """
+        Largest stride that keeps the image at least as large as the thumbnail
+        Args:
+            shape:             Shape of the tiled array
+            thumbnail_size:    Size of the thumbnail (width, height)
+        Returns:
+            Stride along the image dimensions
+        """
+        height, width = shape[-2:]
+        return max(1, min(height // thumbnail_size[1], width // thumbnail_size[0]))
+
+    def _read_block(
+        self, tiled_client, indexes, downsample=False, thumbnail_size=THUMBNAIL_SIZE
+    ):
+        """
+        Read a block of images from tiled, fetching runs of consecutive indexes as slices
+        Args:
+            tiled_client:      Tiled client
+            indexes:           List of indexes of the images to retrieve
+            downsample:        Downsample the image to a preview of the thumbnail size, or by
+                               a given stride, defaults to False
+            thumbnail_size:    Size of the thumbnail (width, height)
+        Returns:
+            Block of images, with the image index as the first dimension
+        """
+        tiled_node = TILED_METADATA_CACHE.get_node(tiled_client, self.uri)
+        tiled_data = tiled_node.client
+        if downsample is True:
+            stride = self._preview_stride(tiled_node.shape, thumbnail_size)
+        else:
+            stride = int(downsample) or 1
+
+        # Downsample the image dimensions, keeping any channel dimension
+        image_slice = (slice(None, None, stride),) * 2 if stride > 1 else ()
+        if len(tiled_data.shape) == 2:
+            if stride > 1:
+                return np.expand_dims(tiled_data[image_slice], axis=0)
+            return np.expand_dims(tiled_data, axis=0)
+        if len(tiled_data.shape) == 4 and stride > 1:
+            image_slice = (slice(None),) + image_slice
+
+        def read_range(index_range):
+            return tiled_data[(slice(*index_range),) + image_slice]
+
+        ranges = self._contiguous_ranges(indexes)
+        if len(ranges) == 1:
+            return read_range(ranges[0])
+        blocks = list(
+            get_executor("thread").map(
+                read_range, ranges, max_concurrency=TILED_READ_PARALLELISM
+            )
+        )
+        return np.concatenate(blocks, axis=0)
 
     def _get_tiled_uris(self, tiled_client, indexes):
         """
@@ -171,7 +451,7 @@ class TiledDataset(Dataset):
         Returns:
             List of tiled URIs
         """
-        tiled_metadata = tiled_client[self.uri]
+        tiled_metadata = TILED_METADATA_CACHE.get_node(tiled_client, self.uri)
         base_tiled_uri = tiled_metadata.uri
         if len(tiled_metadata.shape) > 2 and tiled_metadata.shape[0] > 1:
             base_tiled_uri.replace("/metadata/", "/array/full/")
@@ -202,15 +482,14 @@ class TiledDataset(Dataset):
             URI of the node
         """
         try:
-            tiled_client[f"/{node}/{sub_uri}"]
+            TILED_METADATA_CACHE.get_node(tiled_client, f"/{node}/{sub_uri}")
             return f"/{node}/{sub_uri}"
         except Exception:
             return None
 
     @staticmethod
     def _get_node_size(tiled_client, node):
-        tiled_array = tiled_client[node]
-        array_shape = tiled_array.shape
+        array_shape = TILED_METADATA_CACHE.get_node(tiled_client, node).shape
         if len(array_shape) == 2:
             return 1
         else:
@@ -228,8 +507,7 @@ class TiledDataset(Dataset):
         """
         get_node_size_with_client = partial(cls._get_node_size, tiled_client)
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            sizes = list(executor.map(get_node_size_with_client, nodes))
+        sizes = list(get_executor("thread").map(get_node_size_with_client, nodes))
 
         cumulative_dataset_size = [sum(sizes[: i + 1]) for i in range(len(sizes))]
         return cumulative_dataset_size
@@ -258,11 +536,14 @@ class TiledDataset(Dataset):
             # Check if the selected sub URIs are nodes
             tmp_sub_uris = []
             for sub_uri in selected_sub_uris:
-                if type(tiled_client[sub_uri]) is ArrayClient:
+                if TILED_METADATA_CACHE.get_node(tiled_client, sub_uri).is_array:
                     tmp_sub_uris.append(sub_uri)
                 else:
                     tmp_sub_uris += [
-                        f"{sub_uri}/{node}" for node in tiled_client[sub_uri]
+                        f"{sub_uri}/{node}"
+                        for node in TILED_METADATA_CACHE.get_children(
+                            tiled_client, sub_uri
+                        )
                     ]
             selected_sub_uris = tmp_sub_uris
 
@@ -276,15 +557,9 @@ class TiledDataset(Dataset):
         # Browse the tiled URI
         tiled_uris = []
         nodes = list(tiled_client)
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_node = {
-                executor.submit(
-                    cls._check_node, tiled_client, sub_uri_template, node
-                ): node
-                for node in nodes
-            }
-            for future in concurrent.futures.as_completed(future_to_node):
-                uri = future.result()
-                if uri is not None:
-                    tiled_uris.append(uri)
+        for uri in get_executor("thread").map(
+            partial(cls._check_node, tiled_client, sub_uri_template), nodes
+        ):
+            if uri is not None:
+                tiled_uris.append(uri)
         return tiled_uris, [0] * len(tiled_uris)
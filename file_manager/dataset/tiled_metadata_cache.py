@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from tiled.client.array import ArrayClient
+
+# Time to live in seconds and maximum number of cached tiled nodes
+TILED_METADATA_TTL = float(os.getenv("TILED_METADATA_TTL") or 60)
+TILED_METADATA_CACHE_SIZE = int(os.getenv("TILED_METADATA_CACHE_SIZE") or 4096)
+
+TiledNode = namedtuple(
+    "TiledNode", ["client", "uri", "shape", "dtype", "is_array", "etag"]
+)
+
+
+class TiledMetadataCache:
+    def __init__(self, ttl=TILED_METADATA_TTL, max_size=TILED_METADATA_CACHE_SIZE):
+        """
+        Cache of tiled node metadata (node client, shape, dtype, array vs container type
+        and attribute hash, and the children of containers), shared across TiledDataset
+        instances
+        Args:
+            ttl:            Time to live of a cached node in seconds
+            max_size:       Maximum number of cached nodes
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(tiled_client, node_uri, kind):
+        api_key = getattr(tiled_client.context, "api_key", None)
+        return (tiled_client.uri, api_key, node_uri, kind)
+
+    def _get(self, key, fetch):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = fetch()
+        with self._lock:
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_node(self, tiled_client, node_uri):
+        """
+        Get the metadata of a tiled node, fetching it only when it is not cached
+        Args:
+            tiled_client:   Tiled client
+            node_uri:       URI of the node relative to the client
+        Returns:
+            TiledNode
+        """
+
+        def fetch():
+            node = tiled_client[node_uri]
+            is_array = type(node) is ArrayClient
+            return TiledNode(
+                client=node,
+                uri=node.uri,
+                shape=tuple(node.shape) if is_array else None,
+                dtype=getattr(node, "dtype", None) if is_array else None,
+                is_array=is_array,
+                # Hash of the node attributes (structure and metadata), which does not
+                # change when the array data is rewritten in place
+                etag=hashlib.md5(
+                    json.dumps(
+                        node.item["attributes"], sort_keys=True, default=str
+                    ).encode("utf-8")
+                ).hexdigest(),
+            )
+
+        return self._get(self._key(tiled_client, node_uri, "node"), fetch)
+
+    def get_children(self, tiled_client, node_uri):
+        """
+        Get the names of the children of a tiled container
+        Args:
+            tiled_client:   Tiled client
+            node_uri:       URI of the node relative to the client
+        Returns:
+            List of children names
+        """
+        return self._get(
+            self._key(tiled_client, node_uri, "children"),
+            lambda: list(self.get_node(tiled_client, node_uri).client),
+        )
+
+    def invalidate(self, node_uri=None):
+        """
+        Invalidate the cached metadata of a node, or of all nodes
+        Args:
+            node_uri:       URI of the node, defaults to None
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if node_uri is None or key[2] == node_uri:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+TILED_METADATA_CACHE = TiledMetadataCache()
@@ -1,7 +1,6 @@
 import logging
 import os
 import pathlib
-import pickle
 import time
 import traceback
 import zipfile
@@ -9,13 +8,39 @@ import zipfile
 import dash
 import dash_bootstrap_components as dbc
 import dash_daq as daq
+import flask
 from dash import Input, Output, State, dcc, html
 from dash.exceptions import PreventUpdate
 
 from file_manager.dash_file_explorer import create_file_explorer
 from file_manager.data_project import DataProject
+from file_manager.dataset.directory_index import DirectoryIndex
+from file_manager.dataset.directory_watcher import DirectoryWatcher
+from file_manager.dataset.thumbnail_store import THUMBNAIL_STORE
+from file_manager.project_registry import PROJECT_REGISTRY
+from file_manager.project_store import DEFAULT_USER_ID, ProjectStore
+from file_manager.thumbnail_route import register_thumbnail_route
 
 DATA_DIR = os.getenv("DATA_DIR", ".")
+# Time in ms between two checks of the directory watcher by the browser
+WATCH_INTERVAL_MS = int(os.getenv("WATCH_INTERVAL_MS") or 5000)
+
+
+def user_id_from_header(header, default=DEFAULT_USER_ID):
+    """
+    Build a function that reads the user ID of the current request from a header, e.g.
+    set by an authenticating proxy
+    Args:
+        header:         Name of the header
+        default:        User ID of the requests without the header
+    Returns:
+        Function that returns the user ID of the current Flask request
+    """
+
+    def get_user_id():
+        return flask.request.headers.get(header) or default
+
+    return get_user_id
 
 
 # TODO: Deprecate upload_folder_root
@@ -28,6 +53,9 @@ class FileManager:
         open_explorer=True,
         api_key=None,
         logger=None,
+        user_id=DEFAULT_USER_ID,
+        watch=False,
+        thumbnail_encoder=None,
     ):
         """
         FileManager creates a dash file explorer that supports: (1) local file reading, and (2)
@@ -39,13 +67,32 @@ class FileManager:
             open_explorer:          [bool] Open/close the file explorer at start up
             api_key:                [str] Tiled API key
             logger:                 [logging.Logger] Logger object
+            user_id:                [str or callable] User ID under which the last project
+                                    is saved, or function that returns the user ID of the
+                                    current Flask request, e.g. user_id_from_header(...)
+            watch:                  [bool] Watch data_folder_root, keeping the file table
+                                    and the file project up to date, defaults to False
+            thumbnail_encoder:      [ThumbnailEncoder] Format and size of the thumbnails of
+                                    the data projects, defaults to DEFAULT_THUMBNAIL_ENCODER
         """
         self.data_folder_root = data_folder_root
         self.upload_folder_root = upload_folder_root
         self.max_file_size = max_file_size
         self.api_key = api_key
-        self.manager_filename = f"{DATA_DIR}/.file_manager_vars.pkl"
+        self.user_id = user_id
+        self.thumbnail_encoder = thumbnail_encoder
+        self.manager_filename = f"{DATA_DIR}/.file_manager_projects.db"
+        self.project_store = ProjectStore(self.manager_filename)
+        self.directory_index = DirectoryIndex(
+            self.data_folder_root, f"{DATA_DIR}/.file_manager_index.db"
+        )
         self.logger = logger or logging.getLogger(__name__)
+        self.watcher = None
+        if watch:
+            self.watcher = DirectoryWatcher(
+                self.data_folder_root, directory_index=self.directory_index
+            )
+            self.watcher.start()
         # Definition of the dash components for file manager
         self.file_explorer = html.Div(
             [
@@ -125,7 +172,12 @@ class FileManager:
                     ),
                 ),
                 dbc.Collapse(
-                    create_file_explorer(max_file_size, self.upload_folder_root),
+                    create_file_explorer(
+                        max_file_size,
+                        self.upload_folder_root,
+                        watch=watch,
+                        watch_interval=WATCH_INTERVAL_MS,
+                    ),
                     id={"base_id": "file-manager", "name": "collapse-explorer"},
                     is_open=open_explorer,
                 ),
@@ -139,6 +191,9 @@ class FileManager:
         Args:
             app:        Dash app that contains a file manager
         """
+        # Thumbnails of the data projects are served as image bytes
+        register_thumbnail_route(app.server, self.api_key, self.logger)
+
         app.callback(
             Output({"base_id": "file-manager", "name": "collapse-explorer"}, "is_open"),
             [
@@ -171,10 +226,18 @@ class FileManager:
             [
                 Input({"base_id": "file-manager", "name": "browse-format"}, "value"),
                 Input({"base_id": "file-manager", "name": "upload-data"}, "data"),
+                Input({"base_id": "file-manager", "name": "watch-generation"}, "data"),
             ],
         )(self._load_file_table)
         pass
 
+        app.callback(
+            Output({"base_id": "file-manager", "name": "watch-generation"}, "data"),
+            Input({"base_id": "file-manager", "name": "watch-interval"}, "n_intervals"),
+            State({"base_id": "file-manager", "name": "watch-generation"}, "data"),
+            prevent_initial_call=True,
+        )(self._check_watcher)
+
         app.long_callback(
             Output({"base_id": "file-manager", "name": "tiled-table"}, "data"),
             Output(
@@ -262,6 +325,7 @@ class FileManager:
                 Input({"base_id": "file-manager", "name": "import-dir"}, "n_clicks"),
                 Input({"base_id": "file-manager", "name": "refresh-data"}, "n_clicks"),
                 Input({"base_id": "file-manager", "name": "clear-data"}, "n_clicks"),
+                Input({"base_id": "file-manager", "name": "watch-generation"}, "data"),
                 State({"base_id": "file-manager", "name": "tabs"}, "value"),
                 State(
                     {"base_id": "file-manager", "name": "confirm-update-data"}, "data"
@@ -276,10 +340,66 @@ class FileManager:
                 State({"base_id": "file-manager", "name": "files-table"}, "data"),
                 State({"base_id": "file-manager", "name": "tiled-table"}, "data"),
                 State({"base_id": "file-manager", "name": "import-format"}, "value"),
+                State({"base_id": "file-manager", "name": "data-project-dict"}, "data"),
+                State({"base_id": "file-manager", "name": "user-id"}, "data"),
             ],
         )(self._load_dataset)
+
+        app.callback(
+            Output({"base_id": "file-manager", "name": "user-id"}, "data"),
+            Input({"base_id": "file-manager", "name": "tabs"}, "value"),
+        )(self._get_user_id)
         pass
 
+    def _build_thumbnails(self, data_project):
+        """
+        Precompute the thumbnails of a data project in the background, when the thumbnail
+        store is enabled
+        Args:
+            data_project:       DataProject
+        """
+        if not THUMBNAIL_STORE.enabled or len(data_project.datasets) == 0:
+            return
+
+        def build():
+            try:
+                data_project.build_thumbnails()
+            except Exception:
+                self.logger.error(f"Thumbnail build failed: {traceback.format_exc()}")
+
+        THUMBNAIL_STORE.submit(build)
+
+    def _get_user_id(self, tab_value=None):
+        """
+        This callback resolves the user of the session, in the Flask request context that
+        the long callbacks do not have
+        Args:
+            tab_value:          Tab indicating data access method (filesystem/tiled)
+        Returns:
+            user_id:            User ID under which the projects of the session are saved
+        """
+        if callable(self.user_id):
+            return self.user_id()
+        return self.user_id
+
+    def _load_project(self, data_project_dict):
+        """
+        Build a private copy of the data project of a session, which can be refreshed
+        without modifying the project shown in other sessions
+        Args:
+            data_project_dict:  Data project dictionary or PROJECT_REGISTRY reference
+        Returns:
+            DataProject, None if the project is no longer registered
+        """
+        if not PROJECT_REGISTRY.is_reference(data_project_dict):
+            return DataProject.from_dict(data_project_dict, api_key=self.api_key)
+        try:
+            return PROJECT_REGISTRY.load(
+                data_project_dict, DataProject.from_dict, api_key=self.api_key
+            )
+        except KeyError:
+            return None
+
     @staticmethod
     def _toggle_collapse(collapse_n_clicks, import_n_clicks, refresh_n_clicks, is_open):
         """
@@ -330,12 +450,26 @@ class FileManager:
                 os.remove(path_to_zip_file)
         return True
 
-    def _load_file_table(self, browse_format, uploaded_data):
+    def _check_watcher(self, n_intervals, watch_generation):
+        """
+        This callback checks if the directory watcher detected changes
+        Args:
+            n_intervals:        Number of checks
+            watch_generation:   Generation of the watcher at the last update
+        Returns:
+            watch_generation:   Current generation of the watcher
+        """
+        if self.watcher is None or not self.watcher.changed_since(watch_generation):
+            raise PreventUpdate
+        return self.watcher.generation
+
+    def _load_file_table(self, browse_format, uploaded_data, watch_generation=None):
         """
         This callback updates the content of the file table
         Args:
             browse_format:      File extension to browse
             uploaded_data:      Flag that indicates if new data has been uploaded
+            watch_generation:   Generation of the directory watcher
         Returns:
             table_data:         Updated table data according to browsing selection
         """
@@ -344,6 +478,7 @@ class FileManager:
         )
         browse_data = data_project.browse_data(
             browse_format,
+            directory_index=self.directory_index,
         )
         return [{"uri": dataset.uri} for dataset in browse_data]
 
@@ -402,6 +537,7 @@ class FileManager:
         import_n_clicks,
         refresh_data,
         clear_data_n_clicks,
+        watch_generation,
         tab_value,
         update_data,
         file_rows,
@@ -410,6 +546,8 @@ class FileManager:
         files_table,
         tiled_table,
         import_format,
+        data_project_dict=None,
+        user_id=None,
     ):
         """
         This callback manages the actions of file manager
@@ -419,6 +557,7 @@ class FileManager:
             refresh_data:           Number of clicks on refresh data button
             uploaded_data:          Flag that indicates if new data has been uploaded
             clear_data_n_clicks:    Number of clicks on clear data button
+            watch_generation:       Generation of the directory watcher
             tab_value:              Tab indicating data access method (filesystem/tiled)
             update_data:            Flag that indicates if the dataset can be updated
             file_rows:              Selected rows in table of files/directories
@@ -427,18 +566,26 @@ class FileManager:
             files_table:            Current values within the table of files/directories/nodes
             tiled_table:            Current values within the table of tiled data
             import_format:          File extension to import
+            data_project_dict:      Reference to the current data project of the session
+            user_id:                User ID of the session
         Returns:
-            data_project_dict:      Dictionary containing the data project
+            data_project_dict:      Reference to the data project in PROJECT_REGISTRY
             tiled_warning_modal:    Open warning indicating that the connection to tiled failed
             tab_value:              Tab indicating data access method (filesystem/tiled)
             total_num_data_points:  Total number of data points in the data project
         """
         start = time.time()
         changed_id = dash.callback_context.triggered[0]["prop_id"]
+        if user_id is None:
+            # The user of the session is resolved per request
+            if callable(self.user_id):
+                raise PreventUpdate
+            user_id = self.user_id
         data_project = DataProject(
             data_type=tab_value,
             root_uri=str(self.data_folder_root) if tab_value == "file" else tiled_uri,
             api_key=self.api_key,
+            encoder=self.thumbnail_encoder,
         )
         # prevent update according to update_data flag
         if (
@@ -455,15 +602,42 @@ class FileManager:
         elif "clear-data" in changed_id:
             return {}, dash.no_update, dash.no_update, dash.no_update
 
-        elif "refresh-data" in changed_id and os.path.exists(self.manager_filename):
-            with open(self.manager_filename, "rb") as file:
-                data_project_dict = pickle.load(file)
-            data_project = DataProject.from_dict(data_project_dict)
-            self.logger.debug(f"Data project refreshed after {time.time() - start}")
+        elif "refresh-data" in changed_id or "watch-generation" in changed_id:
+            watch = "watch-generation" in changed_id
+            data_project = None
+            if data_project_dict:
+                # Private copy, the registered project is shared with other sessions
+                data_project = self._load_project(data_project_dict)
+            elif watch:
+                raise PreventUpdate
+            if data_project is None and not watch:
+                # The saved project also reloads a reference that expired from the
+                # registry
+                data_project, _ = self.project_store.load(user_id, api_key=self.api_key)
+            # Watched changes only apply to file projects
+            if data_project is None or (watch and data_project.data_type != "file"):
+                raise PreventUpdate
+            data_project.encoder = self.thumbnail_encoder
+            try:
+                diffs = data_project.refresh(directory_index=self.directory_index)
+            except Exception:
+                self.logger.error(f"Refresh failed: {traceback.format_exc()}")
+                return dash.no_update, True, tab_value, dash.no_update
+            num_added = sum(len(diff.added) for diff in diffs)
+            num_removed = sum(len(diff.removed) for diff in diffs)
+            if watch and num_added == 0 and num_removed == 0:
+                raise PreventUpdate
+            # Only the datasets that changed are rewritten
+            self.project_store.save(data_project, user_id)
+            self._build_thumbnails(data_project)
+            self.logger.info(
+                f"Data project refreshed after {time.time() - start}: {num_added} "
+                f"added, {num_removed} removed"
+            )
             return (
-                data_project_dict,
+                PROJECT_REGISTRY.put(data_project),
                 dash.no_update,
-                tab_value,
+                dash.no_update if watch else tab_value,
                 data_project.datasets[-1].cumulative_data_count,
             )
 
@@ -474,6 +648,7 @@ class FileManager:
             data_project.datasets = data_project.browse_data(
                 import_format,
                 selected_sub_uris=selected_rows,
+                directory_index=self.directory_index,
             )
 
         elif bool(tiled_rows):
@@ -496,14 +671,14 @@ class FileManager:
         else:
             total_num_data_points = data_project.datasets[-1].cumulative_data_count
 
-        data_project_dict = data_project.to_dict()
-
         if len(data_project.datasets) > 0:
-            with open(self.manager_filename, "wb") as file:
-                pickle.dump(
-                    data_project_dict,
-                    file,
-                )
+            self.project_store.save(data_project, user_id)
+            self._build_thumbnails(data_project)
 
         self.logger.debug(f"Data project loaded after {time.time() - start}")
-        return data_project_dict, dash.no_update, dash.no_update, total_num_data_points
+        return (
+            PROJECT_REGISTRY.put(data_project),
+            dash.no_update,
+            dash.no_update,
+            total_num_data_points,
+        )
@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE, ThumbnailCache
+
+# Number of background prefetch threads, maximum size in bytes of the images read by the
+# prefetches in flight, across all keys, and number of data points read per prefetch task
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS") or 2)
+PREFETCH_MEMORY_BUDGET = int(
+    os.getenv("PREFETCH_MEMORY_BUDGET") or THUMBNAIL_CACHE.max_bytes // 8
+)
+PREFETCH_BATCH_SIZE = int(os.getenv("PREFETCH_BATCH_SIZE") or 32)
+
+
+class Prefetcher:
+    def __init__(
+        self, max_workers=PREFETCH_WORKERS, memory_budget=PREFETCH_MEMORY_BUDGET
+    ):
+        """
+        Background reads that warm the thumbnail cache. Each prefetch supersedes the
+        previous prefetch of the same key, e.g. of the same browser session: its batches
+        that did not start are skipped. The images fetched by the prefetches in flight
+        are charged to a memory budget shared by all the keys, and batches stop once it
+        is exceeded, so that prefetches evict at most the budget and one batch per thread
+        from the cache, whatever the number of sessions. The state and the charge of a
+        key are dropped once all its batches are done
+        Args:
+            max_workers:    Number of background prefetch threads
+            memory_budget:  Maximum size in bytes of the images read by the prefetches in
+                            flight
+        """
+        self.max_workers = max_workers
+        self.memory_budget = memory_budget
+        self._executor = None
+        self._generations = {}
+        self._futures = {}
+        self._charges = {}
+        self.charged_bytes = 0
+        # Reentrant, cancelled futures run their done callbacks while the lock is held
+        self._lock = threading.RLock()
+        self.batches = 0
+        self.cancelled = 0
+        self.over_budget = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="file-manager-prefetch"
+            )
+        return self._executor
+
+    def _cancel(self, key):
+        # Called with the lock held
+        for future in self._futures.pop(key, []):
+            if future.cancel():
+                self.cancelled += 1
+        self.charged_bytes -= self._charges.pop(key, 0)
+
+    def submit(self, key, read_batch, batches):
+        """
+        Prefetch batches in the background, cancelling the previous prefetch of the key
+        Args:
+            key:            Key of the prefetch, e.g. the browser session it is done for
+            read_batch:     Function that reads a batch and returns the images it
+                            fetched, without the ones that were already cached
+            batches:        List of batches, in order of priority
+        Returns:
+            List of futures, with the number of bytes read by each batch
+        """
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            self._cancel(key)
+            executor = self._get_executor()
+            futures = [
+                executor.submit(self._run, key, generation, read_batch, batch)
+                for batch in batches
+            ]
+            self._futures[key] = futures
+        for future in futures:
+            future.add_done_callback(partial(self._prune, key, generation))
+        return futures
+
+    def _prune(self, key, generation, future):
+        # Forget a key once the batches of its latest prefetch are all done
+        with self._lock:
+            if self._generations.get(key) != generation:
+                return
+            if all(future.done() for future in self._futures.get(key, [])):
+                self._cancel(key)
+                self._generations.pop(key, None)
+
+    def cancel(self, key):
+        """
+        Cancel the prefetch of a key
+        Args:
+            key:            Key of the prefetch
+        """
+        with self._lock:
+            self._cancel(key)
+            self._generations.pop(key, None)
+
+    def _run(self, key, generation, read_batch, batch):
+        with self._lock:
+            if self._generations.get(key) != generation:
+                self.cancelled += 1
+                return 0
+            if self.charged_bytes >= self.memory_budget:
+                self.over_budget += 1
+                return 0
+        images = read_batch(batch)
+        size = sum(ThumbnailCache._sizeof(image) for image in images)
+        with self._lock:
+            # Superseded prefetches are not charged, their charge was released
+            if self._generations.get(key) == generation:
+                self._charges[key] = self._charges.get(key, 0) + size
+                self.charged_bytes += size
+            self.batches += 1
+        return size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "cancelled": self.cancelled,
+                "over_budget": self.over_budget,
+                "charged_bytes": self.charged_bytes,
+            }
+
+
+PREFETCHER = Prefetcher()
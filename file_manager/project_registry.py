@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import diskcache
+
+# Directory where the registered data projects are stored, next to the project store so
+# that the references held by the browsers outlive restarts, and number of built projects
+# kept in memory
+PROJECT_REGISTRY_DIR = os.getenv("PROJECT_REGISTRY_DIR") or os.path.join(
+    os.getenv("DATA_DIR", "."), ".file_manager_registry"
+)
+PROJECT_REGISTRY_CACHE_SIZE = int(os.getenv("PROJECT_REGISTRY_CACHE_SIZE") or 16)
+
+
+class ProjectRegistry:
+    def __init__(
+        self, directory=PROJECT_REGISTRY_DIR, max_size=PROJECT_REGISTRY_CACHE_SIZE
+    ):
+        """
+        Server-side store of data projects, so that clients only exchange a small
+        reference (project ID and content hash) instead of the full project dictionary.
+        Built projects are kept in memory, and their dictionaries are persisted to disk so
+        that other worker processes and restarts can resolve the references
+        Args:
+            directory:      Directory of the disk store
+            max_size:       Maximum number of built projects kept in memory
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._projects = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_disk(self):
+        if self._disk is None:
+            self._disk = diskcache.Cache(self.directory)
+        return self._disk
+
+    def _remember(self, key, data_project):
+        with self._lock:
+            self._projects[key] = data_project
+            self._projects.move_to_end(key)
+            while len(self._projects) > self.max_size:
+                self._projects.popitem(last=False)
+
+    @staticmethod
+    def is_reference(data_project_dict):
+        """
+        Check if a data project dictionary is a registry reference
+        Args:
+            data_project_dict:  Data project dictionary or reference
+        Returns:
+            True if the dictionary is a reference
+        """
+        return "content_hash" in data_project_dict
+
+    def put(self, data_project):
+        """
+        Register a data project
+        Args:
+            data_project:   DataProject
+        Returns:
+            Reference to the project, with its project ID and content hash
+        """
+        # Filenames are stored by reference, the project dictionary stays small
+        data_project_dict = data_project.to_dict(filenames_mode="reference")
+        content_hash = hashlib.sha256(
+            json.dumps(data_project_dict, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:32]
+        disk = self._get_disk()
+        if content_hash not in disk:
+            disk[content_hash] = data_project_dict
+        self._remember((content_hash, data_project.api_key), data_project)
+        return {"project_id": data_project.project_id, "content_hash": content_hash}
+
+    def get(self, project_reference, from_dict, api_key=None):
+        """
+        Get a registered data project, building it only when it is not in memory
+        Args:
+            project_reference:  Reference returned by put
+            from_dict:          Function that builds the project from its dictionary
+            api_key:            API key of the project
+        Returns:
+            DataProject, shared across callers
+        """
+        key = (project_reference["content_hash"], api_key)
+        with self._lock:
+            data_project = self._projects.get(key)
+            if data_project is not None:
+                self._projects.move_to_end(key)
+                self.hits += 1
+                return data_project
+            self.misses += 1
+        data_project_dict = self._get_disk().get(key[0])
+        if data_project_dict is None:
+            raise KeyError(f"Unknown data project: {project_reference}")
+        data_project = from_dict(data_project_dict, api_key=api_key)
+        self._remember(key, data_project)
+        return data_project
+
+    def load(self, project_reference, from_dict, api_key=None):
+        """
+        Build a private copy of a registered data project, which can be modified without
+        affecting the callers that share the registered instance
+        Args:
+            project_reference:  Reference returned by put
+            from_dict:          Function that builds the project from its dictionary
+            api_key:            API key of the project
+        Returns:
+            New DataProject
+        """
+        data_project_dict = self._get_disk().get(project_reference["content_hash"])
+        if data_project_dict is None:
+            raise KeyError(f"Unknown data project: {project_reference}")
+        return from_dict(data_project_dict, api_key=api_key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._projects),
+            }
+
+
+PROJECT_REGISTRY = ProjectRegistry()
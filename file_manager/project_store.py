@@ -0,0 +1,339 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.filename_list import FilenameList
+from file_manager.dataset.tiled_dataset import TiledDataset
+
+# Version of the database layout, stored in the SQLite user_version
+SCHEMA_VERSION = 1
+DEFAULT_USER_ID = "default"
+# Name of the project that is saved on import and loaded on refresh
+DEFAULT_PROJECT_NAME = "last"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS projects (
+        user_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        root_uri TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        project_id TEXT,
+        num_datasets INTEGER NOT NULL,
+        updated REAL NOT NULL,
+        PRIMARY KEY (user_id, name)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS datasets (
+        user_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        dataset TEXT NOT NULL,
+        prefix_lengths BLOB,
+        offsets BLOB,
+        suffixes BLOB,
+        PRIMARY KEY (user_id, name, position)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+class ProjectVersionError(Exception):
+    pass
+
+
+class ProjectStore:
+    def __init__(self, db_path):
+        """
+        Persistent SQLite store of data projects, keyed by user and project name. Every
+        write is a single transaction and bumps the version of the project, and only the
+        datasets that changed are rewritten. Filenames are stored as the binary buffers
+        of their FilenameList, so loading a large project does not parse them
+        Args:
+            db_path:        Path to the SQLite database
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Connections are per thread and process, and cannot be pickled
+        return {"db_path": self.db_path}
+
+    def __setstate__(self, state):
+        self.__init__(state["db_path"])
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                version = connection.execute("PRAGMA user_version").fetchone()[0]
+                if version > SCHEMA_VERSION:
+                    raise ProjectVersionError(
+                        f"{self.db_path} has schema version {version}, newer than "
+                        f"{SCHEMA_VERSION}"
+                    )
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _dataset_row(dataset):
+        """
+        Serialize a dataset
+        Args:
+            dataset:        FileDataset or TiledDataset
+        Returns:
+            Content hash, JSON description and filename buffers of the dataset
+        """
+        if isinstance(dataset, FileDataset):
+            description = {
+                "uri": dataset.uri,
+                "cumulative_data_count": dataset.cumulative_data_count,
+            }
+            if dataset.frame_counts is not None:
+                description["frame_counts"] = dataset.frame_counts.tolist()
+            if dataset.formats is not None:
+                description["formats"] = dataset.formats
+            if dataset.directory_mtimes is not None:
+                description["directory_mtimes"] = dataset.directory_mtimes
+            filenames = dataset.filename_list()
+            buffers = filenames.to_buffers()
+            content = json.dumps(description, sort_keys=True) + filenames.ref
+        else:
+            description = dataset.to_dict()
+            buffers = (None, None, None)
+            content = json.dumps(description, sort_keys=True)
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+        return content_hash, json.dumps(description), buffers
+
+    @staticmethod
+    def _dataset_from_row(data_type, description, prefix_lengths, offsets, suffixes):
+        description = json.loads(description)
+        if data_type != "file":
+            return TiledDataset.from_dict(description)
+        filenames = FilenameList.from_buffers(
+            np.frombuffer(prefix_lengths, dtype=np.int32),
+            np.frombuffer(offsets, dtype=np.int64),
+            suffixes,
+        )
+        return FileDataset(
+            description["uri"],
+            description["cumulative_data_count"],
+            filenames,
+            description.get("frame_counts"),
+            description.get("formats"),
+            description.get("directory_mtimes"),
+        )
+
+    def _begin(self, connection, user_id, name):
+        # Take the write lock before reading, so that concurrent writers serialize
+        connection.execute("BEGIN IMMEDIATE")
+        return connection.execute(
+            "SELECT version, num_datasets FROM projects WHERE user_id = ? AND name = ?",
+            (user_id, name),
+        ).fetchone()
+
+    @staticmethod
+    def _check_version(row, expected_version):
+        version = row[0] if row is not None else 0
+        if expected_version is not None and version != expected_version:
+            raise ProjectVersionError(
+                f"Project is at version {version}, expected {expected_version}"
+            )
+        return version
+
+    def save(
+        self,
+        data_project,
+        user_id=DEFAULT_USER_ID,
+        name=DEFAULT_PROJECT_NAME,
+        expected_version=None,
+    ):
+        """
+        Save a data project, rewriting only the datasets that changed
+        Args:
+            data_project:       DataProject
+            user_id:            User ID, defaults to DEFAULT_USER_ID
+            name:               Project name, defaults to DEFAULT_PROJECT_NAME
+            expected_version:   Version the project must be at, raising
+                                ProjectVersionError otherwise, defaults to None (no check)
+        Returns:
+            New version of the project
+        """
+        rows = [self._dataset_row(dataset) for dataset in data_project.datasets]
+        connection = self._connection()
+        with connection:
+            project = self._begin(connection, user_id, name)
+            version = self._check_version(project, expected_version) + 1
+            stored_hashes = dict(
+                connection.execute(
+                    "SELECT position, content_hash FROM datasets "
+                    "WHERE user_id = ? AND name = ?",
+                    (user_id, name),
+                ).fetchall()
+            )
+            connection.execute(
+                "DELETE FROM datasets WHERE user_id = ? AND name = ? AND position >= ?",
+                (user_id, name, len(rows)),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (user_id, name, position, content_hash, description, *buffers)
+                    for position, (content_hash, description, buffers) in enumerate(
+                        rows
+                    )
+                    if stored_hashes.get(position) != content_hash
+                ],
+            )
+            self._write_project(connection, user_id, name, version, data_project, rows)
+        return version
+
+    def append_datasets(
+        self,
+        datasets,
+        user_id=DEFAULT_USER_ID,
+        name=DEFAULT_PROJECT_NAME,
+        expected_version=None,
+    ):
+        """
+        Append datasets to a saved data project, without rewriting the stored datasets
+        Args:
+            datasets:           List of datasets, with cumulative data counts that follow
+                                the ones of the project
+            user_id:            User ID, defaults to DEFAULT_USER_ID
+            name:               Project name, defaults to DEFAULT_PROJECT_NAME
+            expected_version:   Version the project must be at, raising
+                                ProjectVersionError otherwise, defaults to None (no check)
+        Returns:
+            New version of the project
+        """
+        rows = [self._dataset_row(dataset) for dataset in datasets]
+        connection = self._connection()
+        with connection:
+            project = self._begin(connection, user_id, name)
+            if project is None:
+                raise KeyError(f"Unknown data project: {user_id}/{name}")
+            version = self._check_version(project, expected_version) + 1
+            num_datasets = project[1]
+            connection.executemany(
+                "INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        user_id,
+                        name,
+                        num_datasets + position,
+                        content_hash,
+                        description,
+                        *buffers,
+                    )
+                    for position, (content_hash, description, buffers) in enumerate(
+                        rows
+                    )
+                ],
+            )
+            connection.execute(
+                "UPDATE projects SET version = ?, num_datasets = ?, updated = ? "
+                "WHERE user_id = ? AND name = ?",
+                (version, num_datasets + len(rows), time.time(), user_id, name),
+            )
+        return version
+
+    @staticmethod
+    def _write_project(connection, user_id, name, version, data_project, rows):
+        connection.execute(
+            "INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                name,
+                version,
+                data_project.root_uri,
+                data_project.data_type,
+                data_project.project_id,
+                len(rows),
+                time.time(),
+            ),
+        )
+
+    def load(self, user_id=DEFAULT_USER_ID, name=DEFAULT_PROJECT_NAME, api_key=None):
+        """
+        Load a saved data project
+        Args:
+            user_id:            User ID, defaults to DEFAULT_USER_ID
+            name:               Project name, defaults to DEFAULT_PROJECT_NAME
+            api_key:            API key of the project
+        Returns:
+            DataProject and its version, or (None, 0) if the project was never saved
+        """
+        connection = self._connection()
+        # A single read transaction sees a consistent project and datasets
+        with connection:
+            connection.execute("BEGIN")
+            project = connection.execute(
+                "SELECT version, root_uri, data_type, project_id, num_datasets "
+                "FROM projects WHERE user_id = ? AND name = ?",
+                (user_id, name),
+            ).fetchone()
+            if project is None:
+                return None, 0
+            version, root_uri, data_type, project_id, num_datasets = project
+            rows = connection.execute(
+                "SELECT dataset, prefix_lengths, offsets, suffixes FROM datasets "
+                "WHERE user_id = ? AND name = ? AND position < ? ORDER BY position",
+                (user_id, name, num_datasets),
+            ).fetchall()
+        datasets = [self._dataset_from_row(data_type, *row) for row in rows]
+        data_project = DataProject(
+            root_uri,
+            data_type,
+            api_key=api_key,
+            datasets=datasets,
+            project_id=project_id,
+        )
+        return data_project, version
+
+    def delete(self, user_id=DEFAULT_USER_ID, name=DEFAULT_PROJECT_NAME):
+        """
+        Delete a saved data project
+        Args:
+            user_id:            User ID, defaults to DEFAULT_USER_ID
+            name:               Project name, defaults to DEFAULT_PROJECT_NAME
+        """
+        connection = self._connection()
+        with connection:
+            for table in ("projects", "datasets"):
+                connection.execute(
+                    f"DELETE FROM {table} WHERE user_id = ? AND name = ?",
+                    (user_id, name),
+                )
+
+    def list_projects(self, user_id=DEFAULT_USER_ID):
+        """
+        List the saved data projects of a user
+        Args:
+            user_id:            User ID, defaults to DEFAULT_USER_ID
+        Returns:
+            List of (name, version, updated) tuples
+        """
+        return (
+            self._connection()
+            .execute(
+                "SELECT name, version, updated FROM projects WHERE user_id = ? ORDER BY name",
+                (user_id,),
+            )
+            .fetchall()
+        )
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import traceback
+from urllib.parse import urlencode
+
+from flask import Response, abort, request
+
+from file_manager.data_project import DataProject
+from file_manager.dataset.thumbnail_encoder import DEFAULT_THUMBNAIL_ENCODER
+
+# URL prefix of the thumbnail route, and time in seconds during which browsers reuse a
+# thumbnail before revalidating it with its ETag
+THUMBNAIL_ROUTE = os.getenv("THUMBNAIL_ROUTE") or "/file-manager/thumbnails"
+THUMBNAIL_MAX_AGE = int(os.getenv("THUMBNAIL_MAX_AGE") or 3600)
+
+ENDPOINT = "file_manager_thumbnail"
+
+
+def thumbnail_url(
+    project_reference, index, log=False, percentiles=[0, 100], downsample=False
+):
+    """
+    URL of the thumbnail of a data point, served by the thumbnail route
+    Args:
+        project_reference:  Reference to the data project in PROJECT_REGISTRY
+        index:              Global index of the data point
+        log:                Take logarithm of the data, defaults to False
+        percentiles:        Percentiles for normalization, defaults to [0, 100]
+        downsample:         Fetch tiled previews strided down to the thumbnail size,
+                            defaults to False
+    Returns:
+        URL of the thumbnail
+    """
+    query = {}
+    if log:
+        query["log"] = 1
+    if list(percentiles) != [0, 100]:
+        query["percentiles"] = f"{percentiles[0]},{percentiles[1]}"
+    if downsample:
+        query["downsample"] = int(downsample)
+    url = f"{THUMBNAIL_ROUTE}/{project_reference['content_hash']}/{int(index)}/thumb"
+    if query:
+        url = f"{url}?{urlencode(query)}"
+    return url
+
+
+def _parse_query(args):
+    try:
+        log = args.get("log", "0") not in ("0", "false", "")
+        percentiles = [
+            float(value) for value in args.get("percentiles", "0,100").split(",")
+        ]
+        downsample = int(args.get("downsample", 0))
+    except ValueError:
+        abort(400)
+    if len(percentiles) != 2:
+        abort(400)
+    return log, percentiles, True if downsample == 1 else downsample
+
+
+def _etag(content_hash, index, log, percentiles, downsample, version=None):
+    # The content hash of the project covers its datasets and its encoder, and the
+    # version of the source covers files and nodes modified in place
+    key = f"{content_hash}/{index}/{int(log)}/{percentiles}/{downsample}/{version}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def register_thumbnail_route(server, api_key=None, logger=None):
+    """
+    Register the route that serves the thumbnails of the registered data projects as
+    encoded image bytes, at THUMBNAIL_ROUTE/<content hash>/<index>/thumb. Responses carry
+    a strong ETag, which covers the version of the source, and a Cache-Control header,
+    so that revisited thumbnails are served from the browser cache or answered with a
+    304
+    Args:
+        server:         Flask server of the Dash app
+        api_key:        API key of the data projects
+        logger:         Logger
+    """
+    if ENDPOINT in server.view_functions:
+        return
+    logger = logger or logging.getLogger(__name__)
+
+    def send_thumbnail(content_hash, index):
+        log, percentiles, downsample = _parse_query(request.args)
+        try:
+            data_project = DataProject.from_dict(
+                {"content_hash": content_hash}, api_key=api_key
+            )
+        except KeyError:
+            abort(404)
+        num_data_points = (
+            data_project.datasets[-1].cumulative_data_count
+            if len(data_project.datasets) > 0
+            else 0
+        )
+        if index >= num_data_points:
+            abort(404)
+        try:
+            version = data_project.source_versions([index])[0]
+        except Exception:
+            logger.error(f"Thumbnail version failed: {traceback.format_exc()}")
+            abort(500)
+        etag = _etag(content_hash, index, log, percentiles, downsample, version)
+        cache_control = f"private, max-age={THUMBNAIL_MAX_AGE}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            try:
+                images, _ = data_project.read_datasets(
+                    [index],
+                    export="bytes",
+                    log=log,
+                    percentiles=percentiles,
+                    downsample=downsample,
+                )
+            except Exception:
+                logger.error(f"Thumbnail failed: {traceback.format_exc()}")
+                abort(500)
+            encoder = data_project.encoder or DEFAULT_THUMBNAIL_ENCODER
+            response = Response(images[0], mimetype=encoder.mime_type)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = cache_control
+        return response
+
+    server.add_url_rule(
+        f"{THUMBNAIL_ROUTE}/<content_hash>/<int:index>/thumb",
+        ENDPOINT,
+        send_thumbnail,
+    )
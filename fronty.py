@@ -17,6 +17,7 @@ from PIL import Image
 
 from file_manager.data_project import DataProject
 from file_manager.main import FileManager
+from file_manager.thumbnail_route import thumbnail_url
 from plot_utils import draw_rows, get_mask_options
 
 load_dotenv()
@@ -70,6 +71,12 @@ app.layout = html.Div(
             [
                 html.H1("MLExchange File Manager Example"),
                 dash_file_explorer.file_explorer,
+                dbc.Alert(
+                    "The data project expired, please reload it",
+                    id="project-expired",
+                    color="warning",
+                    is_open=False,
+                ),
                 html.P(""),
                 dbc.Row(
                     [
@@ -146,6 +153,10 @@ app.layout = html.Div(
                                                         dcc.Store(
                                                             id="current-page", data=0
                                                         ),
+                                                        dcc.Store(
+                                                            id="session-id",
+                                                            storage_type="session",
+                                                        ),
                                                     ],
                                                 ),
                                                 dcc.Tab(
@@ -239,6 +250,19 @@ app.clientside_callback(
 )
 
 
+# ID of the browser tab, which keys its prefetches
+app.clientside_callback(
+    """
+    function(id, session_id) {
+        return session_id || Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+    """,
+    Output("session-id", "data"),
+    Input("session-id", "id"),
+    State("session-id", "data"),
+)
+
+
 @app.callback(
     Output("selected-mask-store", "src"),
     Input("mask-dropdown", "value"),
@@ -264,15 +288,26 @@ def update_mask(value):
     Output({"type": "thumbnail-card", "index": ALL}, "style"),
     Output({"type": "thumbnail-name", "index": ALL}, "children"),
     Output({"type": "processed-data-store", "index": ALL}, "data"),
+    Output("project-expired", "is_open", allow_duplicate=True),
     Input({"base_id": "file-manager", "name": "data-project-dict"}, "data"),
     Input("current-page", "data"),
+    State("session-id", "data"),
     prevent_initial_call=True,
 )
-@memoize_cache.memoize(timeout=TIMEOUT)
-def update_page(data_project_dict, current_page):
+def update_page(data_project_dict, current_page, session_id):
     """
     This callback updates the page
     """
+    # Expired projects are not memoized, the page is shown again once it is reloaded
+    try:
+        return _update_page(data_project_dict, current_page, session_id) + (False,)
+    except KeyError:
+        logger.warning(f"Data project expired: {data_project_dict}")
+        return (dash.no_update,) * 7 + (True,)
+
+
+@memoize_cache.memoize(timeout=TIMEOUT)
+def _update_page(data_project_dict, current_page, session_id):
     log = False
     if data_project_dict:
         data_project = DataProject.from_dict(data_project_dict)
@@ -283,13 +318,33 @@ def update_page(data_project_dict, current_page):
             if end > data_project.datasets[-1].cumulative_data_count:
                 end = data_project.datasets[-1].cumulative_data_count
             start_time = time.time()
-            src_data, filenames = data_project.read_datasets(
-                list(range(start, end)),
-                log=log,
+            indices = list(range(start, end))
+            # Warm the thumbnail cache with a single batched read of the page, so that
+            # the thumbnail route, from which the browser fetches and caches the
+            # thumbnails, serves cache hits
+            _, filenames = data_project.read_datasets(
+                indices, export="bytes", log=log, downsample=True
             )
+            src_data = [
+                thumbnail_url(data_project_dict, index, log=log, downsample=True)
+                for index in indices
+            ]
             logger.info(
                 f"Time to read page {current_page} {len(src_data)} images: {time.time() - start_time}"
             )
+            # Warm the thumbnail cache for the next and previous pages, as read by the
+            # thumbnail route, cancelling the prefetch of the page this tab displayed
+            # before
+            num_data_points = data_project.datasets[-1].cumulative_data_count
+            if session_id is not None:
+                data_project.prefetch(
+                    list(range(end, min(end + n_images, num_data_points)))
+                    + list(range(max(start - n_images, 0), start)),
+                    session_id,
+                    export="bytes",
+                    log=log,
+                    downsample=True,
+                )
             return (
                 False,
                 [0, 255],
@@ -339,15 +394,21 @@ def update_page_next(next_page, current_page, total_num_data_points):
 
 @app.callback(
     Output("download-data", "data"),
+    Output("project-expired", "is_open", allow_duplicate=True),
     Input("download-button", "n_clicks"),
     State({"base_id": "file-manager", "name": "data-project-dict"}, "data"),
+    prevent_initial_call=True,
 )
 def download_data(n_clicks, data_project_dict):
     if n_clicks:
-        data_project = DataProject.from_dict(data_project_dict)
+        try:
+            data_project = DataProject.from_dict(data_project_dict)
+        except KeyError:
+            logger.warning(f"Data project expired: {data_project_dict}")
+            return dash.no_update, True
         data_project.tiled_to_local_project([0, 2, 4])
-        return "download"
-    return dash.no_update
+        return "download", dash.no_update
+    return dash.no_update, dash.no_update
 
 
 @app.callback(
@@ -358,6 +419,7 @@ def download_data(n_clicks, data_project_dict):
     Output("img-slider", "max"),
     Output("img-slider", "value"),
     Output("img-label", "children"),
+    Output("project-expired", "is_open", allow_duplicate=True),
     Input({"base_id": "file-manager", "name": "data-project-dict"}, "data"),
     Input("img-slider", "value"),
     prevent_initial_call=True,
@@ -373,9 +435,14 @@ def refresh_image(data_project_dict, img_ind):
         img-slider-max:     Maximum value of the slider according to the dataset (train vs test)
         img-slider-value:   Current value of the slider
         label-output:       Output data set uri
+        project-expired:    Open warning indicating that the data project expired
     """
     if data_project_dict:
-        data_project = DataProject.from_dict(data_project_dict)
+        try:
+            data_project = DataProject.from_dict(data_project_dict)
+        except KeyError:
+            logger.warning(f"Data project expired: {data_project_dict}")
+            return (dash.no_update,) * 7 + (True,)
         if len(data_project.datasets) > 0:
             slider_max = data_project.datasets[-1].cumulative_data_count - 1
             if img_ind > slider_max:
@@ -391,9 +458,9 @@ def refresh_image(data_project_dict, img_ind):
             uri = dash.no_update
             slider_max = 0
             img_ind = 0
-        return False, 255, 0, image, slider_max, img_ind, uri
+        return False, 255, 0, image, slider_max, img_ind, uri, False
     else:
-        return True, dash.no_update, dash.no_update, None, 0, 0, ""
+        return True, dash.no_update, dash.no_update, None, 0, 0, "", False
 
 
 if __name__ == "__main__":
@@ -28,4 +28,5 @@ setup(
     project_urls={"Source": "https://github.com/mlexchange/mlex_file_manager.git"},
     python_requires=">=3.10",
     install_requires=required,
+    extras_require={"watch": ["watchfiles"]},
 )
@@ -0,0 +1,143 @@
+import os
+import pickle
+import time
+
+import pytest
+
+import file_manager.dataset.directory_index as directory_index
+from file_manager.dataset.directory_index import DirectoryIndex
+from file_manager.dataset.file_dataset import FileDataset
+
+# Modification time old enough not to be racy
+OLD_NS = time.time_ns() - 3600 * 10**9
+
+
+def touch(path, mtime_ns=OLD_NS):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def settle(*directories):
+    for directory in directories:
+        os.utime(directory, ns=(OLD_NS, OLD_NS))
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "root"
+    for name in ("a/1.png", "a/2.png", "a/b/3.png", "c/4.tif"):
+        touch(root / name)
+    settle(root / "a/b", root / "a", root / "c", root)
+    return root
+
+
+@pytest.fixture
+def index(root, tmp_path):
+    return DirectoryIndex(str(root), str(tmp_path / "index.db"))
+
+
+def names(entries):
+    return sorted((name, is_dir) for name, is_dir, _, _ in entries)
+
+
+def test_listdir(index):
+    assert names(index.listdir()) == [("a", 1), ("c", 1)]
+    assert names(index.listdir("a")) == [("1.png", 0), ("2.png", 0), ("b", 1)]
+    assert names(index.listdir("./a/")) == names(index.listdir("a"))
+    assert index.listdir("missing") == []
+
+
+def test_unchanged_directory_is_not_scanned(index, monkeypatch):
+    expected = index.listdir("a")
+    monkeypatch.setattr(DirectoryIndex, "_scan", staticmethod(pytest.fail))
+    assert sorted(index.listdir("a")) == sorted(expected)
+
+
+def test_changed_directory_is_scanned(index, root):
+    index.listdir("a")
+    generation = index.generation()
+    touch(root / "a/5.png")
+    settle(root / "a")
+    os.utime(root / "a", ns=(OLD_NS + 1, OLD_NS + 1))
+    assert ("5.png", 0) in names(index.listdir("a"))
+    assert index.generation() == generation + 1
+
+
+def test_racy_rescan_keeps_generation(index, root):
+    os.utime(root / "a", None)
+    index.listdir("a")
+    generation = index.generation()
+    # The racy listing is scanned again, but did not change
+    index.listdir("a")
+    assert index.generation() == generation
+
+
+def test_removed_directory(index, root):
+    index.listdir("a")
+    index.listdir("a/b")
+    generation = index.generation()
+    for name in ("a/b/3.png", "a/1.png", "a/2.png"):
+        (root / name).unlink()
+    (root / "a/b").rmdir()
+    (root / "a").rmdir()
+    # The subdirectories are removed together with the directory
+    assert index.listdir("a") == []
+    assert index.generation() == generation + 1
+    # Removing them again is not a change
+    assert index.listdir("a/b") == []
+    assert index.generation() == generation + 1
+
+
+def test_generation_is_shared(index, root, tmp_path):
+    other = DirectoryIndex(str(root), str(tmp_path / "index.db"))
+    index.listdir("a")
+    assert other.generation() == index.generation() > 0
+    unrelated = DirectoryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    assert unrelated.generation() == 0
+
+
+def test_pickle(index):
+    index.listdir("a")
+    restored = pickle.loads(pickle.dumps(index))
+    assert restored.generation() == index.generation()
+    assert sorted(restored.listdir("a")) == sorted(index.listdir("a"))
+
+
+def test_frame_counts(index, root, monkeypatch):
+    monkeypatch.setattr(directory_index, "FRAMES_QUERY_SIZE", 2)
+    paths = ["a/1.png", "a/2.png", "a/b/3.png", "c/4.tif", "a/1.png", "missing"]
+    counted = []
+
+    def count_frames(path):
+        counted.append(os.path.relpath(path, root))
+        return 7
+
+    assert index.frame_counts(paths, count_frames) == [7, 7, 7, 7, 7, 1]
+    assert sorted(set(counted)) == ["a/1.png", "a/2.png", "a/b/3.png", "c/4.tif"]
+    counted.clear()
+    assert index.frame_counts(paths, count_frames) == [7, 7, 7, 7, 7, 1]
+    assert counted == []
+    touch(root / "c/4.tif", OLD_NS + 1)
+    index.frame_counts(paths, count_frames)
+    assert counted == ["c/4.tif"]
+
+
+def test_frame_counts_from_listing_stats(index, monkeypatch):
+    stats = [(1, OLD_NS)]
+    index.frame_counts(["c/4.tif"], lambda path: 3, stats)
+    monkeypatch.setattr(os, "stat", pytest.fail)
+    assert index.frame_counts(["c/4.tif"], pytest.fail, stats) == [3]
+
+
+def test_filepaths_match_walk(index, root):
+    formats = ["**/*.png", "**/*.tif", "*.png"]
+    expected = FileDataset.filepaths_from_directory(
+        str(root), formats, selected_sub_uris=["a", "c"]
+    )
+    assert (
+        FileDataset.filepaths_from_directory(
+            str(root), formats, selected_sub_uris=["a", "c"], directory_index=index
+        )
+        == expected
+    )
@@ -0,0 +1,124 @@
+import functools
+import os
+import time
+
+import pytest
+from dash.exceptions import PreventUpdate
+
+import file_manager.main as main
+from file_manager.dataset.directory_index import DirectoryIndex
+from file_manager.dataset.directory_watcher import DirectoryWatcher
+from file_manager.main import FileManager
+
+POLL_INTERVAL = 0.05
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL / 5)
+    assert condition()
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "root"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "a" / "1.png").write_bytes(b"x")
+    (root / ".hidden").mkdir()
+    return root
+
+
+@pytest.fixture
+def watcher(root, tmp_path):
+    directory_index = DirectoryIndex(str(root), str(tmp_path / "index.db"))
+    watcher = DirectoryWatcher(
+        str(root), directory_index, poll_interval=POLL_INTERVAL, force_polling=True
+    )
+    changes = []
+    watcher.add_listener(changes.append)
+    watcher.changes = changes
+    directory_index.listdir("a")
+    watcher.start()
+    # The first scan of the modification times runs in the watcher thread
+    time.sleep(5 * POLL_INTERVAL)
+    yield watcher
+    watcher.stop()
+
+
+def test_created_file_bumps_generation(watcher, root):
+    generation = watcher.generation
+    (root / "a" / "2.png").write_bytes(b"x")
+    wait_for(lambda: watcher.changed_since(generation))
+    assert {"a"} in watcher.changes
+    # The next browse is answered by the directory index
+    names = [name for name, _, _, _ in watcher.directory_index.listdir("a")]
+    assert sorted(names) == ["1.png", "2.png", "b"]
+
+
+def test_removed_directory_notifies_parent(watcher, root):
+    generation = watcher.generation
+    (root / "a" / "b").rmdir()
+    wait_for(lambda: watcher.changed_since(generation))
+    assert {"a"} in watcher.changes
+
+
+def test_hidden_directories_are_ignored(watcher, root):
+    generation = watcher.generation
+    (root / ".hidden" / "1.png").write_bytes(b"x")
+    time.sleep(10 * POLL_INTERVAL)
+    assert not watcher.changed_since(generation)
+    assert all(".hidden" not in changed for changed in watcher.changes)
+
+
+def test_stop(root, tmp_path):
+    watcher = DirectoryWatcher(
+        str(root),
+        DirectoryIndex(str(root), str(tmp_path / "index.db")),
+        poll_interval=POLL_INTERVAL,
+        force_polling=True,
+    )
+    watcher.start()
+    watcher.stop()
+    assert watcher._thread is None
+    generation = watcher.generation
+    (root / "a" / "2.png").write_bytes(b"x")
+    time.sleep(10 * POLL_INTERVAL)
+    assert not watcher.changed_since(generation)
+
+
+@pytest.fixture
+def file_manager(root, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        main,
+        "DirectoryWatcher",
+        functools.partial(
+            DirectoryWatcher, poll_interval=POLL_INTERVAL, force_polling=True
+        ),
+    )
+    file_manager = FileManager(str(root), watch=True)
+    time.sleep(5 * POLL_INTERVAL)
+    yield file_manager
+    file_manager.watcher.stop()
+
+
+def test_check_watcher(file_manager, root, tmp_path):
+    assert file_manager._load_file_table("*/*.png", False) == [{"uri": "a/1.png"}]
+    assert os.path.isfile(tmp_path / ".file_manager_index.db")
+    generation = file_manager.watcher.generation
+    with pytest.raises(PreventUpdate):
+        file_manager._check_watcher(1, generation)
+    (root / "a" / "2.png").write_bytes(b"x")
+    wait_for(lambda: file_manager.watcher.changed_since(generation))
+    new_generation = file_manager._check_watcher(2, generation)
+    assert new_generation > generation
+    with pytest.raises(PreventUpdate):
+        file_manager._check_watcher(3, new_generation)
+
+
+def test_check_watcher_without_watch(root, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+    file_manager = FileManager(str(root))
+    with pytest.raises(PreventUpdate):
+        file_manager._check_watcher(1, None)
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from file_manager.dataset.executors import (
+    SHARED_MEMORY_MIN_BYTES,
+    InlineExecutor,
+    ProcessExecutor,
+    ThreadExecutor,
+    get_executor,
+)
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE
+
+
+@pytest.fixture(scope="module")
+def process_executor():
+    executor = ProcessExecutor(max_workers=2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture(params=["inline", "thread", "process"])
+def executor(request, process_executor):
+    if request.param == "process":
+        yield process_executor
+    else:
+        executor = InlineExecutor() if request.param == "inline" else ThreadExecutor(4)
+        yield executor
+        executor.shutdown()
+
+
+def test_map_keeps_order(executor):
+    assert list(executor.map(pow, range(20), [2] * 20)) == [i**2 for i in range(20)]
+    assert list(executor.map(pow, [], [])) == []
+
+
+def test_map_raises_errors(executor):
+    with pytest.raises(ValueError):
+        list(executor.map(int, ["1", "x", "3"]))
+
+
+def test_submit(executor):
+    assert executor.submit(pow, 2, 10).result() == 1024
+    with pytest.raises(ValueError):
+        executor.submit(int, "x").result()
+
+
+def test_large_arrays_through_shared_memory(process_executor):
+    num_values = SHARED_MEMORY_MIN_BYTES // 8 + 1
+    small, large = process_executor.map(np.ones, [1, num_values])
+    np.testing.assert_array_equal(small, np.ones(1))
+    np.testing.assert_array_equal(large, np.ones(num_values))
+    assert process_executor.stats()["queued"] == 0
+
+
+def shared_segments():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="no /dev/shm")
+def test_closed_map_frees_shared_memory(process_executor):
+    segments = shared_segments()
+    num_values = SHARED_MEMORY_MIN_BYTES // 8 + 1
+    results = process_executor.map(np.ones, [num_values] * 4)
+    assert len(next(results)) == num_values
+    results.close()
+    assert shared_segments() == segments
+    assert process_executor.stats()["queued"] == 0
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="no /dev/shm")
+def test_failed_map_frees_shared_memory(process_executor):
+    segments = shared_segments()
+    num_values = SHARED_MEMORY_MIN_BYTES // 8 + 1
+    with pytest.raises(TypeError):
+        list(process_executor.map(np.ones, ["x", num_values, num_values]))
+    # Let the tasks that were in flight finish
+    time.sleep(0.5)
+    assert shared_segments() == segments
+
+
+def test_nested_thread_maps_do_not_deadlock():
+    executor = ThreadExecutor(max_workers=1, request_limit=4)
+    try:
+        results = executor.map(
+            lambda i: sum(executor.map(lambda j: i * j, range(10))), range(10)
+        )
+        assert list(results) == [45 * i for i in range(10)]
+    finally:
+        executor.shutdown()
+
+
+def test_thread_map_concurrency_is_bounded():
+    executor = ThreadExecutor(max_workers=8)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def task(_):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    try:
+        list(executor.map(task, range(20), max_concurrency=3))
+        assert 1 < max(peak) <= 3
+        assert executor.stats() == {"max_workers": 8, "queued": 0, "active": 0}
+    finally:
+        executor.shutdown()
+
+
+def test_shared_executors():
+    assert get_executor("thread") is get_executor("thread")
+    assert isinstance(get_executor("inline"), InlineExecutor)
+    executor = InlineExecutor()
+    assert get_executor(executor) is executor
+    with pytest.raises(ValueError):
+        get_executor("unknown")
+
+
+def test_read_data_matches_across_backends(tmp_path, process_executor):
+    (tmp_path / "d").mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(4):
+        image = (rng.random((30, 40)) * 255).astype(np.uint8)
+        Image.fromarray(image).save(tmp_path / "d" / f"{i}.png")
+    dataset = FileDataset("d", 4, [f"{i}.png" for i in range(4)])
+    results = []
+    for executor in (InlineExecutor(), "thread", process_executor):
+        THUMBNAIL_CACHE.clear()
+        images, _ = dataset.read_data(
+            str(tmp_path), list(range(4)), export="bytes", executor=executor
+        )
+        results.append(images)
+    THUMBNAIL_CACHE.clear()
+    assert results[0] == results[1] == results[2]
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import file_manager.dataset.file_dataset as file_dataset
+import file_manager.dataset.filename_list as filename_list
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.filename_list import (
+    RESTART_INTERVAL,
+    FilenameList,
+    FilenameListRegistry,
+)
+
+FILENAMES = [
+    f"scan_{i // 7:03d}/frame_{i:05d}.tif" for i in range(3 * RESTART_INTERVAL)
+]
+UNICODE_FILENAMES = ["données/α.png", "données/αβ.png", "données/β.png", "z/ü.png"]
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = FilenameListRegistry(directory=str(tmp_path), max_size=1)
+    monkeypatch.setattr(filename_list, "FILENAME_LIST_REGISTRY", registry)
+    return registry
+
+
+@pytest.mark.parametrize(
+    "filenames",
+    [[], [""], ["a"], FILENAMES, UNICODE_FILENAMES, ["a", "a", "ab", "a", ""]],
+)
+def test_sequence(filenames):
+    names = FilenameList(filenames)
+    assert len(names) == len(filenames)
+    assert list(names) == filenames
+    assert [names[i] for i in range(len(filenames))] == filenames
+    assert names[1:-1:2] == filenames[1:-1:2]
+    assert names == filenames
+    if filenames:
+        assert names[-1] == filenames[-1]
+    with pytest.raises(IndexError):
+        names[len(filenames)]
+
+
+def test_index():
+    names = FilenameList(FILENAMES + ["scan_000/frame_00000.tif"])
+    for position, filename in enumerate(FILENAMES):
+        assert names.index(filename) == position
+    assert names.index("scan_000/frame_00000.tif", start=1) == len(FILENAMES)
+    assert "scan_000/frame_00001.tif" in names
+    assert "missing.tif" not in names
+    with pytest.raises(ValueError):
+        names.index("missing.tif")
+
+
+@pytest.mark.parametrize("mode", ["list", "compact", "reference"])
+@pytest.mark.parametrize(
+    "filenames", [[], [""], FILENAMES, UNICODE_FILENAMES, ["a\nb", "a\nc"]]
+)
+def test_dict_round_trip(filenames, mode, registry):
+    names = FilenameList(filenames)
+    serialized = names.to_dict(mode)
+    if mode == "list" or (mode == "compact" and "\n" in "".join(filenames)):
+        assert serialized == filenames
+    assert FilenameList.from_dict(serialized) == filenames
+
+
+def test_reference_from_disk(registry):
+    names = FilenameList(FILENAMES)
+    serialized = names.to_dict("reference")
+    assert serialized == {"ref": names.ref, "count": len(FILENAMES)}
+    # Evict the list from memory, it is then read from the disk store
+    registry.put(FilenameList(UNICODE_FILENAMES))
+    assert FilenameList.from_dict(serialized) == FILENAMES
+    with pytest.raises(KeyError):
+        registry.get("unknown")
+
+
+def test_buffers_round_trip():
+    names = FilenameList(UNICODE_FILENAMES * 10)
+    prefix_lengths, offsets, suffixes = names.to_buffers()
+    restored = FilenameList.from_buffers(
+        np.frombuffer(prefix_lengths, dtype=np.int32),
+        np.frombuffer(offsets, dtype=np.int64),
+        suffixes,
+    )
+    assert restored == UNICODE_FILENAMES * 10
+    assert restored.ref == names.ref
+
+
+@pytest.mark.parametrize("mode", ["list", "compact", "reference"])
+def test_file_dataset_round_trip(mode, registry, monkeypatch):
+    monkeypatch.setattr(file_dataset, "FILENAMES_MODE", mode)
+    dataset = FileDataset("data", len(FILENAMES), FILENAMES)
+    assert isinstance(dataset.filenames, list) == (mode == "list")
+    dataset_dict = dataset.to_dict()
+    if mode == "list":
+        assert dataset_dict["filenames"] == FILENAMES
+    restored = FileDataset.from_dict(dataset_dict)
+    assert list(restored.filenames) == FILENAMES
+    assert restored.get_frame_index(FILENAMES[5]) == 5
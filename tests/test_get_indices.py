@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+from tiled.adapters.array import ArrayAdapter
+from tiled.adapters.mapping import MapAdapter
+from tiled.client import Context, from_context
+from tiled.server.app import build_app
+
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.tiled_dataset import TiledDataset
+from file_manager.dataset.tiled_metadata_cache import TILED_METADATA_CACHE
+
+ROOT_URI = "/data/root"
+
+
+@pytest.fixture
+def project():
+    # Nested datasets, the most specific one holds the files of its directory
+    return DataProject(
+        ROOT_URI,
+        "file",
+        datasets=[
+            FileDataset("a", 5, ["0.tif", "1.png", "c/2.png"], frame_counts=[3, 1, 1]),
+            FileDataset("a/b", 9, ["3.tif", "4.png"], frame_counts=[3, 1]),
+            FileDataset("d", 11, ["5.png", "6.png"]),
+        ],
+    )
+
+
+def test_round_trip(project):
+    indices = list(range(11))
+    uris = project.read_datasets(indices, just_uri=True)
+    assert uris[:4] == [
+        f"{ROOT_URI}/a/0.tif?page=0",
+        f"{ROOT_URI}/a/0.tif?page=1",
+        f"{ROOT_URI}/a/0.tif?page=2",
+        f"{ROOT_URI}/a/1.png",
+    ]
+    assert project.get_indices(uris) == indices
+    assert [project.get_index(uri) for uri in uris] == indices
+    shuffled = [uris[index] for index in [10, 6, 0, 6, 3]]
+    assert project.get_indices(shuffled) == [10, 6, 0, 6, 3]
+
+
+def test_uri_variations(project):
+    assert project.get_indices(
+        [
+            # The first page is the default
+            f"{ROOT_URI}/a/b/3.tif",
+            f"/{ROOT_URI}//a/b/3.tif?page=2",
+            # Paths relative to the root
+            "a/b/4.png",
+            "d/6.png/",
+        ]
+    ) == [5, 7, 8, 10]
+
+
+def test_unknown_uris(project):
+    assert (
+        project.get_indices(
+            [
+                f"{ROOT_URI}/a/missing.png",
+                f"{ROOT_URI}/a/0.tif?page=3",
+                f"{ROOT_URI}/a/1.png?page=1",
+                f"{ROOT_URI}/e/5.png",
+                "/other/root/d/5.png",
+                f"{ROOT_URI}/a",
+                "",
+            ]
+        )
+        == [None] * 7
+    )
+    assert project.get_index(f"{ROOT_URI}/b/3.tif") is None
+
+
+def test_candidate_datasets(project):
+    assert list(project._candidate_datasets("a/b/c/2.png")) == [
+        (1, "c/2.png"),
+        (0, "b/c/2.png"),
+    ]
+    assert list(project._candidate_datasets("a/c/2.png")) == [(0, "c/2.png")]
+    assert list(project._candidate_datasets("e/5.png")) == []
+    # Datasets at the root of the project match every path
+    project.datasets = project.datasets + [FileDataset("", 12, ["7.png"])]
+    assert list(project._candidate_datasets("7.png")) == [(3, "7.png")]
+    assert list(project._candidate_datasets("d/5.png"))[-1] == (3, "d/5.png")
+    assert project.get_indices([f"{ROOT_URI}/7.png", f"{ROOT_URI}/d/5.png"]) == [
+        11,
+        9,
+    ]
+
+
+def test_uri_map_follows_datasets(project):
+    assert project.uri_map == {"a": 0, "a/b": 1, "d": 2}
+    project.datasets = project.datasets[2:]
+    assert project.uri_map == {"d": 0}
+    assert project.get_index(f"{ROOT_URI}/d/6.png") == 1
+
+
+@pytest.fixture
+def tiled_project(monkeypatch):
+    monkeypatch.setenv("TILED_SINGLE_USER_API_KEY", "secret")
+    rng = np.random.default_rng(0)
+    tree = MapAdapter(
+        {
+            "stack": ArrayAdapter.from_array(rng.random((4, 8, 8))),
+            "single": ArrayAdapter.from_array(rng.random((8, 8))),
+            "grp": MapAdapter({"x": ArrayAdapter.from_array(rng.random((3, 1, 8, 8)))}),
+        }
+    )
+    context = Context.from_app(build_app(tree))
+    tiled_client = from_context(context)
+    monkeypatch.setattr(
+        TiledDataset, "get_tiled_client", staticmethod(lambda *args: tiled_client)
+    )
+    TILED_METADATA_CACHE.invalidate()
+    yield DataProject(
+        "http://local-tiled-app/api/v1/metadata",
+        "tiled",
+        datasets=[
+            TiledDataset("stack", 4),
+            TiledDataset("single", 5),
+            TiledDataset("grp/x", 8),
+        ],
+    )
+    TILED_METADATA_CACHE.invalidate()
+    context.close()
+
+
+def test_tiled_round_trip(tiled_project):
+    indices = [7, 0, 4, 3, 5]
+    uris = tiled_project.read_datasets(indices, just_uri=True)
+    assert uris[0].endswith("/grp/x?slice=2")
+    assert uris[2].endswith("/single")
+    assert tiled_project.get_indices(uris) == indices
+    assert tiled_project.get_indices(
+        [uris[0].replace("slice=2", "slice=3"), uris[0].replace("grp/x", "grp/y")]
+    ) == [None, None]
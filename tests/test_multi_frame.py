@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+import file_manager.dataset.filename_list as filename_list
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.filename_list import FilenameListRegistry
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE
+
+# Files of each dataset with their number of frames, in sorted order
+FILES = {
+    "x": [("a.tif", 3), ("b.png", 1), ("c.tif", 1)],
+    "y": [("s.tif", 4)],
+    "z": [("d.png", 1), ("e.tif", 2)],
+}
+NUM_FRAMES = sum(num_frames for files in FILES.values() for _, num_frames in files)
+
+
+def frames():
+    """
+    Dataset, filename and page of each global index
+    """
+    return [
+        (dataset, filename, page)
+        for dataset, files in FILES.items()
+        for filename, num_frames in files
+        for page in range(num_frames)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    THUMBNAIL_CACHE.clear()
+    yield
+    THUMBNAIL_CACHE.clear()
+
+
+@pytest.fixture
+def project(tmp_path):
+    # The first pixel of each frame holds its global index
+    rng = np.random.default_rng(0)
+    index = 0
+    for dataset, files in FILES.items():
+        (tmp_path / dataset).mkdir()
+        for filename, num_frames in files:
+            stack = rng.integers(100, 255, (num_frames, 6, 8), dtype=np.uint8)
+            stack[:, 0, 0] = np.arange(index, index + num_frames)
+            path = tmp_path / dataset / filename
+            if filename.endswith(".tif"):
+                tifffile.imwrite(path, stack, photometric="minisblack")
+            else:
+                Image.fromarray(stack[0]).save(path)
+            index += num_frames
+    project = DataProject(str(tmp_path), "file")
+    project.datasets = project.browse_data(
+        ["*.tif", "*.png"], selected_sub_uris=list(FILES)
+    )
+    return project
+
+
+def expected_uri(project, dataset, filename, page):
+    num_frames = dict(FILES[dataset])[filename]
+    uri = f"{project.root_uri}/{dataset}/{filename}"
+    return f"{uri}?page={page}" if num_frames > 1 else uri
+
+
+def test_frame_counts(project):
+    assert [dataset.num_frames for dataset in project.datasets] == [5, 4, 3]
+    assert project.cumulative_counts.tolist() == [5, 9, 12]
+    assert project.datasets[0].frame_counts.tolist() == [3, 1, 1]
+
+
+@pytest.mark.parametrize(
+    "indices",
+    [
+        list(range(NUM_FRAMES)),
+        [11, 0, 6, 2, 9, 4],
+        [3, 3, 0, 8, 3, 11, 0],
+    ],
+)
+def test_read_frames(project, indices):
+    images, uris = project.read_datasets(indices, export="raw")
+    assert [int(image[0, 0]) for image in images] == indices
+    assert uris == [expected_uri(project, *frames()[index]) for index in indices]
+    assert project.read_datasets(indices, just_uri=True) == uris
+    # Thumbnails of the frames of a stack are not mixed up
+    thumbnails, _ = project.read_datasets(indices, export="bytes")
+    for index, thumbnail in zip(indices, thumbnails):
+        assert thumbnail == thumbnails[indices.index(index)]
+    assert len(set(thumbnails)) == len(set(indices))
+
+
+def test_uris_map_back_to_indices(project):
+    indices = [10, 1, 7, 1, 0, 11]
+    uris = project.read_datasets(indices, just_uri=True)
+    assert project.get_indices(uris) == indices
+    assert project.datasets[0].get_uri_index(uris[1]) == 1
+    assert project.datasets[1].get_frame_index("s.tif", 2) == 2
+    with pytest.raises(ValueError):
+        project.datasets[1].get_frame_index("s.tif", 4)
+
+
+@pytest.mark.parametrize("filenames_mode", ["list", "compact", "reference"])
+def test_dict_round_trip(project, filenames_mode, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        filename_list,
+        "FILENAME_LIST_REGISTRY",
+        FilenameListRegistry(directory=str(tmp_path / "filenames")),
+    )
+    project_dict = project.to_dict(filenames_mode=filenames_mode)
+    assert [dataset.get("frame_counts") for dataset in project_dict["datasets"]] == [
+        [3, 1, 1],
+        [4],
+        [1, 2],
+    ]
+    restored = DataProject.from_dict(project_dict)
+    indices = [11, 2, 5, 2, 0]
+    assert restored.read_datasets(indices, just_uri=True) == project.read_datasets(
+        indices, just_uri=True
+    )
+    images, _ = restored.read_datasets(indices, export="raw")
+    assert [int(image[0, 0]) for image in images] == indices
+
+
+def test_single_frame_files_have_no_counts(tmp_path):
+    dataset = FileDataset("d", 2, ["0.png", "1.png"])
+    assert dataset.frame_counts is None
+    assert "frame_counts" not in dataset.to_dict()
+    assert dataset.read_data(str(tmp_path), [1, 0], just_uri=True) == [
+        f"{tmp_path}/d/1.png",
+        f"{tmp_path}/d/0.png",
+    ]
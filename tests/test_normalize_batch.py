@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import file_manager.dataset.dataset as dataset
+from file_manager.dataset.dataset import Dataset
+
+PERCENTILES = [[0, 100], [1, 99]]
+
+
+def make_block(dtype, num_images=6, shape=(17, 23), seed=0, masked=True):
+    rng = np.random.default_rng(seed)
+    block = rng.random((num_images, *shape)) * 1000 - 100
+    block[3] = np.abs(block[3]) + 1
+    if masked:
+        block[1] = 5
+        block[2, 3, 4] = np.nan
+    if np.issubdtype(dtype, np.integer) or not masked:
+        block = np.nan_to_num(np.abs(block))
+    return block.astype(dtype)
+
+
+def make_test_block(dtype, log, percentiles, **kwargs):
+    # The per-image path fails to take the percentiles of masked log images
+    return make_block(dtype, masked=not log or percentiles == [0, 100], **kwargs)
+
+
+def exported(images):
+    return [np.array(Dataset._export_image(image, False, "pillow")) for image in images]
+
+
+def per_image(images, log, percentiles):
+    return [
+        np.array(
+            Dataset._process_image(image.copy(), log, False, "pillow", percentiles)
+        )
+        for image in images
+    ]
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("log", [False, True])
+@pytest.mark.parametrize("percentiles", PERCENTILES)
+def test_float32_bit_exact(log, percentiles):
+    block = make_test_block(np.float32, log, percentiles)
+    expected = per_image(block, log, percentiles)
+    normalized = exported(Dataset._normalize_batch(block.copy(), log, percentiles))
+    assert len(normalized) == len(expected)
+    for image, expected_image in zip(normalized, expected):
+        assert image.dtype == np.uint8
+        np.testing.assert_array_equal(image, expected_image)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("log", [False, True])
+@pytest.mark.parametrize("percentiles", PERCENTILES)
+def test_chunks_match_single_pass(log, percentiles, monkeypatch):
+    block = make_test_block(np.float32, log, percentiles, num_images=9)
+    expected = Dataset._normalize_batch(block.copy(), log, percentiles)
+    # One image per chunk
+    monkeypatch.setattr(dataset, "BATCH_CHUNK_BYTES", 1)
+    normalized = Dataset._normalize_batch(block.copy(), log, percentiles)
+    for image, expected_image in zip(normalized, expected):
+        np.testing.assert_array_equal(image, expected_image)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float64])
+@pytest.mark.parametrize("log", [False, True])
+def test_other_dtypes_within_one_level(dtype, log):
+    block = make_block(dtype)
+    expected = per_image(block, log, [0, 100])
+    normalized = exported(Dataset._normalize_batch(block, log, [0, 100]))
+    for image, expected_image in zip(normalized, expected):
+        difference = np.abs(image.astype(np.int16) - expected_image.astype(np.int16))
+        assert difference.max() <= 1
+
+
+def test_read_only_block_is_not_modified():
+    block = make_block(np.float32)
+    block[2] = 0
+    original = block.copy()
+    block.flags.writeable = False
+    Dataset._normalize_batch(block, False, [0, 100])
+    np.testing.assert_array_equal(block, original)
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import file_manager.data_project as data_project
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE
+from file_manager.prefetcher import Prefetcher
+
+NUM_IMAGES = 10
+
+
+def assert_pruned(prefetcher, timeout=5):
+    # Done callbacks run after the results of the futures are set
+    deadline = time.monotonic() + timeout
+    while prefetcher._futures and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert prefetcher._futures == {}
+    assert prefetcher._generations == {}
+    assert prefetcher._charges == {}
+    assert prefetcher.charged_bytes == 0
+
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    prefetcher = Prefetcher(max_workers=1, memory_budget=10**9)
+    monkeypatch.setattr(data_project, "PREFETCHER", prefetcher)
+    THUMBNAIL_CACHE.clear()
+    yield prefetcher
+    THUMBNAIL_CACHE.clear()
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "d").mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(NUM_IMAGES):
+        image = (rng.random((30, 40)) * 255).astype(np.uint8)
+        Image.fromarray(image).save(tmp_path / "d" / f"{i}.png")
+    return DataProject(
+        str(tmp_path),
+        "file",
+        datasets=[
+            FileDataset("d", NUM_IMAGES, [f"{i}.png" for i in range(NUM_IMAGES)])
+        ],
+    )
+
+
+def test_state_is_pruned():
+    prefetcher = Prefetcher(max_workers=1)
+    futures = prefetcher.submit("key", lambda batch: [b"x" * len(batch)], [[1], [2]])
+    assert [future.result() for future in futures] == [1, 1]
+    assert_pruned(prefetcher)
+
+
+def test_superseded_batches_are_skipped():
+    prefetcher = Prefetcher(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def read_batch(batch):
+        started.set()
+        release.wait()
+        return [b"x"]
+
+    first = prefetcher.submit("key", read_batch, [[1], [2], [3]])
+    started.wait()
+    second = prefetcher.submit("key", lambda batch: [b"yy"], [[4]])
+    release.set()
+    assert [future.result() for future in first if not future.cancelled()] == [1]
+    assert second[0].result() == 2
+    assert prefetcher.stats()["cancelled"] == 2
+    assert_pruned(prefetcher)
+
+
+def test_budget():
+    prefetcher = Prefetcher(max_workers=1, memory_budget=3)
+    futures = prefetcher.submit("key", lambda batch: [b"xx"], [[1], [2], [3]])
+    assert [future.result() for future in futures] == [2, 2, 0]
+    assert prefetcher.stats()["over_budget"] == 1
+    # The charge is released once the prefetch is done
+    assert_pruned(prefetcher)
+
+
+def test_keys_share_the_budget_but_not_cancellations():
+    prefetcher = Prefetcher(max_workers=2, memory_budget=3)
+    release = threading.Event()
+
+    def read_batch(batch):
+        if batch == [2]:
+            release.wait()
+        return [b"xx"]
+
+    first = prefetcher.submit("a", read_batch, [[1], [2]])
+    assert first[0].result() == 2
+    # The prefetch of "a" is still in flight, its charge counts against "b"
+    second = prefetcher.submit("b", lambda batch: [b"xx"], [[3], [4]])
+    assert [future.result() for future in second] == [2, 0]
+    release.set()
+    assert first[1].result() == 2
+    assert prefetcher.stats()["cancelled"] == 0
+    assert prefetcher.stats()["over_budget"] == 1
+    assert_pruned(prefetcher)
+
+
+def test_cached_data_points_are_not_charged(prefetcher, project):
+    project.read_datasets([0, 1, 2])
+    assert project.is_cached([2, 5, 0]) == [True, False, True]
+    sizes = [
+        future.result()
+        for future in project.prefetch(list(range(4)), "session", batch_size=2)
+    ]
+    assert sizes[0] == 0 and sizes[1] > 0
+    assert all(project.is_cached(list(range(4))))
+    assert_pruned(prefetcher)
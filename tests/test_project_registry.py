@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import file_manager.data_project as data_project
+import file_manager.dataset.filename_list as filename_list
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.filename_list import FilenameListRegistry
+from file_manager.project_registry import ProjectRegistry
+
+NUM_IMAGES = 3
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ProjectRegistry(directory=str(tmp_path / "registry"), max_size=2)
+    monkeypatch.setattr(data_project, "PROJECT_REGISTRY", registry)
+    monkeypatch.setattr(
+        filename_list,
+        "FILENAME_LIST_REGISTRY",
+        FilenameListRegistry(directory=str(tmp_path / "filenames")),
+    )
+    return registry
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "d").mkdir()
+    for i in range(NUM_IMAGES):
+        Image.fromarray(np.full((8, 8), i, dtype=np.uint8)).save(
+            tmp_path / "d" / f"{i}.png"
+        )
+    return DataProject(
+        str(tmp_path),
+        "file",
+        datasets=[
+            FileDataset("d", NUM_IMAGES, [f"{i}.png" for i in range(NUM_IMAGES)])
+        ],
+    )
+
+
+def test_reference(registry, project):
+    reference = registry.put(project)
+    assert set(reference) == {"project_id", "content_hash"}
+    assert ProjectRegistry.is_reference(reference)
+    assert not ProjectRegistry.is_reference(project.to_dict())
+    # Registering the same content again gives the same reference
+    assert registry.put(project) == reference
+
+
+def test_get_hit_and_miss(registry, project, tmp_path):
+    reference = registry.put(project)
+    assert registry.get(reference, DataProject.from_dict) is project
+    assert registry.stats()["hits"] == 1
+    # Other worker processes build the project from the disk store
+    other = ProjectRegistry(directory=str(tmp_path / "registry"))
+    built = other.get(reference, DataProject.from_dict)
+    assert built.to_dict() == project.to_dict()
+    assert other.get(reference, DataProject.from_dict) is built
+    assert (other.stats()["hits"], other.stats()["misses"]) == (1, 1)
+
+
+def test_get_is_keyed_on_api_key(registry, project):
+    reference = registry.put(project)
+    built = registry.get(reference, DataProject.from_dict, api_key="key")
+    assert built is not project
+    assert built.api_key == "key"
+
+
+def test_memory_is_bounded(registry, project):
+    references = []
+    for i in range(3):
+        project.project_id = str(i)
+        references.append(registry.put(project))
+    assert registry.stats()["entries"] == 2
+    # The oldest project is built again from the disk store
+    assert registry.get(references[0], DataProject.from_dict).project_id == "0"
+    assert registry.stats()["misses"] == 1
+
+
+def test_load_returns_private_copy(registry, project):
+    reference = registry.put(project)
+    loaded = registry.load(reference, DataProject.from_dict)
+    assert loaded is not project
+    assert loaded.to_dict() == project.to_dict()
+    loaded.datasets = []
+    assert len(registry.get(reference, DataProject.from_dict).datasets) == 1
+    assert registry.load(reference, DataProject.from_dict) is not loaded
+
+
+def test_missing_reference(registry, project, tmp_path):
+    reference = {"project_id": project.project_id, "content_hash": "unknown"}
+    with pytest.raises(KeyError):
+        registry.get(reference, DataProject.from_dict)
+    with pytest.raises(KeyError):
+        registry.load(reference, DataProject.from_dict)
+    with pytest.raises(KeyError):
+        DataProject.from_dict(reference)
+    # References expire together with the disk store, e.g. after a restart
+    reference = registry.put(project)
+    expired = ProjectRegistry(directory=str(tmp_path / "other"))
+    with pytest.raises(KeyError):
+        expired.get(reference, DataProject.from_dict)
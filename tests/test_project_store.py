@@ -0,0 +1,157 @@
+import pickle
+import sqlite3
+
+import pytest
+
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.tiled_dataset import TiledDataset
+from file_manager.project_store import SCHEMA_VERSION, ProjectStore, ProjectVersionError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(str(tmp_path / "projects.db"))
+
+
+def file_dataset(uri, num_files, offset=0, frame_counts=None):
+    return FileDataset(
+        uri,
+        offset + (sum(frame_counts) if frame_counts else num_files),
+        [f"{uri}_{i}.tif" for i in range(num_files)],
+        frame_counts=frame_counts,
+        formats=["*.tif"],
+        directory_mtimes={"": 1},
+    )
+
+
+@pytest.fixture
+def project():
+    return DataProject(
+        "/data",
+        "file",
+        datasets=[file_dataset("a", 3, 0, [2, 1, 4]), file_dataset("b", 2, 7)],
+    )
+
+
+def as_dicts(data_project):
+    return [dataset.to_dict(filenames_mode="list") for dataset in data_project.datasets]
+
+
+def stored_descriptions(store):
+    return (
+        store._connection()
+        .execute("SELECT position, dataset FROM datasets ORDER BY position")
+        .fetchall()
+    )
+
+
+def test_round_trip(store, project):
+    assert store.load() == (None, 0)
+    assert store.save(project) == 1
+    loaded, version = store.load(api_key="key")
+    assert version == 1
+    assert (loaded.root_uri, loaded.data_type) == ("/data", "file")
+    assert loaded.project_id == project.project_id
+    assert loaded.api_key == "key"
+    assert as_dicts(loaded) == as_dicts(project)
+    assert loaded.datasets[0].frame_counts.tolist() == [2, 1, 4]
+    assert list(loaded.datasets[1].filenames) == ["b_0.tif", "b_1.tif"]
+
+
+def test_tiled_round_trip(store):
+    project = DataProject(
+        "http://tiled/api/v1/metadata",
+        "tiled",
+        datasets=[TiledDataset("x", 4), TiledDataset("y/z", 6)],
+    )
+    store.save(project)
+    loaded, _ = store.load()
+    assert loaded.data_type == "tiled"
+    assert [dataset.to_dict() for dataset in loaded.datasets] == [
+        dataset.to_dict() for dataset in project.datasets
+    ]
+
+
+def test_projects_are_keyed_by_user_and_name(store, project):
+    store.save(project, "alice")
+    store.save(DataProject("/other", "file"), "alice", "other")
+    store.save(project, "bob")
+    assert [name for name, _, _ in store.list_projects("alice")] == ["last", "other"]
+    assert store.load("alice", "other")[0].root_uri == "/other"
+    assert store.load("carol") == (None, 0)
+    store.delete("alice")
+    assert store.load("alice") == (None, 0)
+    assert store.load("bob")[1] == 1
+
+
+def test_stale_expected_version(store, project):
+    assert store.save(project, expected_version=0) == 1
+    assert store.save(project, expected_version=1) == 2
+    with pytest.raises(ProjectVersionError):
+        store.save(project, expected_version=1)
+    with pytest.raises(ProjectVersionError):
+        store.append_datasets([file_dataset("c", 1, 10)], expected_version=1)
+    # The failed writes did not change the project
+    loaded, version = store.load()
+    assert version == 2
+    assert as_dicts(loaded) == as_dicts(project)
+
+
+def test_only_changed_datasets_are_rewritten(store, project):
+    store.save(project)
+    # Mark the stored rows, the ones that are rewritten lose their mark
+    connection = store._connection()
+    with connection:
+        connection.execute("UPDATE datasets SET dataset = 'marked'")
+    project.datasets[1] = file_dataset("b", 3, 7)
+    assert store.save(project) == 2
+    descriptions = [description for _, description in stored_descriptions(store)]
+    assert descriptions[0] == "marked"
+    assert descriptions[1] != "marked"
+    # Removed datasets are dropped
+    project.datasets = project.datasets[:1]
+    store.save(project)
+    assert [position for position, _ in stored_descriptions(store)] == [0]
+
+
+def test_append_datasets(store, project):
+    with pytest.raises(KeyError):
+        store.append_datasets([file_dataset("c", 1, 10)])
+    store.save(project)
+    assert store.append_datasets([file_dataset("c", 2, 10)], expected_version=1) == 2
+    loaded, version = store.load()
+    assert version == 2
+    assert [dataset.uri for dataset in loaded.datasets] == ["a", "b", "c"]
+    assert loaded.datasets[-1].cumulative_data_count == 12
+    assert list(loaded.datasets[-1].filenames) == ["c_0.tif", "c_1.tif"]
+
+
+def test_append_does_not_rewrite_datasets(store, project):
+    store.save(project)
+    connection = store._connection()
+    with connection:
+        connection.execute("UPDATE datasets SET dataset = 'marked'")
+    store.append_datasets([file_dataset("c", 2, 10)])
+    assert [description for _, description in stored_descriptions(store)][:2] == [
+        "marked",
+        "marked",
+    ]
+
+
+def test_schema_version(tmp_path, project):
+    db_path = str(tmp_path / "projects.db")
+    ProjectStore(db_path).save(project)
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    # Databases written by a newer version are not read
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    connection.close()
+    with pytest.raises(ProjectVersionError):
+        ProjectStore(db_path).load()
+
+
+def test_pickle(store, project):
+    store.save(project)
+    restored = pickle.loads(pickle.dumps(store))
+    assert as_dicts(restored.load()[0]) == as_dicts(project)
@@ -0,0 +1,124 @@
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+import tifffile
+
+from file_manager.data_project import DataProject
+from file_manager.dataset.dataset import DatasetDiff
+from file_manager.dataset.directory_index import DirectoryIndex
+
+DATASETS = ["a", "b", "c"]
+# Glob patterns are not recursive, each one matches a single depth
+FORMATS = ["*.tif", "**/*.tif", "**/**/*.tif"]
+# Modification time old enough not to be racy
+OLD_NS = time.time_ns() - 3600 * 10**9
+
+
+def write_stack(path, num_frames, mtime_ns=OLD_NS):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tifffile.imwrite(
+        path,
+        np.full((num_frames, 8, 8), num_frames, dtype=np.uint8),
+        photometric="minisblack",
+    )
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def settle(root, mtime_ns=OLD_NS):
+    # Distinct modification times, whatever the resolution of the file system
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "root"
+    for name, num_frames in [
+        ("a/1.tif", 1),
+        ("a/2.tif", 3),
+        ("a/sub/3.tif", 1),
+        ("b/stack.tif", 2),
+        ("b/4.tif", 1),
+        ("c/5.tif", 4),
+        ("c/sub/6.tif", 2),
+        ("c/sub/deep/7.tif", 1),
+    ]:
+        write_stack(root / name, num_frames)
+    settle(root)
+    return root
+
+
+def browse(root, directory_index=None):
+    project = DataProject(str(root), "file")
+    project.datasets = project.browse_data(
+        FORMATS, selected_sub_uris=DATASETS, directory_index=directory_index
+    )
+    return project
+
+
+def modify(root):
+    write_stack(root / "a/new.tif", 2)
+    (root / "a/1.tif").unlink()
+    write_stack(root / "b/new/8.tif", 3)
+    shutil.rmtree(root / "c/sub")
+    settle(root / "a", OLD_NS + 1)
+    settle(root / "b", OLD_NS + 1)
+    settle(root / "c", OLD_NS + 1)
+
+
+def assert_matches(project, expected):
+    assert [dataset.uri for dataset in project.datasets] == DATASETS
+    for dataset, expected_dataset in zip(project.datasets, expected.datasets):
+        assert list(dataset.filenames) == list(expected_dataset.filenames)
+        assert dataset.num_frames == expected_dataset.num_frames
+        assert dataset.cumulative_data_count == expected_dataset.cumulative_data_count
+    np.testing.assert_array_equal(project.cumulative_counts, expected.cumulative_counts)
+    # Global indices resolve through the patched cumulative counts
+    num_data_points = expected.datasets[-1].cumulative_data_count
+    uris = project.read_datasets(list(range(num_data_points)), just_uri=True)
+    assert uris == expected.read_datasets(list(range(num_data_points)), just_uri=True)
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_refresh_matches_browse(root, tmp_path, indexed):
+    directory_index = (
+        DirectoryIndex(str(root), str(tmp_path / "index.db")) if indexed else None
+    )
+    project = browse(root, directory_index)
+    # The cumulative counts are built before the refresh, and patched by it
+    counts = project.cumulative_counts.copy()
+    modify(root)
+    diffs = project.refresh(directory_index=directory_index)
+    assert diffs == [
+        DatasetDiff("a", ["new.tif"], ["1.tif"], 2 + 3 + 1),
+        DatasetDiff("b", ["new/8.tif"], [], 2 + 1 + 3),
+        DatasetDiff("c", [], ["sub/6.tif", "sub/deep/7.tif"], 4),
+    ]
+    assert not np.array_equal(project.cumulative_counts, counts)
+    assert_matches(project, browse(root))
+
+
+def test_unchanged_refresh(root, tmp_path):
+    directory_index = DirectoryIndex(str(root), str(tmp_path / "index.db"))
+    project = browse(root, directory_index)
+    counts = project.cumulative_counts.copy()
+    diffs = project.refresh(directory_index=directory_index)
+    assert [(diff.added, diff.removed) for diff in diffs] == [([], [])] * 3
+    np.testing.assert_array_equal(project.cumulative_counts, counts)
+    assert_matches(project, browse(root))
+
+
+def test_stack_rewritten_in_place(root, tmp_path):
+    directory_index = DirectoryIndex(str(root), str(tmp_path / "index.db"))
+    project = browse(root, directory_index)
+    project.cumulative_counts
+    # Rewriting a file does not change the modification time of its directory
+    write_stack(root / "b/stack.tif", 5, OLD_NS + 1)
+    settle(root / "b")
+    diffs = project.refresh(directory_index=directory_index)
+    assert diffs[1] == DatasetDiff("b", [], [], 5 + 1)
+    assert [diff.num_frames for diff in diffs] == [5, 6, 7]
+    assert_matches(project, browse(root))
@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE, ThumbnailCache
+from file_manager.dataset.thumbnail_encoder import ThumbnailEncoder
+
+
+@pytest.fixture
+def global_cache():
+    THUMBNAIL_CACHE.clear()
+    yield THUMBNAIL_CACHE
+    THUMBNAIL_CACHE.clear()
+
+
+def test_key_covers_processing_parameters():
+    args = ("data/a", 3, False, [0, 100], True, "base64")
+    key = ThumbnailCache.make_key(*args)
+    assert key == ThumbnailCache.make_key(
+        "data/a", np.int64(3), 0, (0, 100), 1, "base64"
+    )
+    variations = [
+        ThumbnailCache.make_key("data/b", *args[1:]),
+        ThumbnailCache.make_key("data/a", 4, *args[2:]),
+        ThumbnailCache.make_key(*args[:2], True, *args[3:]),
+        ThumbnailCache.make_key(*args[:3], [1, 99], *args[4:]),
+        ThumbnailCache.make_key(*args[:4], False, "base64"),
+        ThumbnailCache.make_key(*args[:5], "bytes"),
+        ThumbnailCache.make_key(*args, downsample=True),
+        ThumbnailCache.make_key(*args, encoder=ThumbnailEncoder("jpeg")),
+        ThumbnailCache.make_key(*args, version=(1, 2)),
+    ]
+    assert len({key, *variations}) == len(variations) + 1
+    assert ThumbnailCache.make_key(*args, version=(1, 2)) != ThumbnailCache.make_key(
+        *args, version=(1, 3)
+    )
+
+
+def test_lru_eviction():
+    cache = ThumbnailCache(max_bytes=30)
+    for key in "abc":
+        cache.put(key, key * 10)
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == "a" * 10
+    cache.put("d", "d" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a" * 10, "c" * 10, "d" * 10]
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 3
+    assert stats["bytes"] == 30
+    assert (stats["hits"], stats["misses"]) == (4, 1)
+
+
+def test_oversized_and_replaced_entries():
+    cache = ThumbnailCache(max_bytes=10)
+    cache.put("big", "x" * 11)
+    assert not cache.contains("big")
+    cache.put("a", "a" * 4)
+    cache.put("a", "a" * 6)
+    assert cache.stats()["bytes"] == 6
+    assert cache.stats()["evictions"] == 0
+
+
+def test_contains_does_not_count():
+    cache = ThumbnailCache(max_bytes=10)
+    cache.put("a", "a")
+    assert cache.contains("a")
+    assert not cache.contains("b")
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (0, 0)
+
+
+def test_pillow_entries_are_copied():
+    cache = ThumbnailCache(max_bytes=1000)
+    image = Image.new("L", (10, 10))
+    cache.put("a", image)
+    image.putpixel((0, 0), 255)
+    cached = cache.get("a")
+    assert cached.getpixel((0, 0)) == 0
+    cached.putpixel((0, 0), 255)
+    assert cache.get("a").getpixel((0, 0)) == 0
+    assert cache.stats()["bytes"] == 100
+
+
+def test_disk_spill(tmp_path):
+    cache = ThumbnailCache(max_bytes=10, spill_dir=str(tmp_path))
+    cache.put("a", "a" * 10)
+    cache.put("b", "b" * 10)
+    assert cache.contains("a")
+    assert cache.get("a") == "a" * 10
+    assert cache.stats()["disk_hits"] == 1
+    # The disk hit is promoted to memory, evicting "b" to disk
+    assert cache.get("b") == "b" * 10
+    assert cache.stats()["disk_hits"] == 2
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_rewritten_file_is_read_again(tmp_path, global_cache):
+    (tmp_path / "d").mkdir()
+    path = tmp_path / "d" / "a.png"
+    Image.fromarray(np.zeros((8, 8), dtype=np.uint8)).save(path)
+    dataset = FileDataset("d", 1, ["a.png"])
+    first, _ = dataset.read_data(str(tmp_path), [0], export="bytes")
+    assert dataset.read_data(str(tmp_path), [0], export="bytes")[0] == first
+    assert global_cache.stats()["hits"] == 1
+    image = np.zeros((8, 8), dtype=np.uint8)
+    image[0, 0] = 255
+    Image.fromarray(image).save(path)
+    os.utime(path, ns=(1, 1))
+    second, _ = dataset.read_data(str(tmp_path), [0], export="bytes")
+    assert second != first
+    assert global_cache.stats()["hits"] == 1
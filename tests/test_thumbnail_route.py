@@ -0,0 +1,131 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from flask import Flask
+from PIL import Image
+
+import file_manager.data_project as data_project
+import file_manager.dataset.filename_list as filename_list
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.filename_list import FilenameListRegistry
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE
+from file_manager.project_registry import ProjectRegistry
+from file_manager.thumbnail_route import (
+    THUMBNAIL_MAX_AGE,
+    register_thumbnail_route,
+    thumbnail_url,
+)
+
+NUM_IMAGES = 3
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ProjectRegistry(directory=str(tmp_path / "registry"))
+    monkeypatch.setattr(data_project, "PROJECT_REGISTRY", registry)
+    monkeypatch.setattr(
+        filename_list,
+        "FILENAME_LIST_REGISTRY",
+        FilenameListRegistry(directory=str(tmp_path / "filenames")),
+    )
+    THUMBNAIL_CACHE.clear()
+    yield registry
+    THUMBNAIL_CACHE.clear()
+
+
+@pytest.fixture
+def project_reference(tmp_path, registry):
+    (tmp_path / "d").mkdir()
+    for i in range(NUM_IMAGES):
+        image = np.full((8, 8), 40 * i, dtype=np.uint8)
+        image[0, 0] = 255
+        Image.fromarray(image).save(tmp_path / "d" / f"{i}.png")
+    project = DataProject(
+        str(tmp_path),
+        "file",
+        datasets=[
+            FileDataset("d", NUM_IMAGES, [f"{i}.png" for i in range(NUM_IMAGES)])
+        ],
+    )
+    return registry.put(project)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    register_thumbnail_route(app)
+    return app.test_client()
+
+
+def test_url(project_reference):
+    url = thumbnail_url(project_reference, 2)
+    assert url.endswith(f"/{project_reference['content_hash']}/2/thumb")
+    url = thumbnail_url(project_reference, 2, log=True, percentiles=[1, 99])
+    assert url.endswith("/thumb?log=1&percentiles=1%2C99")
+
+
+def test_thumbnail(client, project_reference):
+    response = client.get(thumbnail_url(project_reference, 1))
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.headers["Cache-Control"] == f"private, max-age={THUMBNAIL_MAX_AGE}"
+    assert response.headers["ETag"]
+    assert Image.open(io.BytesIO(response.data)).size == (200, 200)
+
+
+def test_not_modified(client, project_reference):
+    url = thumbnail_url(project_reference, 1)
+    etag = client.get(url).headers["ETag"]
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    other = client.get(url, headers={"If-None-Match": '"other"'})
+    assert other.status_code == 200
+
+
+def test_etag_covers_parameters(client, project_reference):
+    etags = {
+        client.get(thumbnail_url(project_reference, index, **kwargs)).headers["ETag"]
+        for index, kwargs in [
+            (0, {}),
+            (1, {}),
+            (1, {"log": True}),
+            (1, {"percentiles": [1, 99]}),
+            (1, {"downsample": True}),
+        ]
+    }
+    assert len(etags) == 5
+
+
+def test_modified_source(client, project_reference, tmp_path):
+    url = thumbnail_url(project_reference, 1)
+    response = client.get(url)
+    path = tmp_path / "d" / "1.png"
+    Image.fromarray(np.zeros((8, 8), dtype=np.uint8)).save(path)
+    os.utime(path, ns=(1, 1))
+    modified = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+    assert modified.status_code == 200
+    assert modified.headers["ETag"] != response.headers["ETag"]
+    assert modified.data != response.data
+
+
+def test_errors(client, project_reference):
+    assert client.get(thumbnail_url(project_reference, NUM_IMAGES)).status_code == 404
+    assert client.get(thumbnail_url({"content_hash": "unknown"}, 0)).status_code == 404
+    url = thumbnail_url(project_reference, 0)
+    assert client.get(f"{url}?percentiles=1").status_code == 400
+    assert client.get(f"{url}?downsample=x").status_code == 400
+
+
+def test_warm_page_is_served_from_cache(client, registry, project_reference):
+    project = DataProject.from_dict(project_reference)
+    project.read_datasets(list(range(NUM_IMAGES)), export="bytes", downsample=True)
+    misses = THUMBNAIL_CACHE.stats()["misses"]
+    for index in range(NUM_IMAGES):
+        url = thumbnail_url(project_reference, index, downsample=True)
+        assert client.get(url).status_code == 200
+    assert THUMBNAIL_CACHE.stats()["misses"] == misses
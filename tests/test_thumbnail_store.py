@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import file_manager.data_project as data_project
+import file_manager.dataset.dataset as dataset
+import file_manager.dataset.file_dataset as file_dataset
+from file_manager.data_project import DataProject
+from file_manager.dataset.file_dataset import FileDataset
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE
+from file_manager.dataset.thumbnail_encoder import ThumbnailEncoder
+from file_manager.dataset.thumbnail_store import ThumbnailStore
+
+NUM_IMAGES = 4
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ThumbnailStore(directory=str(tmp_path / "store"))
+    for module in (data_project, dataset, file_dataset):
+        monkeypatch.setattr(module, "THUMBNAIL_STORE", store)
+    THUMBNAIL_CACHE.clear()
+    yield store
+    THUMBNAIL_CACHE.clear()
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "d").mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(NUM_IMAGES):
+        image = (rng.random((120, 90)) * 255).astype(np.uint8)
+        Image.fromarray(image).save(tmp_path / "d" / f"{i}.png")
+    return DataProject(
+        str(tmp_path),
+        "file",
+        datasets=[
+            FileDataset("d", NUM_IMAGES, [f"{i}.png" for i in range(NUM_IMAGES)])
+        ],
+    )
+
+
+def test_key():
+    key = ThumbnailStore.make_key("data/a", 3, (1, 2))
+    assert key == ThumbnailStore.make_key("data/a", np.int64(3), (1, 2))
+    variations = [
+        ThumbnailStore.make_key("data/b", 3, (1, 2)),
+        ThumbnailStore.make_key("data/a", 4, (1, 2)),
+        ThumbnailStore.make_key("data/a", 3, (1, 3)),
+        ThumbnailStore.make_key("data/a", 3, (1, 2), downsample=True),
+        ThumbnailStore.make_key("data/a", 3, (1, 2), encoder=ThumbnailEncoder("jpeg")),
+    ]
+    assert len({key, *variations}) == len(variations) + 1
+
+
+def test_missing_and_put(tmp_path):
+    store = ThumbnailStore(directory=str(tmp_path))
+    keys = ["a", None, "b", "c"]
+    assert store.missing(keys) == [0, 2, 3]
+    store.put_many(["a", "c"], [b"a", b"c"])
+    assert store.missing(keys) == [2]
+    assert store.get_many(keys) == [b"a", None, None, b"c"]
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (2, 2, 2)
+
+
+def test_serves():
+    store = ThumbnailStore(directory="unused")
+    assert store.serves(False, True, "bytes", [0, 100])
+    assert store.serves(False, True, "base64", (0, 100))
+    assert not store.serves(True, True, "bytes", [0, 100])
+    assert not store.serves(False, False, "bytes", [0, 100])
+    assert not store.serves(False, True, "pillow", [0, 100])
+    assert not store.serves(False, True, "bytes", [1, 99])
+    assert not ThumbnailStore(directory=None).serves(False, True, "bytes", [0, 100])
+
+
+def test_level_encoders():
+    encoder = ThumbnailEncoder("jpeg", size=(100, 100))
+    assert ThumbnailStore(directory="unused").level_encoders(encoder) == [encoder]
+    levels = ThumbnailStore(directory="unused", levels=[50, 200]).level_encoders(
+        encoder
+    )
+    assert [level.size for level in levels] == [(200, 200), (50, 50)]
+    assert all(level.format == "jpeg" for level in levels)
+
+
+def test_build_and_read(store, project):
+    expected, _ = project.read_datasets(list(range(NUM_IMAGES)), export="bytes")
+    THUMBNAIL_CACHE.clear()
+    assert project.build_thumbnails() == NUM_IMAGES
+    assert project.build_thumbnails() == 0
+    stored, _ = project.read_datasets(list(range(NUM_IMAGES)), export="bytes")
+    assert stored == expected
+    assert store.stats()["hits"] == NUM_IMAGES
+
+
+def test_smaller_levels(store, project):
+    store.levels = [200, 50]
+    assert project.build_thumbnails() == 2 * NUM_IMAGES
+    small = DataProject(
+        project.root_uri,
+        "file",
+        datasets=project.datasets,
+        encoder=ThumbnailEncoder(size=(50, 50)),
+    )
+    images, _ = small.read_datasets([0], export="pillow")
+    assert images[0].size == (50, 50)
+    small.read_datasets([0], export="bytes")
+    assert store.stats()["hits"] == 1
+
+
+def test_changed_file_is_not_served(store, project, tmp_path):
+    project.build_thumbnails()
+    stored, _ = project.read_datasets([0], export="bytes")
+    path = tmp_path / "d" / "0.png"
+    Image.fromarray(np.zeros((120, 90), dtype=np.uint8)).save(path)
+    os.utime(path, ns=(1, 1))
+    THUMBNAIL_CACHE.clear()
+    changed, _ = project.read_datasets([0], export="bytes")
+    assert changed != stored
+    assert project.build_thumbnails() == 1
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+from tiled.adapters.array import ArrayAdapter
+from tiled.adapters.mapping import MapAdapter
+from tiled.client import Context, from_context
+from tiled.server.app import build_app
+
+import file_manager.dataset.tiled_dataset as tiled_dataset
+from file_manager.dataset.thumbnail_cache import THUMBNAIL_CACHE
+from file_manager.dataset.tiled_dataset import TiledDataset
+from file_manager.dataset.tiled_metadata_cache import TILED_METADATA_CACHE
+
+ROOT_URI = "http://local-tiled-app/api/v1/metadata/"
+
+
+@pytest.fixture
+def array():
+    return np.random.default_rng(0).random((3, 16, 16))
+
+
+@pytest.fixture
+def tiled_client(array, monkeypatch):
+    monkeypatch.setenv("TILED_SINGLE_USER_API_KEY", "secret")
+    context = Context.from_app(
+        build_app(MapAdapter({"stack": ArrayAdapter.from_array(array)}))
+    )
+    TILED_METADATA_CACHE.invalidate()
+    THUMBNAIL_CACHE.clear()
+    yield from_context(context)
+    TILED_METADATA_CACHE.invalidate()
+    THUMBNAIL_CACHE.clear()
+    context.close()
+
+
+def test_version_expires(tiled_client, array, monkeypatch):
+    dataset = TiledDataset("stack", 3)
+    version = dataset.source_versions([0, 1], tiled_client)
+    assert version[0] == version[1]
+
+    def read():
+        images, _ = dataset.read_data(
+            ROOT_URI, [0], export="bytes", tiled_client=tiled_client
+        )
+        return images[0]
+
+    image = read()
+    # Rewriting the array in place does not change its metadata
+    array[0] = array[0][::-1]
+    assert dataset.source_versions([0], tiled_client)[0] == version[0]
+    assert read() == image
+    now = time.time() + tiled_dataset.TILED_VERSION_TTL
+    monkeypatch.setattr(time, "time", lambda: now)
+    assert dataset.source_versions([0], tiled_client)[0] != version[0]
+    assert read() != image